@@ -0,0 +1,114 @@
+"""
+Synthetic ledgers for the benchmark suite.
+
+    python -m benchmarks.generate transactions 100000 --headers ar --out benchmarks/data/tx.csv
+    python -m benchmarks.generate pnl 1000 --headers en --out benchmarks/data/pnl.xlsx
+
+Output is deterministic for a given (kind, rows, headers, seed).
+"""
+import os
+import argparse
+
+import numpy as np
+import pandas as pd
+
+XLSX_MAX_ROWS = 1_048_575 # sheet limit minus the header row
+
+HEADERS = {
+    "transactions": {
+        "en": {"date": "Date", "amount": "Amount", "type": "Type", "category": "Category"},
+        "ar": {"date": "التاريخ", "amount": "المبلغ", "type": "النوع", "category": "التصنيف"},
+    },
+    "pnl": {
+        "en": {"month": "Month", "revenue": "Revenue", "expenses": "Expenses"},
+        "ar": {"month": "الشهر", "revenue": "الإيرادات", "expenses": "المصروفات"},
+    },
+}
+
+# Every spelling the parser accepts, in the casing and padding seen in real exports
+INCOME_TYPES = ["income", "Income", "REVENUE", "credit", " cr ", "دخل", "إيرادات", "ايداع"]
+EXPENSE_TYPES = ["expense", "Expense", "cost", "DEBIT", "dr", "مصروف", "مصروفات", "سحب"]
+CATEGORIES = ["رواتب", "إيجار", "تسويق", "مرافق", "برمجيات", "سفر", "Salaries", "Rent", "Marketing", "Utilities"]
+
+# Amount cell formats: plain numbers, then the currency strings clean_currency strips
+AMOUNT_FORMATS = [
+    lambda v: f"{v:.2f}",
+    lambda v: f"{v:,.2f}",
+    lambda v: f"${v:,.2f}",
+    lambda v: f"{v:,.0f} ر.س",
+    lambda v: f"€{v:.2f}",
+    lambda v: f"{v:.2f} SAT",
+]
+
+def _format_amounts(rng: np.random.Generator, values: np.ndarray) -> np.ndarray:
+    """Formats each value with a random currency style. Values repeat a lot, so each distinct pair is formatted once."""
+    styles = rng.integers(0, len(AMOUNT_FORMATS), len(values))
+    pairs = pd.DataFrame({"value": values, "style": styles})
+    codes, uniques = pd.factorize(pd.MultiIndex.from_frame(pairs))
+    formatted = np.array([AMOUNT_FORMATS[style](value) for value, style in uniques], dtype=object)
+    return formatted[codes]
+
+def transactions(rows: int, headers: str = "en", seed: int = 0) -> pd.DataFrame:
+    """Two years of daily ledger lines: roughly 35% income, amounts rounded to whole riyals, mixed formats and type spellings."""
+    rng = np.random.default_rng(seed)
+    dates = pd.Timestamp("2023-01-01") + pd.to_timedelta(rng.integers(0, 730, rows), unit="D")
+    is_income = rng.random(rows) < 0.35
+    amounts = np.where(is_income, rng.lognormal(8.5, 0.8, rows), rng.lognormal(7.5, 1.0, rows)).round(0)
+    types = np.where(
+        is_income,
+        np.array(INCOME_TYPES, dtype=object)[rng.integers(0, len(INCOME_TYPES), rows)],
+        np.array(EXPENSE_TYPES, dtype=object)[rng.integers(0, len(EXPENSE_TYPES), rows)],
+    )
+    df = pd.DataFrame({
+        "date": dates.strftime("%Y-%m-%d"),
+        "amount": _format_amounts(rng, amounts),
+        "type": types,
+        "category": np.array(CATEGORIES, dtype=object)[rng.integers(0, len(CATEGORIES), rows)],
+    })
+    return df.rename(columns=HEADERS["transactions"][headers])
+
+def pnl(rows: int, headers: str = "en", seed: int = 0) -> pd.DataFrame:
+    """Consecutive monthly P&L lines from 2000-01; beyond 25 years the months repeat (one block per business unit)."""
+    rng = np.random.default_rng(seed)
+    months = pd.period_range("2000-01", periods=300, freq="M")[np.arange(rows) % 300]
+    revenue = rng.normal(250_000, 40_000, rows).round(0)
+    expenses = (revenue * rng.uniform(0.6, 1.05, rows)).round(0)
+    df = pd.DataFrame({
+        # Alternate the two month spellings parse_pnl accepts
+        "month": np.where(np.arange(rows) % 2 == 0, months.strftime("%Y-%m"), months.strftime("%b %Y")),
+        "revenue": _format_amounts(rng, revenue),
+        "expenses": _format_amounts(rng, expenses),
+    })
+    return df.rename(columns=HEADERS["pnl"][headers])
+
+GENERATORS = {"transactions": transactions, "pnl": pnl}
+
+def write(df: pd.DataFrame, path: str):
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    if path.endswith(".csv"):
+        df.to_csv(path, index=False, encoding="utf-8-sig")
+    elif path.endswith(".xlsx"):
+        if len(df) > XLSX_MAX_ROWS:
+            raise ValueError(f"XLSX sheets hold at most {XLSX_MAX_ROWS} rows")
+        df.to_excel(path, index=False)
+    else:
+        raise ValueError("output must end in .csv or .xlsx")
+
+def generate(kind: str, rows: int, path: str, headers: str = "en", seed: int = 0) -> str:
+    write(GENERATORS[kind](rows, headers, seed), path)
+    return path
+
+def main():
+    parser = argparse.ArgumentParser(description="Generate a synthetic ledger for benchmarking.")
+    parser.add_argument("kind", choices=sorted(GENERATORS))
+    parser.add_argument("rows", type=int)
+    parser.add_argument("--headers", choices=["en", "ar"], default="en")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="path ending in .csv or .xlsx")
+    args = parser.parse_args()
+    print(generate(args.kind, args.rows, args.out, args.headers, args.seed))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,361 @@
+"""
+Benchmark harness for the analysis pipeline.
+
+    python -m benchmarks.run                       # quick suite, compared against baseline.json
+    python -m benchmarks.run --suite full          # adds the 5M-row CSV and 1M-row XLSX cases
+    python -m benchmarks.run --cases 100k --repeat 5
+    python -m benchmarks.run --update-baseline     # record the current numbers as the new baseline
+
+Each (case, stage) runs in a fresh process, so the stages do not share caches or heap.
+For every stage it records the best wall time over --repeat runs, the peak RSS growth of the first run
+and rows per second. Stages that produce analysis output also record a hash of it.
+The run fails (exit status 1) when a stage is slower or larger than the baseline by more than --tolerance,
+or when its output hash changed.
+"""
+import os
+import sys
+import json
+import time
+import hashlib
+import argparse
+import platform
+import contextlib
+from concurrent.futures import ProcessPoolExecutor
+import multiprocessing
+from typing import Any, Dict, List, NamedTuple, Optional
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+SERVER_DIR = os.path.dirname(BENCH_DIR)
+DATA_DIR = os.path.join(BENCH_DIR, "data")
+BASELINE_PATH = os.path.join(BENCH_DIR, "baseline.json")
+
+# Differences below these are noise, whatever the ratio
+MIN_WALL_DELTA = 0.05 # seconds
+MIN_MEMORY_DELTA = 16 # MB
+
+# Stages whose cost scales with the row count; the others report no throughput
+ROW_STAGES = {"read", "read_openpyxl", "parse", "aggregate", "kpis", "stream"}
+
+class Case(NamedTuple):
+    kind: str # transactions | pnl
+    headers: str # en | ar
+    fmt: str # csv | xlsx
+    rows: int
+
+    @property
+    def name(self) -> str:
+        size = f"{self.rows // 1_000_000}m" if self.rows % 1_000_000 == 0 else f"{self.rows // 1000}k"
+        return f"{self.kind}_{self.headers}_{size}.{self.fmt}"
+
+    @property
+    def path(self) -> str:
+        return os.path.join(DATA_DIR, self.name)
+
+    @property
+    def stages(self) -> List[str]:
+        stages = ["read", "detect_schema", "parse", "kpis"]
+        if self.fmt == "xlsx":
+            # The same read without python-calamine, to compare the Excel engines
+            stages.insert(1, "read_openpyxl")
+        if self.kind == "transactions":
+            stages.insert(stages.index("kpis"), "aggregate")
+            if self.fmt == "csv":
+                stages.append("stream")
+        return stages + ["report"]
+
+QUICK = [
+    Case("transactions", "en", "csv", 1_000),
+    Case("transactions", "en", "csv", 10_000),
+    Case("transactions", "ar", "csv", 100_000),
+    Case("transactions", "en", "csv", 1_000_000),
+    Case("transactions", "ar", "xlsx", 10_000),
+    Case("transactions", "ar", "xlsx", 50_000),
+    Case("pnl", "ar", "csv", 1_000),
+    Case("pnl", "en", "csv", 100_000),
+    Case("pnl", "en", "xlsx", 1_000),
+]
+SUITES = {
+    "quick": QUICK,
+    "full": QUICK + [
+        Case("transactions", "en", "csv", 5_000_000),
+        Case("transactions", "en", "xlsx", 1_000_000),
+    ],
+}
+
+def ensure_data(case: Case) -> str:
+    if not os.path.exists(case.path):
+        from benchmarks.generate import generate
+
+        print(f"Generating {case.name} ...", flush=True)
+        generate(case.kind, case.rows, case.path, case.headers)
+    return case.path
+
+# ---------------------------------------------------------------------------
+# Child process side
+# ---------------------------------------------------------------------------
+
+def _proc_status_kb(field: str) -> Optional[int]:
+    try:
+        with open("/proc/self/status") as f:
+            for line in f:
+                if line.startswith(field + ":"):
+                    return int(line.split()[1])
+    except OSError:
+        pass
+    return None
+
+def _reset_peak() -> bool:
+    """Resets the peak RSS counter (Linux only)."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def _peak_rss_mb() -> float:
+    hwm = _proc_status_kb("VmHWM")
+    if hwm is not None:
+        return hwm / 1024
+    import resource
+
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (1024 * 1024) if sys.platform == "darwin" else peak / 1024
+
+def _current_rss_mb() -> float:
+    rss = _proc_status_kb("VmRSS")
+    return rss / 1024 if rss is not None else _peak_rss_mb()
+
+def _json_default(value: Any) -> Any:
+    # DataFrames / Series (the aggregate stage) in full; str() would truncate them
+    return json.loads(value.to_json()) if hasattr(value, "to_json") else str(value)
+
+def _result_hash(value: Any) -> str:
+    canonical = json.dumps(value, ensure_ascii=False, sort_keys=True, default=_json_default)
+    return hashlib.sha256(canonical.encode("utf-8")).hexdigest()[:16]
+
+def _stage_runner(case: Case, stage_name: str):
+    """
+    Returns (setup, run) or (setup, run, teardown) for a stage.
+    setup() builds fresh inputs for each run; neither it nor teardown() is timed.
+    """
+    import pandas as pd
+    import main
+    from utils import excel
+    from utils.excel import read_excel
+
+    def read():
+        if case.fmt == "csv":
+            return pd.read_csv(case.path, **main.sniff_upload(case.path).read_options())
+        return read_excel(case.path, case.name, select_columns=lambda columns: list(columns))
+
+    if stage_name == "read":
+        return lambda: None, lambda _: read()
+    if stage_name == "read_openpyxl":
+        excel.HAS_CALAMINE = False # this process only: excel_engine() now picks openpyxl
+        return lambda: None, lambda _: read()
+    if stage_name == "detect_schema":
+        frame = read()
+        return lambda: frame, main.detect_schema
+    if stage_name == "parse":
+        return lambda: None, lambda _: main.parse_data(case.path, case.name)
+
+    df, schema = main.parse_data(case.path, case.name)
+    calculate = main.calculate_pnl_results if schema == "pnl" else main.calculate_kpis
+    if stage_name == "kpis":
+        return df.copy, calculate
+    if stage_name == "aggregate":
+        # The monthly / per-category groupby alone, without the anomaly scan and risk rules
+        return df.copy, main.aggregate_transactions
+    if stage_name == "stream":
+        def stream(_):
+            monthly, category_expenses = main.stream_transactions_csv(case.path)[:2]
+            return main.analyze_monthly(monthly, category_expenses)
+        return lambda: None, stream
+    if stage_name == "report":
+        return _report_runner(main, schema, calculate(df.copy()))
+    raise ValueError(f"unknown stage {stage_name}")
+
+def _report_runner(main, schema: str, results: Dict[str, Any]):
+    """
+    Times generate_pdf through the warm page pool, as the API renders a report: template, Chromium print, store.
+    The pool is started once beforehand; the cached PDF is dropped before each run so every run renders.
+    Needs Chromium (python -m playwright install chromium).
+    """
+    import asyncio
+    import tempfile
+    from utils import pdf
+    from utils.storage import LocalReportStore
+
+    response = {
+        "summary": main.draft_summary(schema, results),
+        "kpis": results["kpis"],
+        "risks": results["risks"],
+        "recommendations": results["recommendations"],
+        "anomalies": results.get("anomalies", []),
+    }
+    context = main.report_context(response)
+    # Keep the rendered files out of server/reports
+    pdf.report_cache.store = LocalReportStore(tempfile.mkdtemp(prefix="bench-reports-"))
+    loop = asyncio.new_event_loop()
+    loop.run_until_complete(pdf.renderer.start()) # raises when Chromium is unavailable: no subprocess fallback here
+
+    def setup():
+        pdf.report_cache.store.delete(pdf.report_cache.filename_for(pdf.report_key(context)))
+        return context
+
+    def teardown():
+        loop.run_until_complete(pdf.renderer.stop())
+        loop.close()
+
+    return setup, lambda data: loop.run_until_complete(pdf.generate_pdf(data)), teardown
+
+def measure(case: Case, stage_name: str, repeat: int) -> Dict[str, Any]:
+    """Runs in a fresh process: best wall time over `repeat` runs and peak RSS growth of the first run."""
+    os.chdir(SERVER_DIR)
+    sys.path.insert(0, SERVER_DIR)
+    os.environ.setdefault("RATE_LIMIT_BACKEND", "memory")
+    if stage_name != "report":
+        # Only the report stage renders; the others need not have the report fonts installed
+        os.environ.setdefault("REPORT_FONTS_REQUIRED", "0")
+
+    # The server's own logging would interleave with the results table
+    with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+        return _measure(case, stage_name, repeat)
+
+def _measure(case: Case, stage_name: str, repeat: int) -> Dict[str, Any]:
+    setup, run, *teardown = _stage_runner(case, stage_name)
+    walls = []
+    peak_mb = None
+    output = None
+    try:
+        for attempt in range(max(1, repeat)):
+            data = setup()
+            if attempt == 0:
+                exact = _reset_peak()
+                base_mb = _current_rss_mb()
+            start = time.perf_counter()
+            output = run(data)
+            walls.append(time.perf_counter() - start)
+            if attempt == 0:
+                peak_mb = max(0.0, _peak_rss_mb() - base_mb) if exact else None
+            del data
+    finally:
+        for done in teardown:
+            done()
+
+    wall = min(walls)
+    result = {
+        "wall_s": round(wall, 4),
+        "peak_mb": round(peak_mb, 1) if peak_mb is not None else None,
+        "rows_per_s": round(case.rows / wall) if wall > 0 and stage_name in ROW_STAGES else None,
+    }
+    if stage_name in ("aggregate", "kpis", "stream"):
+        result["result"] = _result_hash(output)
+    return result
+
+# ---------------------------------------------------------------------------
+# Parent side
+# ---------------------------------------------------------------------------
+
+def run_stage(case: Case, stage_name: str, repeat: int) -> Dict[str, Any]:
+    with ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context("spawn")) as executor:
+        return executor.submit(measure, case, stage_name, repeat).result()
+
+def compare(key: str, current: Dict[str, Any], baseline: Optional[Dict[str, Any]], tolerance: float) -> List[str]:
+    if baseline is None:
+        return []
+    problems = []
+    base_wall, wall = baseline.get("wall_s"), current["wall_s"]
+    if base_wall and wall > base_wall * (1 + tolerance) and wall - base_wall > MIN_WALL_DELTA:
+        problems.append(f"{key}: wall {wall:.3f}s vs baseline {base_wall:.3f}s (+{(wall / base_wall - 1) * 100:.0f}%)")
+    base_mem, mem = baseline.get("peak_mb"), current.get("peak_mb")
+    if base_mem is not None and mem is not None and mem > base_mem * (1 + tolerance) and mem - base_mem > MIN_MEMORY_DELTA:
+        problems.append(f"{key}: peak memory {mem:.0f}MB vs baseline {base_mem:.0f}MB")
+    if "result" in baseline and current.get("result") != baseline["result"]:
+        problems.append(f"{key}: output changed ({current.get('result')} vs baseline {baseline['result']})")
+    return problems
+
+def environment() -> Dict[str, str]:
+    import numpy
+    import pandas
+
+    return {
+        "python": platform.python_version(),
+        "pandas": pandas.__version__,
+        "numpy": numpy.__version__,
+        "machine": f"{platform.system()} {platform.machine()}, {os.cpu_count()} CPUs",
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the analysis pipeline against a stored baseline.")
+    parser.add_argument("--suite", choices=sorted(SUITES), default="quick")
+    parser.add_argument("--cases", help="only run cases whose name contains this text")
+    parser.add_argument("--stages", help="comma-separated stages to run (default: all)")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--tolerance", type=float, default=0.3, help="allowed slowdown / growth ratio (0.3 = 30%%)")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--update-baseline", action="store_true")
+    parser.add_argument("--output", help="also write the results to this JSON file")
+    args = parser.parse_args()
+
+    cases = [c for c in SUITES[args.suite] if not args.cases or args.cases in c.name]
+    only_stages = set(args.stages.split(",")) if args.stages else None
+
+    baseline: Dict[str, Any] = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)
+    baseline_results = baseline.get("results", {})
+
+    for case in cases:
+        ensure_data(case)
+
+    results: Dict[str, Dict[str, Any]] = {}
+    problems: List[str] = []
+    print(f"{'case / stage':<44} {'wall':>9} {'peak MB':>8} {'rows/s':>12}  baseline")
+    for case in cases:
+        for stage_name in case.stages:
+            if only_stages and stage_name not in only_stages:
+                continue
+            key = f"{case.name}/{stage_name}"
+            try:
+                current = run_stage(case, stage_name, args.repeat)
+            except Exception as e:
+                # e.g. the report stage without Chromium; the other stages still run
+                problems.append(f"{key}: failed ({type(e).__name__}: {str(e).splitlines()[0] if str(e) else ''})")
+                print(f"{key:<44} {'failed':>9}", flush=True)
+                continue
+            results[key] = current
+            base = baseline_results.get(key)
+            stage_problems = compare(key, current, base, args.tolerance)
+            problems.extend(stage_problems)
+
+            base_note = f"{base['wall_s']:.3f}s" if base else "-"
+            if stage_problems:
+                base_note += "  REGRESSION"
+            peak = f"{current['peak_mb']:.0f}" if current["peak_mb"] is not None else "?"
+            rate = f"{current['rows_per_s']:,}" if current["rows_per_s"] else "-"
+            print(f"{key:<44} {current['wall_s']:>8.3f}s {peak:>8} {rate:>12}  {base_note}", flush=True)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": results}, f, indent=2)
+
+    if args.update_baseline:
+        baseline_results.update(results)
+        with open(args.baseline, "w", encoding="utf-8") as f:
+            json.dump({"environment": environment(), "results": dict(sorted(baseline_results.items()))}, f, indent=2)
+            f.write("\n")
+        print(f"Baseline updated: {args.baseline}")
+        return
+
+    if problems:
+        print("\nRegressions against baseline:")
+        for problem in problems:
+            print(f"  {problem}")
+        sys.exit(1)
+    print("\nNo regressions." if baseline_results else "\nNo baseline yet; run with --update-baseline to record one.")
+
+if __name__ == "__main__":
+    main()
@@ -1,20 +1,48 @@
 from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.responses import FileResponse, JSONResponse
-from typing import Optional, List, Dict, Any
+from fastapi.responses import PlainTextResponse, Response, StreamingResponse
+from typing import Optional, List, Dict, Any, Tuple, Callable, Iterable
 import pandas as pd
 import numpy as np
-import io
 import math
 import os
-import json
-from datetime import datetime
-from utils.pdf import generate_pdf
+import re
+import hashlib
+import tempfile
+import zipfile
+import asyncio
+import time
+from contextlib import asynccontextmanager
 from dotenv import load_dotenv
 
 load_dotenv()
 
-app = FastAPI()
+from utils.pdf import generate_pdf, generate_pdfs, start_renderer, stop_renderer, renderer, report_cache
+from utils.storage import parse_range, etag_matches
+from utils.cache import TTLCache, content_hash
+from utils.workers import analysis_pool, PoolSaturated
+from utils.timing import stage, log_event, new_request_id, request_id_var
+from utils.metrics import registry, observe_timings, request_seconds, upload_bytes, rows_analyzed
+from utils.excel import read_excel
+from utils.columnar import HAS_PYARROW, read_csv_columns, iter_csv_columns
+from utils.rate_limit import create_rate_limiter
+from utils.jobs import jobs, Job
+from utils.aggregates import aggregate_store, SchemaMismatch
+from utils.schema import match_columns
+from utils.analytics import analyze_monthly
+from utils.anomalies import scan_transactions, merge_scans
+from utils.dates import parse_dates
+from utils.sniff import CsvDialect, sniff_csv
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    analysis_pool.start()
+    await start_renderer()
+    yield
+    await stop_renderer()
+    analysis_pool.shutdown()
+
+app = FastAPI(lifespan=lifespan)
 
 origins = [
     "http://localhost:5173",
@@ -28,164 +56,129 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID"],
 )
 
-MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB limit
+@app.middleware("http")
+async def request_context(request: Request, call_next):
+    """Tags the request (and the logs and jobs it starts) with a request id and records its latency."""
+    request_id = new_request_id(request.headers.get("x-request-id"))
+    token = request_id_var.set(request_id)
+    start = time.perf_counter()
+    status = 500
+    try:
+        response = await call_next(request)
+        status = response.status_code
+        response.headers["X-Request-ID"] = request_id
+        return response
+    finally:
+        route = getattr(request.scope.get("route"), "path", "unmatched")
+        request_seconds.observe(time.perf_counter() - start, method=request.method, route=route, status=status)
+        request_id_var.reset(token)
 
-# Rate Limiting Logic
-USAGE_FILE = "data/usage.json"
+MAX_FILE_SIZE = 10 * 1024 * 1024  # 10 MB limit (Excel)
+MAX_CSV_SIZE = int(os.getenv("MAX_CSV_SIZE_MB", "500")) * 1024 * 1024
+# CSV ledgers above this size are read in chunks and folded into monthly aggregates
+CSV_STREAM_THRESHOLD = int(os.getenv("CSV_STREAM_THRESHOLD_MB", "10")) * 1024 * 1024
+CSV_CHUNK_ROWS = int(os.getenv("CSV_CHUNK_ROWS", "200000"))
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+SUPPORTED_EXTENSIONS = ["csv", "xlsx", "xls"]
+# /api/batch: files per batch (ZIP members included) and total bytes received / extracted
+BATCH_MAX_FILES = int(os.getenv("BATCH_MAX_FILES", "50"))
+BATCH_MAX_TOTAL = int(os.getenv("BATCH_MAX_TOTAL_MB", "500")) * 1024 * 1024
+# pandas: pd.read_csv. arrow: transaction CSVs are read with the Arrow CSV reader, mapped columns only,
+# dictionary-encoded (pandas Categoricals); falls back to pandas for anything Arrow rejects.
+DATAFRAME_ENGINE = os.getenv("DATAFRAME_ENGINE", "pandas")
+USE_ARROW = DATAFRAME_ENGINE == "arrow" and HAS_PYARROW
+# serial: wait for the LLM rewrite, then render the PDF once.
+# budgeted: render the deterministic draft while the LLM runs; use the rewrite only if it arrives within LLM_DEADLINE seconds.
+NARRATIVE_MODE = os.getenv("NARRATIVE_MODE", "serial")
+LLM_DEADLINE = float(os.getenv("LLM_DEADLINE", "8"))
 
-def get_usage_data():
-    if not os.path.exists(USAGE_FILE):
-        return {}
-    try:
-        with open(USAGE_FILE, 'r') as f:
-            return json.load(f)
-    except:
-        return {}
+# Memoized /api/analyze responses, keyed on the upload bytes + concern
+analysis_cache = TTLCache(
+    max_entries=int(os.getenv("ANALYSIS_CACHE_SIZE", "256")),
+    ttl=float(os.getenv("ANALYSIS_CACHE_TTL", "3600")),
+    disk_dir=os.getenv("ANALYSIS_CACHE_DIR") or None,
+)
+
+# Rate Limiting
+rate_limiter = create_rate_limiter()
+
+# Currency symbols and thousands separators stripped from amount cells, by decimal separator
+CURRENCY_PATTERNS = {
+    '.': re.compile(r"SAT|ر\.س|[$€£,]"),
+    ',': re.compile(r"SAT|ر\.س|[$€£.]"),
+}
+
+# Mapped columns holding money: the only ones read as numbers from a CSV
+AMOUNT_FIELDS = ('amount', 'revenue', 'expenses')
+
+# Income / expense synonyms for the transactions 'type' column (lower cased)
+TYPE_SYNONYMS = {
+    **{t: 'income' for t in ['income', 'revenue', 'credit', 'cr', 'دخل', 'ايرادات', 'إيرادات', 'ايداع']},
+    **{t: 'expense' for t in ['expense', 'cost', 'debit', 'dr', 'مصروف', 'مصروفات', 'سحب']},
+}
 
-def save_usage_data(data):
+def _to_float(x: str) -> float:
     try:
-        os.makedirs(os.path.dirname(USAGE_FILE), exist_ok=True)
-        with open(USAGE_FILE, 'w') as f:
-            json.dump(data, f)
-    except Exception as e:
-        print(f"Error saving usage data: {e}")
+        return float(x)
+    except ValueError:
+        return np.nan
 
-def check_rate_limit(ip: str, is_demo: bool = False) -> bool:
-    data = get_usage_data()
-    record = data.get(ip, {})
-    
-    # Handle legacy format where value was string
-    if isinstance(record, str):
-        record = {} # Reset if old format
-        
-    if is_demo:
-        count = record.get("demo_count", 0)
-        if count >= 2:
-            return False # Demo limit reached
-    else:
-        count = record.get("upload_count", 0)
-        last_date = record.get("last_upload_date")
-        today = datetime.now().strftime("%Y-%m-%d")
-        
-        # Reset count if it's a new day
-        if last_date != today:
-            return True
-        
-        if count >= 1:
-            return False # Upload limit reached
-            
-    return True
+def clean_currency(values: pd.Series, decimal: str = '.') -> pd.Series:
+    """Parses amount cells into floats; unparseable cells become NaN. decimal is '.' (1,234.50) or ',' (1.234,50)."""
+    if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+        return values
 
-def record_usage(ip: str, is_demo: bool = False):
-    data = get_usage_data()
-    record = data.get(ip, {})
-    
-    # Handle legacy format
-    if isinstance(record, str):
-        record = {}
-        
-    if is_demo:
-        record["demo_count"] = record.get("demo_count", 0) + 1
-    else:
-        today = datetime.now().strftime("%Y-%m-%d")
-        last_date = record.get("last_upload_date")
-        
-        # Reset count if new day
-        if last_date != today:
-            record["upload_count"] = 1
-            record["last_upload_date"] = today
-        else:
-            record["upload_count"] = record.get("upload_count", 0) + 1
-            record["last_upload_date"] = today
-        
-    data[ip] = record
-    save_usage_data(data)
-
-def normalize_columns(df: pd.DataFrame) -> pd.DataFrame:
-    """Normalize column names to standard keys: date, amount, type, category."""
-    # Map of standard keys to possible synonyms (lower cased)
-    column_map = {
-        'date': ['date', 'datetime', 'timestamp', 'التاريخ', 'الوقت', 'day'],
-        'amount': ['amount', 'value', 'cost', 'price', 'المبلغ', 'القيمة', 'السعر', 'total'],
-        'type': ['type', 'kind', 'direction', 'النوع', 'الحالة', 'category_type'],
-        'category': ['category', 'cat', 'description', 'desc', 'الفئة', 'التصنيف', 'البند']
-    }
-    
-    # Create a mapping dictionary for renaming
-    rename_dict = {}
-    existing_cols = [c.lower().strip() for c in df.columns]
-    
-    # Helper to find first match
-    for std_col, synonyms in column_map.items():
-        for col in df.columns:
-            clean_col = col.lower().strip()
-            if clean_col in synonyms:
-                rename_dict[col] = std_col
-                break 
-    
-    # Apply renaming
-    df = df.rename(columns=rename_dict)
-    
-    return df
+    # Ledgers repeat the same amounts a lot, so each distinct cell is cleaned once
+    codes, uniques = pd.factorize(values)
+    if len(uniques) == 0:
+        return pd.Series(np.nan, index=values.index)
 
-    return df
+    cleaned = pd.Series(uniques).astype(str).str.replace(CURRENCY_PATTERNS[decimal], '', regex=True).str.strip()
+    if decimal != '.':
+        cleaned = cleaned.str.replace(decimal, '.', regex=False)
+    parsed = pd.to_numeric(cleaned, errors='coerce')
 
-def clean_currency(x):
-    if isinstance(x, (int, float)):
-        return x
-    if isinstance(x, str):
-        # Remove currency symbols, commas, spaces, LTR/RTL marks
-        clean_str = x.replace('$', '').replace('€', '').replace('£', '').replace('SAT', '').replace('ر.س', '').replace(',', '').strip()
-        try:
-            return float(clean_str)
-        except ValueError:
-            return np.nan
-    return np.nan
+    # float() also accepts forms to_numeric rejects (Arabic-Indic digits, 1_000); retry only those
+    retry = parsed.isna()
+    if retry.any():
+        parsed[retry] = cleaned[retry].map(_to_float)
+
+    parsed = parsed.to_numpy(dtype=float)
+    return pd.Series(np.where(codes >= 0, parsed[codes], np.nan), index=values.index)
+
+def date_signature(column_map: Dict[str, str], field: str) -> tuple:
+    """Format-cache key for a date column: the mapped headers of the file plus the field parsed."""
+    return (field, *column_map)
+
+def categorize_types(types: pd.Series) -> pd.Series:
+    """Maps raw 'type' cells to 'income', 'expense' or 'unknown'."""
+    codes, uniques = pd.factorize(types)
+    labels = pd.Series(uniques, dtype=object).astype(str).str.lower().str.strip().map(TYPE_SYNONYMS).fillna('unknown')
+    labels = np.append(labels.to_numpy(dtype=object), 'unknown') # NaN cells (code -1) land on the trailing 'unknown'
+    return pd.Series(labels[codes], index=types.index)
 
 def detect_schema(df: pd.DataFrame) -> str:
     """
     Detects if the dataframe is 'transactions' or 'pnl'.
     """
-    cols = [c.lower().strip() for c in df.columns]
-    
-    # P&L keywords
-    month_keywords = ['month', 'period', 'الشهر', 'شهر', 'الفترة']
-    rev_keywords = ['revenue', 'sales', 'income', 'الإيرادات', 'المبيعات', 'الدخل', 'rev']
-    exp_keywords = ['expenses', 'opex', 'costs', 'cost', 'المصروفات', 'التكاليف', 'المصاريف', 'exp']
-    
-    has_month = any(k in c for c in cols for k in month_keywords)
-    has_rev = any(k in c for c in cols for k in rev_keywords)
-    has_exp = any(k in c for c in cols for k in exp_keywords)
-    
-    if has_month and has_rev and has_exp:
-        return 'pnl'
-        
-    return 'transactions'
+    return match_columns(df.columns).analysis
 
-def parse_pnl(df: pd.DataFrame) -> pd.DataFrame:
+def mapped_columns(columns) -> List[str]:
+    """Original column names the parser will actually use, decided from the header alone."""
+    return list(match_columns(columns).columns)
+
+def parse_pnl(df: pd.DataFrame, column_map: Optional[Dict[str, str]] = None, decimal: str = '.') -> pd.DataFrame:
     """
     Parses P&L format: Month, Revenue, Expenses
     Returns DF with checks.
     """
     # Normalize P&L columns
-    rename_map = {}
-    
-    month_keywords = ['month', 'period', 'الشهر', 'شهر', 'الفترة']
-    rev_keywords = ['revenue', 'sales', 'income', 'الإيرادات', 'المبيعات', 'الدخل', 'rev']
-    exp_keywords = ['expenses', 'opex', 'costs', 'cost', 'المصروفات', 'التكاليف', 'المصاريف', 'exp']
-    
-    for col in df.columns:
-        c_lower = col.lower().strip()
-        if any(k in c_lower for k in month_keywords) and 'month' not in rename_map.values():
-            rename_map[col] = 'month'
-        elif any(k in c_lower for k in rev_keywords) and 'revenue' not in rename_map.values():
-            rename_map[col] = 'revenue'
-        elif any(k in c_lower for k in exp_keywords) and 'expenses' not in rename_map.values():
-            rename_map[col] = 'expenses'
-            
-    df = df.rename(columns=rename_map)
+    if column_map is None:
+        column_map = match_columns(df.columns).columns
+    df = df.rename(columns=column_map)
     
     req = ['month', 'revenue', 'expenses']
     missing = [c for c in req if c not in df.columns]
@@ -193,23 +186,11 @@ def parse_pnl(df: pd.DataFrame) -> pd.DataFrame:
         raise HTTPException(status_code=400, detail=f"ملف قائمة الدخل ناقص. لا يوجد أعمدة: {', '.join(missing)}")
         
     # Clean Numbers
-    df['revenue'] = df['revenue'].apply(clean_currency)
-    df['expenses'] = df['expenses'].apply(clean_currency)
+    df['revenue'] = clean_currency(df['revenue'], decimal)
+    df['expenses'] = clean_currency(df['expenses'], decimal)
     
-    # Clean Date (Date parsing is tricky for 'Jan-24', 'فبراير 2024')
-    # simple attempt: try pd.to_datetime, if fails try adding day
-    def parse_month_str(x):
-        try:
-            return pd.to_datetime(x)
-        except:
-             # Try appending day 1
-            try:
-                return pd.to_datetime(f"1-{x}")
-            except:
-                pass
-            return pd.to_datetime(x, errors='coerce')
-
-    df['date'] = df['month'].apply(parse_month_str)
+    # Month labels vary ('2024-01', 'Jan-24', 'فبراير 2024', 'رمضان 1445هـ'); the format is inferred once per layout
+    df['date'] = parse_dates(df['month'], date_signature(column_map, 'month'))
     
     df = df.dropna(subset=['date', 'revenue', 'expenses'])
     if df.empty:
@@ -217,23 +198,57 @@ def parse_pnl(df: pd.DataFrame) -> pd.DataFrame:
          
     return df.sort_values('date')
 
-def parse_data(contents: bytes, filename: str) -> tuple[pd.DataFrame, str]:
+def header_amount_columns(cells: List[str]) -> Optional[List[int]]:
+    """
+    For a row naming at least two known columns (the header; title lines above it are skipped),
+    the positions of its amount columns. None for any other row.
+    """
+    column_map = match_columns(cells).columns
+    if len(column_map) < 2:
+        return None
+    return [i for i, cell in enumerate(cells) if column_map.get(cell) in AMOUNT_FIELDS]
+
+def sniff_upload(path: str) -> CsvDialect:
+    return sniff_csv(path, amount_columns=header_amount_columns)
+
+def text_dtypes(columns, column_map: Dict[str, str]) -> Dict[str, type]:
+    """Every column but the mapped amounts is read as str, so the dialect's decimal/thousands only convert amounts."""
+    return {column: str for column in columns if column_map.get(column) not in AMOUNT_FIELDS}
+
+def read_csv(path: str, dialect: CsvDialect) -> pd.DataFrame:
+    """Whole CSV. With the Arrow engine, a transactions ledger is read as dictionary-encoded mapped columns only."""
+    header = pd.read_csv(path, nrows=0, **dialect.read_options())
+    schema = match_columns(header.columns)
+    if USE_ARROW:
+        columns = list(schema.columns)
+        if schema.analysis != 'pnl' and columns:
+            try:
+                return read_csv_columns(path, columns, dialect)
+            except Exception as e:
+                log_event("arrow_fallback", error=str(e))
+    return pd.read_csv(path, dtype=text_dtypes(header.columns, schema.columns), **dialect.read_options())
+
+def parse_data(path: str, filename: str) -> tuple[pd.DataFrame, str]:
+    decimal = '.'
     try:
         if filename.endswith('.csv'):
-            df = pd.read_csv(io.BytesIO(contents), encoding='utf-8-sig')
+            dialect = sniff_upload(path)
+            decimal = dialect.decimal
+            df = read_csv(path, dialect)
         else:
-            df = pd.read_excel(io.BytesIO(contents))
+            df = read_excel(path, filename, select_columns=mapped_columns)
     except Exception as e:
         raise HTTPException(status_code=400, detail="الملف غير صالح للتحليل المالي. يرجى رفع ملف يحتوي على بيانات مالية بصيغة CSV أو Excel.")
 
-    schema = detect_schema(df)
+    match = match_columns(df.columns)
+    schema = match.analysis
     
     if schema == 'pnl':
-        df = parse_pnl(df)
+        df = parse_pnl(df, match.columns, decimal)
         return df, schema
     
     # Transactions Logic (Existing)
-    df = normalize_columns(df)
+    df = df.rename(columns=match.columns)
     
     # Validation: Check for required columns
     required_cols = ['date', 'amount']
@@ -242,10 +257,10 @@ def parse_data(contents: bytes, filename: str) -> tuple[pd.DataFrame, str]:
         raise HTTPException(status_code=400, detail="الملف غير صالح للتحليل المالي. يرجى رفع ملف يحتوي على بيانات مالية بصيغة CSV أو Excel.")
 
     # 1. Parse Date
-    df['date'] = pd.to_datetime(df['date'], errors='coerce')
+    df['date'] = parse_dates(df['date'], date_signature(match.columns, 'date'))
     
     # 2. Parse Amount
-    df['amount'] = df['amount'].apply(clean_currency)
+    df['amount'] = clean_currency(df['amount'], decimal)
     
     # Drop rows with invalid date or amount
     df = df.dropna(subset=['date', 'amount'])
@@ -255,23 +270,119 @@ def parse_data(contents: bytes, filename: str) -> tuple[pd.DataFrame, str]:
         
     return df, schema
 
-def calculate_kpis(df: pd.DataFrame) -> Dict[str, Any]:
-    # Ensure sorted by date
-    df = df.sort_values('date')
-    
+def month_start(dates: pd.Series) -> np.ndarray:
+    """Truncates dates to the first of their month (datetime64[M]), without going through Period objects."""
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    return dates.to_numpy().astype('datetime64[M]')
+
+def stream_transactions_csv(path: str) -> Optional[Tuple[pd.DataFrame, Optional[pd.Series], int, Dict[str, Any]]]:
+    """
+    Reads a large transactions CSV in chunks, keeping only the mapped columns,
+    and folds each chunk into running monthly and per-category aggregates.
+    Returns (monthly, category_expenses, rows read, anomaly scan), or None when the file is not a transactions ledger.
+    """
+    invalid_file = HTTPException(status_code=400, detail="الملف غير صالح للتحليل المالي. يرجى رفع ملف يحتوي على بيانات مالية بصيغة CSV أو Excel.")
+    try:
+        dialect = sniff_upload(path)
+        header = pd.read_csv(path, nrows=0, **dialect.read_options())
+    except Exception:
+        raise invalid_file
+
+    schema = match_columns(header.columns)
+    if schema.analysis == 'pnl':
+        return None
+
+    rename_dict = schema.columns
+    if not {'date', 'amount'} <= set(rename_dict.values()):
+        raise invalid_file
+
+    folded = None
+    if USE_ARROW:
+        try:
+            folded = fold_transaction_chunks(iter_csv_columns(path, list(rename_dict), dialect), rename_dict, dialect.decimal)
+        except Exception as e:
+            log_event("arrow_fallback", error=str(e))
+    try:
+        if folded is None:
+            # Amounts are left to the C parser, so plain numeric chunks skip clean_currency
+            chunks = pd.read_csv(path, usecols=list(rename_dict), dtype=text_dtypes(rename_dict, rename_dict), chunksize=CSV_CHUNK_ROWS, **dialect.read_options())
+            folded = fold_transaction_chunks(chunks, rename_dict, dialect.decimal)
+    except Exception:
+        raise invalid_file
+
+    monthly, category_expenses, rows, anomalies = folded
+
+    if monthly is None:
+        raise invalid_file
+
+    return monthly.sort_index(), category_expenses, rows, anomalies
+
+def fold_transaction_chunks(chunks: Iterable[pd.DataFrame], rename_dict: Dict[str, str], decimal: str = '.') -> Tuple[Optional[pd.DataFrame], Optional[pd.Series], int, Optional[Dict[str, Any]]]:
+    """
+    Folds raw text chunks into running monthly and per-category aggregates. Returns (monthly, category_expenses, rows read, anomaly scan).
+    Transactions are scanned chunk by chunk: outlier statistics come from each chunk (CSV_CHUNK_ROWS rows)
+    and duplicate payments split across two chunks are not matched.
+    """
+    monthly, category_expenses, anomalies = None, None, None
+    rows = 0
+    for chunk in chunks:
+        rows += len(chunk)
+        chunk = chunk.rename(columns=rename_dict)
+        chunk['date'] = parse_dates(chunk['date'], date_signature(rename_dict, 'date'))
+        chunk['amount'] = clean_currency(chunk['amount'], decimal)
+        chunk = chunk.dropna(subset=['date', 'amount'])
+        if chunk.empty:
+            continue
+
+        part_monthly, part_categories = aggregate_transactions(chunk)
+        monthly = part_monthly if monthly is None else monthly.add(part_monthly, fill_value=0)
+        if part_categories is not None:
+            category_expenses = part_categories if category_expenses is None else category_expenses.add(part_categories, fill_value=0)
+        anomalies = merge_scans(anomalies, scan_transactions(chunk))
+    return monthly, category_expenses, rows, anomalies
+
+def month_category_sums(signed: pd.Series, months: np.ndarray, categories: pd.Series) -> pd.Series:
+    """
+    Expense sums per (month, category), sorted by month then category.
+    One bincount over integer cell codes: months are consecutive datetime64[M] ordinals, so only
+    the categories need factorizing, and the cost matches a plain per-category groupby.
+    """
+    is_expense = (signed < 0).to_numpy() & ~np.isnat(months)
+    categories = categories[is_expense]
+    if isinstance(categories.dtype, pd.CategoricalDtype):
+        category_codes = categories.cat.codes.to_numpy()
+        labels = categories.cat.categories
+    else:
+        category_codes, labels = pd.factorize(categories, sort=True)
+    keep = category_codes >= 0
+    ordinals = months[is_expense][keep].view('int64')
+    values = -signed.to_numpy()[is_expense][keep]
+    if not len(ordinals):
+        return pd.Series(dtype=float, index=pd.MultiIndex.from_arrays([months[:0], pd.Index([], dtype=object)]))
+
+    first = ordinals.min()
+    month_count = int(ordinals.max() - first) + 1
+    cells = (ordinals - first) * len(labels) + category_codes[keep]
+    sums = np.bincount(cells, weights=values, minlength=month_count * len(labels))
+    present = np.bincount(cells, minlength=month_count * len(labels)) > 0
+    index = pd.MultiIndex.from_product([(np.arange(month_count) + first).astype('datetime64[M]'), labels])[present]
+    category_expenses = pd.Series(sums[present], index=index)
+    if isinstance(categories.dtype, pd.CategoricalDtype):
+        # Dictionary order is arbitrary; order the labels as a plain text column would be
+        category_expenses = category_expenses.sort_index()
+    return category_expenses
+
+def aggregate_transactions(df: pd.DataFrame) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
+    """
+    Reduces transaction rows to a monthly table (revenue, expenses, net, rows) indexed by month start,
+    plus expense sums per (month, category) when a 'category' column exists.
+    """
     # Determine Income vs Expense
     # If 'type' column exists, use it. Else use sign.
     if 'type' in df.columns:
         # Normalize type values
-        def categorize_type(t):
-            t = str(t).lower().strip()
-            if t in ['income', 'revenue', 'credit', 'cr', 'دخل', 'ايرادات', 'إيرادات', 'ايداع']:
-                return 'income'
-            if t in ['expense', 'cost', 'debit', 'dr', 'مصروف', 'مصروفات', 'سحب']:
-                return 'expense'
-            return 'unknown'
-            
-        df['norm_type'] = df['type'].apply(categorize_type)
+        df['norm_type'] = categorize_types(df['type'])
         
         # Unified signed amount column logic
         df['signed_amount'] = np.where(df['norm_type'] == 'expense', -df['amount'].abs(), 
@@ -280,350 +391,274 @@ def calculate_kpis(df: pd.DataFrame) -> Dict[str, Any]:
         # Fallback to sign for unknown types
         df['signed_amount'] = df['amount']
 
-    # Calculations
-    total_revenue = df[df['signed_amount'] > 0]['signed_amount'].sum()
-    total_expenses = df[df['signed_amount'] < 0]['signed_amount'].abs().sum()
-    net_profit = total_revenue - total_expenses
-    profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    # Monthly Aggregation
-    df['month_period'] = df['date'].dt.to_period('M')
-    monthly = df.groupby('month_period')['signed_amount'].agg(
-        revenue=lambda x: x[x > 0].sum(),
-        expenses=lambda x: x[x < 0].abs().sum(),
-        net=lambda x: x.sum()
-    ).sort_index()
-    
-    # Delta Logic (Last Month vs Previous)
-    if len(monthly) >= 2:
-        last_month = monthly.iloc[-1]
-        prev_month = monthly.iloc[-2]
-        
-        rev_delta = ((last_month['revenue'] - prev_month['revenue']) / prev_month['revenue'] * 100) if prev_month['revenue'] > 0 else 0
-        exp_delta = ((last_month['expenses'] - prev_month['expenses']) / prev_month['expenses'] * 100) if prev_month['expenses'] > 0 else 0
-        net_delta = ((last_month['net'] - prev_month['net']) / abs(prev_month['net']) * 100) if prev_month['net'] != 0 else 0
-        margin_last = (last_month['net'] / last_month['revenue'] * 100) if last_month['revenue'] > 0 else 0
-        margin_prev = (prev_month['net'] / prev_month['revenue'] * 100) if prev_month['revenue'] > 0 else 0
-        margin_delta = margin_last - margin_prev # Absolute percentage point difference
-    else:
-        rev_delta = exp_delta = net_delta = margin_delta = None
-        
-    avg_monthly_expenses = monthly['expenses'].mean() if not monthly.empty else 0
-    highest_expense_month_val = monthly['expenses'].max() if not monthly.empty else 0
-    highest_expense_month_name = str(monthly['expenses'].idxmax()) if not monthly.empty else "N/A"
+    # Monthly Aggregation (single native sum over pre-split positive / negative columns)
+    signed = df['signed_amount']
+    months = month_start(df['date'])
+    monthly = pd.DataFrame({
+        'month': months,
+        'revenue': signed.clip(lower=0),
+        'expenses': (-signed).clip(lower=0),
+        'net': signed,
+        'rows': np.ones(len(signed), dtype=np.int64),
+    }).groupby('month').sum()
 
-    def fmt_money(val):
-        return f"{val:,.0f}" 
-    
-    def fmt_delta(val, is_pct=True, suffix_override=None):
-        if val is None: return "غير متاح"
-        sign = "+" if val >= 0 else ""
-        
-        if suffix_override:
-            return f"{sign}{val:.1f} {suffix_override}"
-            
-        suffix = "%" if is_pct else ""
-        return f"{sign}{val:.1f}{suffix}"
-
-    # Insight Helpers
-    def get_rev_insight(val, delta):
-        if delta is None: return "لا تتوفر بيانات كافية للمقارنة."
-        if delta > 0: return "نمو إيجابي في الإيرادات مقارنة بالشهر السابق."
-        if delta < 0: return "تراجع في الإيرادات يتطلب مراجعة أسباب الانخفاض."
-        return "استقرار في الإيرادات مقارنة بالشهر السابق."
-
-    def get_exp_insight(val, delta):
-        if delta is None: return "لا تتوفر بيانات كافية للمقارنة."
-        if delta > 20: return "ارتفاع ملحوظ في المصروفات التشغيلية."
-        if delta < -10: return "تحسن في ضبط المصروفات وترشيد الإنفاق."
-        return "المصروفات ضمن النطاق المعتاد."
-    
-    def get_net_insight(val, delta):
-        if val < 0: return "تسجيل خسارة صافية خلال الفترة."
-        if delta is not None and delta > 0: return "نمو في صافي الأرباح مقارنة بالفترة السابقة."
-        return "تحقيق صافي ربح إيجابي."
-
-    def get_margin_insight(val, delta):
-        if val < 10: return "هامش الربح منخفض وقد يؤثر على الاستدامة."
-        if val > 40: return "هامش ربح صحي وممتاز."
-        return "هامش ربح جيد ومستقر."
-        
-    kpis = [
-        { 
-            "name": "إجمالي الإيرادات", 
-            "value": fmt_money(total_revenue), 
-            "delta": fmt_delta(rev_delta),
-            "insight": get_rev_insight(total_revenue, rev_delta)
-        },
-        { 
-            "name": "إجمالي المصروفات", 
-            "value": fmt_money(total_expenses), 
-            "delta": fmt_delta(exp_delta),
-            "insight": get_exp_insight(total_expenses, exp_delta)
-        },
-        { 
-            "name": "صافي الربح", 
-            "value": fmt_money(net_profit), 
-            "delta": fmt_delta(net_delta),
-            "insight": get_net_insight(net_profit, net_delta)
-        },
-        { 
-            "name": "هامش الربح", 
-            "value": f"{profit_margin:.1f}%", 
-            "delta": fmt_delta(margin_delta, is_pct=False, suffix_override="نقطة"),
-            "insight": get_margin_insight(profit_margin, margin_delta)
-        },
-        { 
-            "name": "متوسط المصروفات", 
-            "value": fmt_money(avg_monthly_expenses), 
-            "delta": "شهرياً",
-            "insight": "متوسط الإنفاق الشهري التشغيلي."
-        },
-        { 
-            "name": "أعلى مصروفات", 
-            "value": fmt_money(highest_expense_month_val), 
-            "delta": highest_expense_month_name,
-            "insight": "الشهر الأعلى إنفاقاً خلال الفترة."
-        },
-    ]
-    
-    # Risks / Anomalies
-    risks = []
-    
-    # Risk 1: Margin too low
-    if profit_margin < 10:
-        risks.append("هامش الربح الإجمالي منخفض جداً (أقل من 10%)")
-        
-    # Risk 2: High Expenses Trend
-    if exp_delta is not None and exp_delta > 20:
-        risks.append(f"ارتفاع حاد في المصروفات الشهرية بنسبة {exp_delta:.1f}%")
-        
-    # Risk 3: Revenue Drop
-    if rev_delta is not None and rev_delta < -15:
-        risks.append(f"انخفاض ملحوظ في الإيرادات الشهرية بنسبة {abs(rev_delta):.1f}%")
-        
-    # Risk 4: Negative Net Profit (Last Month)
-    if not monthly.empty and monthly.iloc[-1]['net'] < 0:
-        risks.append("صافي ربح الشهر الأخير سلبي (خسارة)")
-        
-    # Risk 5: Concentration Risk (Category)
-    top_cat_risk = False
+    category_expenses = None
     if 'category' in df.columns:
-        # Filter expenses
-        expenses_df = df[df['signed_amount'] < 0].copy()
-        if not expenses_df.empty:
-            expenses_df['abs_amt'] = expenses_df['signed_amount'].abs()
-            cat_group = expenses_df.groupby('category')['abs_amt'].sum().sort_values(ascending=False)
-            if not cat_group.empty:
-                top_cat = cat_group.index[0]
-                top_pct = (cat_group.iloc[0] / total_expenses) * 100
-                if top_pct > 40:
-                    risks.append(f"تركيز عالي للمصروفات في بند '{top_cat}' ({top_pct:.1f}%)")
-                    top_cat_risk = top_cat # Store for recommendation
-
-    # Fill default risks if empty
-    if not risks:
-        risks.append("لم يتم رصد مخاطر حرجة بناءً على البيانات الحالية.")
-
-    # Recommendations Mapping
-    recommendations_list = []
-    for r in risks:
-        if "هامش الربح" in r:
-            recommendations_list.append("مراجعة تسعير المنتجات أو خفض التكاليف المباشرة فوراً.")
-        elif "ارتفاع حاد في المصروفات" in r:
-            recommendations_list.append("تحليل بنود المصروفات المتضخمة لهذا الشهر ووضع سقف للإنفاق.")
-        elif "انخفاض" in r and "الإيرادات" in r:
-            recommendations_list.append("تفعيل حملات تسويقية عاجلة أو مراجعة أداء فريق المبيعات.")
-        elif "خسارة" in r or "سلبي" in r:
-            recommendations_list.append("إجراء مراجعة شاملة للتدفقات النقدية لتجنب أزمة سيولة.")
-        elif "تركيز عالي" in r:
-            recommendations_list.append(f"البحث عن موردين بدائل أو تقليل الاعتماد على '{top_cat_risk}' إن أمكن.")
-    
-    # Deduplicate preserving order
-    recommendations = list(dict.fromkeys(recommendations_list))
-    
-    if not recommendations:
-        recommendations.append("الاستمرار في مراقبة الأداء المالي للحفاظ على الاستقرار.")
-        
-    return {
-        "kpis": kpis,
-        "risks": risks,
-        "recommendations": recommendations,
-        "monthly_count": len(monthly)
-    }
+        category_expenses = month_category_sums(signed, months, df['category'])
+
+    return monthly, category_expenses
+
+def pnl_monthly(df: pd.DataFrame) -> pd.DataFrame:
+    """Monthly table (revenue, expenses, net, rows) of a parsed P&L sheet, in the shape aggregate_transactions returns."""
+    monthly = pd.DataFrame({
+        'month': month_start(df['date']),
+        'revenue': df['revenue'],
+        'expenses': df['expenses'],
+        'rows': np.ones(len(df), dtype=np.int64),
+    }).groupby('month').sum()
+    monthly['net'] = monthly['revenue'] - monthly['expenses']
+    return monthly[['revenue', 'expenses', 'net', 'rows']]
+
+def calculate_kpis(df: pd.DataFrame) -> Dict[str, Any]:
+    monthly, category_expenses = aggregate_transactions(df)
+    return analyze_monthly(monthly, category_expenses, scan_transactions(df))
 
 def calculate_pnl_results(df: pd.DataFrame) -> Dict[str, Any]:
     """
     Calculates KPIs, Risks, Recs from P&L Data (Month, Revenue, Expenses)
     """
-    # Basic calcs
     if 'revenue' not in df.columns or 'expenses' not in df.columns:
         raise HTTPException(status_code=400, detail="PnL data must have revenue and expenses")
-        
-    total_revenue = df['revenue'].sum()
-    total_expenses = df['expenses'].sum()
-    net_profit = total_revenue - total_expenses
-    profit_margin = (net_profit / total_revenue * 100) if total_revenue > 0 else 0
-    
-    # Monthly aggregations (df is already monthly rows hopefully)
-    monthly = df.set_index('date').sort_index()
-    monthly['net'] = monthly['revenue'] - monthly['expenses']
-    
-    # Delta Logic (Last Month vs Previous)
-    if len(monthly) >= 2:
-        last_month = monthly.iloc[-1]
-        prev_month = monthly.iloc[-2]
-        
-        rev_delta = ((last_month['revenue'] - prev_month['revenue']) / prev_month['revenue'] * 100) if prev_month['revenue'] > 0 else 0
-        exp_delta = ((last_month['expenses'] - prev_month['expenses']) / prev_month['expenses'] * 100) if prev_month['expenses'] > 0 else 0
-        net_delta = ((last_month['net'] - prev_month['net']) / abs(prev_month['net']) * 100) if prev_month['net'] != 0 else 0
-        
-        margin_last = (last_month['net'] / last_month['revenue'] * 100) if last_month['revenue'] > 0 else 0
-        margin_prev = (prev_month['net'] / prev_month['revenue'] * 100) if prev_month['revenue'] > 0 else 0
-        margin_delta = margin_last - margin_prev 
-    else:
-        rev_delta = exp_delta = net_delta = margin_delta = None
-        
-    avg_monthly_expenses = monthly['expenses'].mean() if not monthly.empty else 0
-    highest_expense_month_val = monthly['expenses'].max() if not monthly.empty else 0
-    
-    # Find month name for highest expense
-    highest_exp_row = monthly.loc[monthly['expenses'].idxmax()] if not monthly.empty else None
-    if highest_exp_row is not None:
-        # Format date as YYYY-MM
-        highest_expense_month_name = str(monthly['expenses'].idxmax()).split(' ')[0][:7]
-    else:
-        highest_expense_month_name = "N/A"
-
-    # Reuse formatting helpers (duplicated for safety/speed without refactor hell)
-    def fmt_money(val): return f"{val:,.0f}" 
-    def fmt_delta(val, is_pct=True, suffix_override=None):
-        if val is None: return "غير متاح"
-        sign = "+" if val >= 0 else ""
-        if suffix_override: return f"{sign}{val:.1f} {suffix_override}"
-        suffix = "%" if is_pct else ""
-        return f"{sign}{val:.1f}{suffix}"
-
-    # Insight Helpers (Same logic)
-    def get_rev_insight(val, delta):
-        if delta is None: return "لا تتوفر بيانات كافية للمقارنة."
-        if delta > 0: return "نمو إيجابي في الإيرادات مقارنة بالشهر السابق."
-        if delta < 0: return "تراجع في الإيرادات يتطلب مراجعة أسباب الانخفاض."
-        return "استقرار في الإيرادات مقارنة بالشهر السابق."
-
-    def get_exp_insight(val, delta):
-        if delta is None: return "لا تتوفر بيانات كافية للمقارنة."
-        if delta > 20: return "ارتفاع ملحوظ في المصروفات التشغيلية."
-        if delta < -10: return "تحسن في ضبط المصروفات وترشيد الإنفاق."
-        return "المصروفات ضمن النطاق المعتاد."
-    
-    def get_net_insight(val, delta):
-        if val < 0: return "تسجيل خسارة صافية خلال الفترة."
-        if delta is not None and delta > 0: return "نمو في صافي الأرباح مقارنة بالفترة السابقة."
-        return "تحقيق صافي ربح إيجابي."
-
-    def get_margin_insight(val, delta):
-        if val < 10: return "هامش الربح منخفض وقد يؤثر على الاستدامة."
-        if val > 40: return "هامش ربح صحي وممتاز."
-        return "هامش ربح جيد ومستقر."
-        
-    kpis = [
-        { "name": "إجمالي الإيرادات", "value": fmt_money(total_revenue), "delta": fmt_delta(rev_delta), "insight": get_rev_insight(total_revenue, rev_delta) },
-        { "name": "إجمالي المصروفات", "value": fmt_money(total_expenses), "delta": fmt_delta(exp_delta), "insight": get_exp_insight(total_expenses, exp_delta) },
-        { "name": "صافي الربح", "value": fmt_money(net_profit), "delta": fmt_delta(net_delta), "insight": get_net_insight(net_profit, net_delta) },
-        { "name": "هامش الربح", "value": f"{profit_margin:.1f}%", "delta": fmt_delta(margin_delta, is_pct=False, suffix_override="نقطة"), "insight": get_margin_insight(profit_margin, margin_delta) },
-        { "name": "متوسط المصروفات", "value": fmt_money(avg_monthly_expenses), "delta": "شهرياً", "insight": "متوسط الإنفاق الشهري التشغيلي." },
-        { "name": "أعلى مصروفات", "value": fmt_money(highest_expense_month_val), "delta": highest_expense_month_name, "insight": "الشهر الأعلى إنفاقاً خلال الفترة." },
-    ]
-    
-    # Risks
-    risks = []
-    if profit_margin < 10: risks.append("هامش الربح الإجمالي منخفض جداً (أقل من 10%)")
-    if exp_delta is not None and exp_delta > 20: risks.append(f"ارتفاع حاد في المصروفات الشهرية بنسبة {exp_delta:.1f}%")
-    if rev_delta is not None and rev_delta < -15: risks.append(f"انخفاض ملحوظ في الإيرادات الشهرية بنسبة {abs(rev_delta):.1f}%")
-    if not monthly.empty and monthly.iloc[-1]['net'] < 0: risks.append("صافي ربح الشهر الأخير سلبي (خسارة)")
-    if not risks: risks.append("لم يتم رصد مخاطر حرجة بناءً على البيانات الحالية.")
-
-    # Recommendations
-    recommendations_list = []
-    for r in risks:
-        if "هامش الربح" in r: recommendations_list.append("مراجعة تسعير المنتجات أو خفض التكاليف المباشرة فوراً.")
-        elif "ارتفاع حاد" in r: recommendations_list.append("تحليل بنود المصروفات المتضخمة لهذا الشهر ووضع سقف للإنفاق.")
-        elif "انخفاض" in r: recommendations_list.append("تفعيل حملات تسويقية عاجلة أو مراجعة أداء فريق المبيعات.")
-        elif "خسارة" in r: recommendations_list.append("إجراء مراجعة شاملة للتدفقات النقدية لتجنب أزمة سيولة.")
-    
-    recommendations = list(dict.fromkeys(recommendations_list))
-    if not recommendations: recommendations.append("الاستمرار في مراقبة الأداء المالي للحفاظ على الاستقرار.")
-    
-    return {
-        "kpis": kpis,
-        "risks": risks,
-        "recommendations": recommendations,
-        "monthly_count": len(monthly)
-    }
+    return analyze_monthly(pnl_monthly(df))
+
+def analyze_upload(path: str, filename: str, dataset_id: Optional[str] = None) -> Tuple[str, Dict[str, Any], Dict[str, float], int, tuple]:
+    """
+    Parses and analyzes an uploaded file.
+    Returns (schema, results, per-stage timings in ms, rows read, (monthly, category_expenses));
+    the monthly aggregates let batch uploads consolidate several files.
+    With a dataset_id the upload is merged into that stored dataset first (see merge_upload).
+    """
+    if dataset_id is not None:
+        return merge_upload(path, filename, dataset_id)
+
+    timings: Dict[str, float] = {}
+    if filename.endswith('.csv') and os.path.getsize(path) > CSV_STREAM_THRESHOLD:
+        with stage(timings, "parse"):
+            aggregates = stream_transactions_csv(path)
+        if aggregates is not None:
+            monthly, category_expenses, rows, anomalies = aggregates
+            with stage(timings, "kpis"):
+                results = analyze_monthly(monthly, category_expenses, anomalies)
+            return 'transactions', results, timings, rows, (monthly, category_expenses)
+
+    with stage(timings, "parse"):
+        df, schema = parse_data(path, filename)
+    with stage(timings, "kpis"):
+        if schema == 'pnl':
+            aggregates, anomalies = (pnl_monthly(df), None), None
+        else:
+            aggregates = aggregate_transactions(df)
+            anomalies = scan_transactions(df)
+        results = analyze_monthly(*aggregates, anomalies)
+    return schema, results, timings, len(df), aggregates
+
+def merge_upload(path: str, filename: str, dataset_id: str) -> Tuple[str, Dict[str, Any], Dict[str, float], int, tuple]:
+    """
+    Append mode: reduces the upload to monthly aggregates, merges them into the stored dataset
+    and analyzes the merged monthly table, so the cost follows the new rows rather than the whole history.
+    Only the upload's own rows are scanned for transaction anomalies. results['dataset'] describes the merge.
+    Row counts are kept per month, so re-sending a month (a retry or a correction) replaces its rows instead of adding them.
+    """
+    timings: Dict[str, float] = {}
+    anomalies = None
+    with stage(timings, "parse"):
+        aggregates = None
+        if filename.endswith('.csv') and os.path.getsize(path) > CSV_STREAM_THRESHOLD:
+            aggregates = stream_transactions_csv(path)
+        if aggregates is not None:
+            schema = 'transactions'
+            monthly, month_categories, rows, anomalies = aggregates
+        else:
+            df, schema = parse_data(path, filename)
+            rows = len(df)
+            if schema == 'pnl':
+                monthly, month_categories = pnl_monthly(df), None
+            else:
+                monthly, month_categories = aggregate_transactions(df)
+                anomalies = scan_transactions(df)
+
+    with stage(timings, "merge"):
+        try:
+            monthly, category_expenses, dataset = aggregate_store().merge(dataset_id, schema, monthly, month_categories)
+        except SchemaMismatch:
+            raise HTTPException(status_code=400, detail="نوع الملف لا يطابق البيانات المحفوظة في هذه المجموعة.")
+
+    with stage(timings, "kpis"):
+        results = analyze_monthly(monthly, category_expenses, anomalies)
+    results['dataset'] = dataset
+    return schema, results, timings, rows, (monthly, category_expenses)
+
+def analyze_upload_job(path: str, filename: str, dataset_id: Optional[str] = None):
+    """
+    Analysis pool entry point.
+    HTTPException does not survive pickling, so it comes back as ((status, detail), None).
+    """
+    try:
+        return None, analyze_upload(path, filename, dataset_id)
+    except HTTPException as he:
+        return (he.status_code, he.detail), None
+
+async def spool_upload(file: UploadFile, max_size: int) -> Tuple[str, str]:
+    """
+    Copies the upload to a temporary file in chunks, so the whole file is never held in memory.
+    Returns (path, sha256 of the contents).
+    """
+    digest = hashlib.sha256()
+    size = 0
+    tf = tempfile.NamedTemporaryFile(delete=False, suffix=os.path.splitext(file.filename or "")[1])
+    try:
+        while chunk := await file.read(UPLOAD_CHUNK_SIZE):
+            size += len(chunk)
+            if size > max_size:
+                raise HTTPException(status_code=400, detail=f"حجم الملف كبير جداً (الحد الأقصى {max_size // (1024 * 1024)} ميجابايت).")
+            digest.update(chunk)
+            tf.write(chunk)
+    except BaseException:
+        tf.close()
+        os.remove(tf.name)
+        raise
+    tf.close()
+    return tf.name, digest.hexdigest()
 
 @app.get("/health")
 async def health_check():
-    return {"ok": True}
+    return {"ok": True, "pdf_renderer": renderer.health(), "report_cache": report_cache.stats(), "analysis_cache": analysis_cache.stats(), "analysis_pool": analysis_pool.health(), "jobs": jobs.stats()}
+
+def cache_samples(field: str):
+    from utils.llm_writer import llm_cache
+
+    caches = {"analysis": analysis_cache, "llm": llm_cache, "report": report_cache}
+    return [({"cache": name}, cache.stats()[field]) for name, cache in caches.items()]
+
+def queue_samples():
+    pool, pdf = analysis_pool.health(), renderer.health()
+    return [
+        ({"queue": "analysis_running"}, pool["running"]),
+        ({"queue": "analysis_waiting"}, pool["queued"]),
+        ({"queue": "pdf_idle_pages"}, pdf["idle"]),
+        ({"queue": "pdf_waiting"}, pdf["waiting"]),
+    ]
+
+registry.collector("nebras_cache_hits_total", "Cache hits.", "counter", lambda: cache_samples("hits"))
+registry.collector("nebras_cache_misses_total", "Cache misses.", "counter", lambda: cache_samples("misses"))
+registry.collector("nebras_queue_depth", "Work currently running or waiting in each pool.", "gauge", queue_samples)
+registry.collector("nebras_pool_rejected_total", "Requests turned away because a pool was full.", "counter", lambda: [({"pool": "analysis"}, analysis_pool.rejected)])
+registry.collector("nebras_jobs", "Background jobs in the job store, by status.", "gauge", lambda: [({"status": k}, v) for k, v in jobs.stats().items()])
+
+@app.get("/metrics")
+async def metrics():
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
+REPORT_NAME_PATTERN = re.compile(r"^report_[\w-]+\.pdf$")
 
 @app.get("/reports/{filename}")
-async def get_report(filename: str):
-    file_path = os.path.join(os.path.dirname(__file__), "reports", filename)
-    if os.path.exists(file_path):
-        return FileResponse(file_path, media_type="application/pdf", filename=filename)
-    raise HTTPException(status_code=404, detail="التقرير غير موجود")
+async def get_report(filename: str, request: Request):
+    """Streams a report from the report store, with ETag / If-None-Match and single Range requests."""
+    info = await asyncio.to_thread(report_cache.store.stat, filename) if REPORT_NAME_PATTERN.match(filename) else None
+    if info is None:
+        raise HTTPException(status_code=404, detail="التقرير غير موجود")
 
-@app.post("/api/analyze")
-async def analyze_file(
-    request: Request,
-    file: UploadFile = File(...),
-    concern: Optional[str] = Form(None),
-    is_demo: Optional[str] = Form(None)
-):
+    etag = f'"{info.etag}"'
+    headers = {
+        "ETag": etag,
+        "Accept-Ranges": "bytes",
+        "Cache-Control": "private, max-age=3600",
+    }
+    if etag_matches(request.headers.get("if-none-match"), etag):
+        return Response(status_code=304, headers=headers)
+
+    byte_range = None
+    if_range = request.headers.get("if-range")
+    # If-Range needs a strong match; a date or weak tag there means "send the whole file"
+    if if_range is None or etag_matches(if_range, etag, weak=False):
+        try:
+            byte_range = parse_range(request.headers.get("range"), info.size)
+        except ValueError:
+            return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{info.size}"})
+
+    headers["Content-Disposition"] = f'attachment; filename="{filename}"'
+    if byte_range is None:
+        headers["Content-Length"] = str(info.size)
+        return StreamingResponse(report_cache.store.read(filename), media_type="application/pdf", headers=headers)
+    start, end = byte_range
+    headers["Content-Length"] = str(end - start + 1)
+    headers["Content-Range"] = f"bytes {start}-{end}/{info.size}"
+    return StreamingResponse(report_cache.store.read(filename, start, end), status_code=206, media_type="application/pdf", headers=headers)
+
+def admit_request(request: Request, file: Optional[UploadFile], is_demo: Optional[str]) -> Tuple[str, bool]:
+    """
+    Logs the request and takes a rate-limit slot (raises 429 when none is left).
+    The caller must give the slot back if the analysis fails.
+    """
     # Debug Logging for Mobile Connection Issues
-    print(f"Incoming Request from Client: {request.client.host}")
-    print(f"Origin Header: {request.headers.get('origin', 'No Origin')}")
-    if file:
-        print(f"Processing File: {file.filename}")
+    log_event(
+        "request_received",
+        client=request.client.host,
+        origin=request.headers.get('origin', 'No Origin'),
+        file=file.filename if file else None,
+    )
 
     # Check Rate Limit
     client_ip = request.client.host
     demo_flag = (is_demo == "1")
     
-    if not check_rate_limit(client_ip, is_demo=demo_flag):
+    if not rate_limiter.try_acquire(client_ip, is_demo=demo_flag):
         msg = "تم الوصول إلى الحد اليومي لمحاولات التحليل التجريبية. يمكنك إعادة المحاولة غدًا." if demo_flag else "تم الوصول إلى الحد اليومي لمحاولة التحليل. يمكنك إعادة المحاولة غدًا."
-        return JSONResponse(
-            status_code=429,
-            content={"detail": msg}
-        )
+        raise HTTPException(status_code=429, detail=msg)
+
+    return client_ip, demo_flag
+
+DATASET_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+def resolve_dataset(mode: Optional[str], dataset_id: Optional[str]) -> Optional[str]:
+    """
+    Append mode is requested with mode=append or a dataset_id. Returns the dataset to merge into
+    (a new one when no id is given), or None for a regular one-off analysis.
+    """
+    if mode != "append" and not dataset_id:
+        return None
+    if not dataset_id:
+        return aggregate_store().new_id()
+    if not DATASET_ID_PATTERN.match(dataset_id) or not aggregate_store().exists(dataset_id):
+        raise HTTPException(status_code=404, detail="مجموعة البيانات غير موجودة")
+    return dataset_id
+
+def file_extension(filename: str) -> str:
+    return filename.split(".")[-1].lower() if "." in filename else ""
 
+async def receive_upload(file: UploadFile, concern: Optional[str], timings: Dict[str, float]) -> Tuple[str, str, str]:
+    """Validates and spools the upload. Returns (upload_path, filename, cache_key)."""
     # 1. Validation Logic
     filename = file.filename or ""
-    extension = filename.split(".")[-1].lower() if "." in filename else ""
-    if extension not in ["csv", "xlsx", "xls"]:
+    extension = file_extension(filename)
+    if extension not in SUPPORTED_EXTENSIONS:
         raise HTTPException(status_code=400, detail="نوع الملف غير مدعوم. يرجى رفع ملف CSV أو Excel.")
         
-    contents = await file.read()
-    if len(contents) > MAX_FILE_SIZE:
-        raise HTTPException(status_code=400, detail="حجم الملف كبير جداً (الحد الأقصى 10 ميجابايت).")
+    max_size = MAX_CSV_SIZE if extension == "csv" else MAX_FILE_SIZE
+    with stage(timings, "upload"):
+        upload_path, file_digest = await spool_upload(file, max_size)
+    upload_bytes.observe(os.path.getsize(upload_path), format=extension)
 
-    # 2. Parse Data
-    try:
-        df, schema = parse_data(contents, filename)
-    except HTTPException as he:
-        raise he
-    except Exception as e:
-        raise HTTPException(status_code=500, detail=f"خطأ في معالجة الملف: {str(e)}")
+    return upload_path, filename, content_hash(extension, concern or "", file_digest)
 
-    # 3. Analyze
-    if schema == 'pnl':
-        results = calculate_pnl_results(df)
-        intro_text = "تم تحليل قائمة دخل شهرية. "
-    else:
-        results = calculate_kpis(df)
-        intro_text = "تم تحليل بيانات معاملات مالية. "
+def draft_summary(schema: str, results: Dict[str, Any], intro_text: Optional[str] = None) -> str:
+    """Deterministic executive summary built from the KPIs and risks."""
+    if intro_text is None:
+        if schema == 'pnl':
+            intro_text = "تم تحليل قائمة دخل شهرية. "
+        else:
+            intro_text = "تم تحليل بيانات معاملات مالية. "
     
-    # 4. Generate Summary (Dynamic - Deterministic Draft)
     kpis = results['kpis']
     rev_val = kpis[0]['value']
     profit_val = kpis[2]['value']
@@ -636,54 +671,502 @@ async def analyze_file(
         summary_text += "يرجى الانتباه للمخاطر المرصودة أدناه لضمان الاستدامة المالية."
     else:
         summary_text += "الأداء المالي يبدو مستقراً بشكل عام."
-    
-    recommendations_list = results['recommendations']
+    return summary_text
 
-    # 4.5 LLM Executive Rewrite (Optional)
-    from utils.llm_writer import write_executive_text
-    
-    # Payload for LLM
-    llm_payload = {
-        "summary": summary_text,
-        "kpis": kpis,
-        "risks": results['risks'],
-        "recommendations": recommendations_list
+# Superseded draft renders still finishing in the background (referenced so they are not garbage collected)
+draft_renders: set = set()
+
+def report_payload(response: Dict[str, Any]) -> Dict[str, Any]:
+    """The narrative fields shared by the LLM payload and the PDF report."""
+    return {
+        "summary": response["summary"],
+        "kpis": response["kpis"],
+        "risks": response["risks"],
+        "recommendations": response["recommendations"]
     }
-    
-    # Try to get enhanced text
-    llm_result = await write_executive_text(llm_payload)
-    
+
+def report_context(response: Dict[str, Any]) -> Dict[str, Any]:
+    """report_payload plus the flagged transactions, which only the PDF lists."""
+    return {**report_payload(response), "anomalies": response.get("anomalies", [])}
+
+def apply_llm_text(response: Dict[str, Any], llm_result: Optional[Dict[str, Any]]):
     if llm_result:
-        print("Using LLM Executive Content")
-        summary_text = llm_result.get("executive_summary", summary_text)
-        recommendations_list = llm_result.get("executive_recommendations", recommendations_list)
-
-    # 5. Generate PDF
-    # Pass all data needed for report
-    report_data = {
-        "summary": summary_text,
-        "kpis": kpis,
-        "risks": results['risks'],
-        "recommendations": recommendations_list
-    }
-    
+        log_event("narrative_llm")
+        response["summary"] = llm_result.get("executive_summary", response["summary"])
+        response["recommendations"] = llm_result.get("executive_recommendations", response["recommendations"])
+        response["narrative_source"] = "llm"
+
+def attach_report(response: Dict[str, Any], pdf_filename: Optional[str]):
+    response["report_pdf_url"] = f"/reports/{pdf_filename}" if pdf_filename else None
+
+async def render_report(report_data: Dict[str, Any]) -> Optional[str]:
     try:
-        pdf_filename = await generate_pdf(report_data)
-        report_url = f"/reports/{pdf_filename}"
+        return await generate_pdf(report_data)
     except Exception as e:
-        print(f"Error generating PDF: {e}")
-        report_url = None
+        log_event("pdf_failed", error=str(e))
+        return None
 
-    # Record successful usage
-    record_usage(client_ip, is_demo=demo_flag)
-    
-    return {
-        "summary": summary_text,
+async def write_report_serial(response: Dict[str, Any], timings: Dict[str, float], on_progress=None) -> bool:
+    """LLM rewrite, then one PDF render of the final text."""
+    from utils.llm_writer import write_executive_text
+
+    with stage(timings, "llm"):
+        llm_result = await write_executive_text(report_payload(response))
+    apply_llm_text(response, llm_result)
+    if on_progress:
+        on_progress("pdf", dict(response))
+
+    with stage(timings, "pdf"):
+        attach_report(response, await render_report(report_context(response)))
+    return True
+
+async def write_report_budgeted(response: Dict[str, Any], timings: Dict[str, float], on_progress=None) -> bool:
+    """
+    Starts the LLM rewrite and a PDF of the deterministic draft together.
+    A rewrite that arrives within LLM_DEADLINE replaces the draft text and the PDF is rendered again;
+    otherwise the draft is returned. Returns False when the LLM missed the deadline.
+    """
+    from utils.llm_writer import write_executive_text
+
+    draft = report_payload(response)
+    llm_task = asyncio.ensure_future(write_executive_text(draft))
+    draft_pdf = asyncio.ensure_future(render_report(report_context(response)))
+
+    with stage(timings, "llm"):
+        done, _ = await asyncio.wait({llm_task}, timeout=LLM_DEADLINE)
+    if not done:
+        # The rewrite keeps running detached and lands in the LLM cache for the next request
+        llm_task.cancel()
+        log_event("llm_deadline_missed", deadline_s=LLM_DEADLINE)
+    else:
+        apply_llm_text(response, llm_task.result())
+    if on_progress:
+        on_progress("pdf", dict(response))
+
+    with stage(timings, "pdf"):
+        if response["narrative_source"] == "llm":
+            # The draft render is no longer needed; let it finish into the report cache on its own
+            draft_renders.add(draft_pdf)
+            draft_pdf.add_done_callback(draft_renders.discard)
+            attach_report(response, await render_report(report_context(response)))
+        else:
+            attach_report(response, await draft_pdf)
+    return bool(done)
+
+async def run_pipeline(
+    upload_path: str,
+    filename: str,
+    cache_key: str,
+    timings: Dict[str, float],
+    on_progress: Optional[Callable[[str, Dict[str, Any]], None]] = None,
+    dataset_id: Optional[str] = None
+) -> Dict[str, Any]:
+    """
+    Runs analysis -> LLM rewrite -> PDF for a spooled upload and returns the API response.
+    on_progress(stage, partial_response) is called as each stage starts, once the KPIs are known.
+    With a dataset_id the upload is merged into that dataset (append mode), which is never served from the cache.
+    """
+    try:
+        # Repeat upload: reuse the previous response if its report is still on disk
+        cached = analysis_cache.get(cache_key) if dataset_id is None else None
+        if cached is not None:
+            pdf_url = cached.get("report_pdf_url")
+            if pdf_url is None or await asyncio.to_thread(report_cache.exists, os.path.basename(pdf_url)):
+                log_event("analysis_cache_hit", file=filename)
+                return cached
+            analysis_cache.delete(cache_key)
+
+        # 2. Parse Data & 3. Analyze (in the analysis pool, off the event loop)
+        try:
+            with stage(timings, "analysis"):
+                error, analysis = await analysis_pool.run(analyze_upload_job, upload_path, filename, dataset_id)
+        except PoolSaturated:
+            raise HTTPException(
+                status_code=503,
+                detail="الخادم مشغول حالياً. يرجى إعادة المحاولة بعد قليل.",
+                headers={"Retry-After": "5"}
+            )
+        except Exception as e:
+            raise HTTPException(status_code=500, detail=f"خطأ في معالجة الملف: {str(e)}")
+        if error:
+            raise HTTPException(status_code=error[0], detail=error[1])
+
+        schema, results, analysis_timings, rows, _ = analysis
+        rows_analyzed.observe(rows, schema=schema)
+        timings.update(analysis_timings)
+        timings["queue"] = max(0.0, timings.pop("analysis") - sum(analysis_timings.values()))
+    finally:
+        os.remove(upload_path)
+
+    # 4. Generate Summary (Dynamic - Deterministic Draft)
+    response = {
+        "summary": draft_summary(schema, results),
         "kpis": results['kpis'],
         "risks": results['risks'],
-        "recommendations": recommendations_list,
-        "report_pdf_url": report_url
+        "recommendations": results['recommendations'],
+        "anomalies": results['anomalies'],
+        "narrative_source": "deterministic",
+        "report_pdf_url": None
     }
+    if "dataset" in results:
+        response["dataset"] = results["dataset"]
+    if on_progress:
+        on_progress("llm", dict(response))
+
+    # 4.5 LLM Executive Rewrite (Optional) & 5. Generate PDF
+    if NARRATIVE_MODE == "budgeted":
+        complete = await write_report_budgeted(response, timings, on_progress)
+    else:
+        complete = await write_report_serial(response, timings, on_progress)
+
+    observe_timings(timings)
+    log_event(
+        "analysis_complete",
+        file=filename,
+        schema=schema,
+        rows=rows,
+        narrative_source=response["narrative_source"],
+        pdf=response["report_pdf_url"] is not None,
+        timings_ms={name: round(ms, 1) for name, ms in timings.items()},
+    )
+
+    # Only memoize complete results, so a failed render or a late LLM answer is picked up next time
+    if complete and response["report_pdf_url"] is not None and dataset_id is None:
+        analysis_cache.set(cache_key, response)
+    return response
+
+@app.post("/api/analyze")
+async def analyze_file(
+    request: Request,
+    file: UploadFile = File(...),
+    concern: Optional[str] = Form(None),
+    is_demo: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
+    dataset_id: Optional[str] = Form(None)
+):
+    client_ip, demo_flag = admit_request(request, file, is_demo)
+    try:
+        dataset_id = resolve_dataset(mode, dataset_id)
+        timings: Dict[str, float] = {}
+        upload_path, filename, cache_key = await receive_upload(file, concern, timings)
+        return await run_pipeline(upload_path, filename, cache_key, timings, dataset_id=dataset_id)
+    except BaseException:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        raise
+
+@app.post("/api/jobs", status_code=202)
+async def create_job(
+    request: Request,
+    file: UploadFile = File(...),
+    concern: Optional[str] = Form(None),
+    is_demo: Optional[str] = Form(None),
+    mode: Optional[str] = Form(None),
+    dataset_id: Optional[str] = Form(None)
+):
+    """Accepts the upload and returns a job id right away; poll GET /api/jobs/{job_id} for progress."""
+    client_ip, demo_flag = admit_request(request, file, is_demo)
+    try:
+        dataset_id = resolve_dataset(mode, dataset_id)
+        timings: Dict[str, float] = {}
+        upload_path, filename, cache_key = await receive_upload(file, concern, timings)
+    except BaseException:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        raise
+
+    job = jobs.create()
+    jobs.spawn(run_job(job, upload_path, filename, cache_key, timings, client_ip, demo_flag, dataset_id))
+    return {"job_id": job.id, "status_url": f"/api/jobs/{job.id}"}
+
+async def run_job(
+    job: Job, upload_path: str, filename: str, cache_key: str, timings: Dict[str, float],
+    client_ip: str, demo_flag: bool, dataset_id: Optional[str] = None
+):
+    def on_progress(stage_name: str, partial: Dict[str, Any]):
+        job.update(stage=stage_name, result=partial)
+
+    job.update(status="running")
+    try:
+        response = await run_pipeline(upload_path, filename, cache_key, timings, on_progress=on_progress, dataset_id=dataset_id)
+        job.update(status="done", stage="done", result=response)
+    except HTTPException as he:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        job.update(status="failed", error={"status": he.status_code, "detail": he.detail})
+    except Exception as e:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        job.update(status="failed", error={"status": 500, "detail": f"خطأ في معالجة الملف: {str(e)}"})
+    except BaseException:
+        # Cancelled (e.g. server shutdown): the job must not stay "running" in the shared store
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        job.update(status="failed", error={"status": 503, "detail": "توقف الخادم قبل اكتمال التحليل. يرجى إعادة المحاولة."})
+        log_event("job_failed", job_id=job.id, **job.error)
+        raise
+    if job.status == "failed":
+        log_event("job_failed", job_id=job.id, **job.error)
+
+@app.get("/api/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="المهمة غير موجودة")
+    return job.to_dict()
+
+@app.delete("/api/datasets/{dataset_id}")
+async def delete_dataset(dataset_id: str):
+    """Drops the stored aggregates of an append-mode dataset."""
+    if not DATASET_ID_PATTERN.match(dataset_id) or not aggregate_store().delete(dataset_id):
+        raise HTTPException(status_code=404, detail="مجموعة البيانات غير موجودة")
+    return {"deleted": dataset_id}
+
+# ---------------------------------------------------------------------------
+# Batch uploads: several files (or a ZIP of them), one per entity
+# ---------------------------------------------------------------------------
+
+def entity_name(filename: str) -> str:
+    return os.path.splitext(os.path.basename(filename))[0]
+
+def zip_member_name(info: zipfile.ZipInfo) -> str:
+    """Member name as the archiver meant it: without the UTF-8 flag, zipfile decodes as cp437 (Windows Explorer writes UTF-8 anyway)."""
+    if info.flag_bits & 0x800:
+        return info.filename
+    try:
+        return info.filename.encode("cp437").decode("utf-8")
+    except (UnicodeEncodeError, UnicodeDecodeError):
+        return info.filename
+
+def size_limit_error(max_size: int) -> Dict[str, Any]:
+    return {"status": 400, "detail": f"حجم الملف كبير جداً (الحد الأقصى {max_size // (1024 * 1024)} ميجابايت)."}
+
+def extract_zip(zip_path: str, budget: int) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Extracts the supported members of a ZIP to temporary files, copying at most `budget` bytes in total.
+    Returns (entities, bytes extracted); each entity has name, file and either path or error.
+    """
+    invalid_zip = HTTPException(status_code=400, detail="ملف ZIP غير صالح.")
+    try:
+        archive = zipfile.ZipFile(zip_path)
+    except zipfile.BadZipFile:
+        raise invalid_zip
+
+    entities: List[Dict[str, Any]] = []
+    extracted = 0
+    with archive:
+        for info in archive.infolist():
+            member = zip_member_name(info)
+            basename = os.path.basename(member)
+            if info.is_dir() or member.startswith("__MACOSX/") or not basename or basename.startswith("."):
+                continue
+            entity = {"name": entity_name(basename), "file": member}
+            entities.append(entity)
+            if len(entities) > BATCH_MAX_FILES:
+                break
+
+            extension = file_extension(basename)
+            if extension not in SUPPORTED_EXTENSIONS:
+                entity["error"] = {"status": 400, "detail": "نوع الملف غير مدعوم. يرجى رفع ملف CSV أو Excel."}
+                continue
+            max_size = min(MAX_CSV_SIZE if extension == "csv" else MAX_FILE_SIZE, budget - extracted)
+            if info.file_size > max_size:
+                entity["error"] = size_limit_error(max_size)
+                continue
+
+            # Sizes in the ZIP header are not trusted: the copy stops as soon as the limit is passed
+            tf = tempfile.NamedTemporaryFile(delete=False, suffix=f".{extension}")
+            size = 0
+            try:
+                with archive.open(info) as source:
+                    while chunk := source.read(UPLOAD_CHUNK_SIZE):
+                        size += len(chunk)
+                        if size > max_size:
+                            break
+                        tf.write(chunk)
+            except (zipfile.BadZipFile, zipfile.LargeZipFile, NotImplementedError, RuntimeError, OSError):
+                size = -1
+            tf.close()
+            if size > max_size or size < 0:
+                os.remove(tf.name)
+                entity["error"] = size_limit_error(max_size) if size > 0 else {"status": 400, "detail": "تعذر استخراج الملف من ملف ZIP."}
+                continue
+            extracted += size
+            entity["path"] = tf.name
+    return entities, extracted
+
+async def receive_batch(files: List[UploadFile], timings: Dict[str, float]) -> List[Dict[str, Any]]:
+    """
+    Spools every upload and expands ZIPs. Returns one entity per data file, in upload order;
+    files that cannot be analyzed carry an error instead of a path. The caller removes the paths.
+    """
+    entities: List[Dict[str, Any]] = []
+    received = 0
+    try:
+        with stage(timings, "upload"):
+            for file in files:
+                filename = file.filename or ""
+                extension = file_extension(filename)
+                if extension == "zip":
+                    zip_path, _ = await spool_upload(file, BATCH_MAX_TOTAL - received)
+                    try:
+                        members, extracted = await asyncio.to_thread(extract_zip, zip_path, BATCH_MAX_TOTAL - received)
+                    finally:
+                        os.remove(zip_path)
+                    received += extracted
+                    upload_bytes.observe(extracted, format="zip")
+                    entities.extend(members)
+                elif extension in SUPPORTED_EXTENSIONS:
+                    entity = {"name": entity_name(filename), "file": filename}
+                    entities.append(entity)
+                    max_size = min(MAX_CSV_SIZE if extension == "csv" else MAX_FILE_SIZE, BATCH_MAX_TOTAL - received)
+                    try:
+                        entity["path"], _ = await spool_upload(file, max_size)
+                    except HTTPException as he:
+                        entity["error"] = {"status": he.status_code, "detail": he.detail}
+                        continue
+                    size = os.path.getsize(entity["path"])
+                    received += size
+                    upload_bytes.observe(size, format=extension)
+                else:
+                    entities.append({
+                        "name": entity_name(filename),
+                        "file": filename,
+                        "error": {"status": 400, "detail": "نوع الملف غير مدعوم. يرجى رفع ملف CSV أو Excel أو ZIP."},
+                    })
+                if len(entities) > BATCH_MAX_FILES:
+                    raise HTTPException(status_code=400, detail=f"عدد الملفات كبير جداً (الحد الأقصى {BATCH_MAX_FILES} ملفاً).")
+    except BaseException:
+        remove_entity_files(entities)
+        raise
+    return entities
+
+def remove_entity_files(entities: List[Dict[str, Any]]):
+    for entity in entities:
+        path = entity.pop("path", None)
+        if path and os.path.exists(path):
+            os.remove(path)
+
+async def analyze_entity(entity: Dict[str, Any], slots: asyncio.Semaphore):
+    """Runs analyze_upload for one entity in the analysis pool; the outcome lands in entity['analysis'] or entity['error']."""
+    try:
+        async with slots:
+            error, analysis = await analysis_pool.run(analyze_upload_job, entity["path"], entity["file"].lower())
+    except PoolSaturated:
+        error, analysis = (503, "الخادم مشغول حالياً. يرجى إعادة المحاولة بعد قليل."), None
+    except Exception as e:
+        error, analysis = (500, f"خطأ في معالجة الملف: {str(e)}"), None
+    finally:
+        os.remove(entity.pop("path"))
+    if error:
+        entity["error"] = {"status": error[0], "detail": error[1]}
+    else:
+        entity["analysis"] = analysis
+
+def consolidate(analyses: List[tuple]) -> Dict[str, Any]:
+    """KPIs of all entities together: monthly tables and category sums are added up month by month."""
+    monthly, category_expenses = None, None
+    for _, _, _, _, (part_monthly, part_categories) in analyses:
+        monthly = part_monthly if monthly is None else monthly.add(part_monthly, fill_value=0)
+        if part_categories is not None:
+            category_expenses = part_categories if category_expenses is None else category_expenses.add(part_categories, fill_value=0)
+    return analyze_monthly(monthly.sort_index(), category_expenses)
+
+async def write_batch_reports(responses: List[Dict[str, Any]], timings: Dict[str, float]):
+    """
+    Narratives for every report in batched LLM calls, then every PDF in one browser session.
+    In budgeted mode the rewrites get LLM_DEADLINE seconds in total; late ones are dropped.
+    """
+    from utils.llm_writer import write_executive_texts
+
+    with stage(timings, "llm"):
+        llm_task = asyncio.ensure_future(write_executive_texts([report_payload(r) for r in responses]))
+        timeout = LLM_DEADLINE if NARRATIVE_MODE == "budgeted" else None
+        done, _ = await asyncio.wait({llm_task}, timeout=timeout)
+    if done:
+        for response, llm_result in zip(responses, llm_task.result()):
+            apply_llm_text(response, llm_result)
+    else:
+        llm_task.cancel()
+        log_event("llm_deadline_missed", deadline_s=LLM_DEADLINE)
+
+    with stage(timings, "pdf"):
+        filenames = await generate_pdfs([report_context(r) for r in responses])
+    for response, filename in zip(responses, filenames):
+        attach_report(response, filename)
+
+async def run_batch(entities: List[Dict[str, Any]], timings: Dict[str, float]) -> Dict[str, Any]:
+    """Analyzes the entities in parallel, adds a consolidated report when two or more succeed, and returns the API response."""
+    try:
+        slots = asyncio.Semaphore(analysis_pool.workers)
+        with stage(timings, "analysis"):
+            await asyncio.gather(*(analyze_entity(e, slots) for e in entities if "path" in e))
+    finally:
+        remove_entity_files(entities)
+
+    succeeded = [e for e in entities if "analysis" in e]
+    responses = []
+    for entity in succeeded:
+        schema, results, _, rows, _ = entity["analysis"]
+        rows_analyzed.observe(rows, schema=schema)
+        entity["response"] = {
+            "schema": schema,
+            "summary": draft_summary(schema, results),
+            "kpis": results['kpis'],
+            "risks": results['risks'],
+            "recommendations": results['recommendations'],
+            "anomalies": results['anomalies'],
+            "narrative_source": "deterministic",
+            "report_pdf_url": None
+        }
+        responses.append(entity["response"])
+
+    consolidated = None
+    if len(succeeded) >= 2:
+        results = consolidate([e["analysis"] for e in succeeded])
+        consolidated = {
+            "summary": draft_summary('transactions', results, f"تم توحيد بيانات {len(succeeded)} جهات. "),
+            "kpis": results['kpis'],
+            "risks": results['risks'],
+            "recommendations": results['recommendations'],
+            "anomalies": results['anomalies'],
+            "narrative_source": "deterministic",
+            "report_pdf_url": None
+        }
+        responses.append(consolidated)
+
+    if responses:
+        await write_batch_reports(responses, timings)
+
+    entity_results = []
+    for entity in entities:
+        result = {"name": entity["name"], "file": entity["file"]}
+        if "response" in entity:
+            result.update(status="ok", **entity["response"])
+        else:
+            result.update(status="failed", error=entity["error"])
+        entity_results.append(result)
+
+    counts = {"total": len(entities), "ok": len(succeeded), "failed": len(entities) - len(succeeded)}
+    observe_timings(timings)
+    log_event("batch_complete", **counts, timings_ms={name: round(ms, 1) for name, ms in timings.items()})
+    return {"entities": entity_results, "consolidated": consolidated, "counts": counts}
+
+@app.post("/api/batch")
+async def analyze_batch(
+    request: Request,
+    files: List[UploadFile] = File(...),
+    is_demo: Optional[str] = Form(None)
+):
+    """Several ledgers (CSV / Excel files, or ZIPs of them) in one request; uses one rate-limit slot."""
+    client_ip, demo_flag = admit_request(request, None, is_demo)
+    try:
+        timings: Dict[str, float] = {}
+        entities = await receive_batch(files, timings)
+        if not entities:
+            raise HTTPException(status_code=400, detail="لم يتم العثور على ملفات قابلة للتحليل.")
+        response = await run_batch(entities, timings)
+    except BaseException:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+        raise
+    if response["counts"]["ok"] == 0:
+        rate_limiter.release(client_ip, is_demo=demo_flag)
+    return response
 
 if __name__ == "__main__":
     import uvicorn
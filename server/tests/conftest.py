@@ -0,0 +1,16 @@
+import os
+import sys
+import tempfile
+
+# Tests import the server modules the way uvicorn does: from server/, with server/ on sys.path
+SERVER_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, SERVER_DIR)
+os.chdir(SERVER_DIR)
+
+# Keep SQLite stores out of server/data
+_data_dir = tempfile.mkdtemp(prefix="nebras-tests-")
+os.environ.setdefault("AGGREGATE_DB", os.path.join(_data_dir, "aggregates.db"))
+os.environ.setdefault("RATE_LIMIT_DB", os.path.join(_data_dir, "usage.db"))
+os.environ.setdefault("JOB_DB", os.path.join(_data_dir, "jobs.db"))
+# The suite runs without the downloaded report fonts
+os.environ.setdefault("REPORT_FONTS_REQUIRED", "0")
@@ -0,0 +1,43 @@
+import sqlite3
+
+import pandas as pd
+
+from utils.aggregates import AggregateStore
+
+def monthly(*months, rows=10):
+    index = pd.DatetimeIndex([pd.Timestamp(m) for m in months])
+    return pd.DataFrame({"revenue": 100.0, "expenses": 40.0, "net": 60.0, "rows": rows}, index=index)
+
+def test_resent_months_replace_their_rows(tmp_path):
+    store = AggregateStore(str(tmp_path / "aggregates.db"))
+    dataset = store.new_id()
+    _, _, first = store.merge(dataset, "transactions", monthly("2024-01-01", "2024-02-01"), None)
+    assert (first["rows"], first["months_added"]) == (20, 2)
+    # A retried upload: same months, same rows
+    _, _, retried = store.merge(dataset, "transactions", monthly("2024-01-01", "2024-02-01"), None)
+    assert (retried["rows"], retried["months_replaced"]) == (20, 2)
+
+    # A corrected resend of February (different bytes, so a different content hash) replaces its rows
+    _, _, corrected = store.merge(dataset, "transactions", monthly("2024-02-01", rows=12), None)
+    assert (corrected["rows"], corrected["months"]) == (22, 2)
+    _, _, added = store.merge(dataset, "transactions", monthly("2024-03-01", rows=5), None)
+    assert (added["rows"], added["months_added"]) == (27, 1)
+
+    stored, _ = store._load(dataset)
+    assert stored["rows"].tolist() == [10, 12, 5]
+    assert store.delete(dataset) and not store.exists(dataset)
+
+def test_database_without_row_counts_is_migrated(tmp_path):
+    path = str(tmp_path / "aggregates.db")
+    conn = sqlite3.connect(path)
+    conn.execute(
+        "CREATE TABLE monthly (dataset TEXT NOT NULL, month TEXT NOT NULL, revenue REAL NOT NULL,"
+        " expenses REAL NOT NULL, net REAL NOT NULL, PRIMARY KEY (dataset, month))"
+    )
+    conn.execute("INSERT INTO monthly VALUES ('d', '2024-01-01', 1, 1, 0)")
+    conn.commit()
+    conn.close()
+
+    store = AggregateStore(path)
+    _, _, summary = store.merge("d", "pnl", monthly("2024-02-01", rows=3), None)
+    assert (summary["rows"], summary["months"]) == (3, 2)
@@ -0,0 +1,197 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from utils.analytics import (
+    CONCENTRATION_MONTHS,
+    CONCENTRATION_PCT,
+    EXPENSE_SPIKE_PCT,
+    MARGIN_SLOPE_PP,
+    MIN_TREND_MONTHS,
+    RECENT_MONTHS,
+    RECOMMENDATION_TEXT,
+    REVENUE_DROP_PCT,
+    RISK_RULES,
+    RISK_TEXT,
+    UNCATEGORIZED,
+    ZSCORE_THRESHOLD,
+    ZSCORE_WINDOW,
+    Risk,
+    detect_risks,
+    render_results,
+    scan_history,
+)
+from utils.anomalies import empty_scan
+
+def healthy(**changes):
+    """Metrics of a profitable, stable ledger that no rule fires on, with `changes` applied."""
+    metrics = {
+        "months": 12,
+        "total_revenue": 120000.0,
+        "total_expenses": 80000.0,
+        "net_profit": 40000.0,
+        "profit_margin": 33.3,
+        "rev_delta": 2.0,
+        "exp_delta": 5.0,
+        "net_delta": 1.0,
+        "margin_delta": 0.5,
+        "avg_monthly_expenses": 6666.7,
+        "highest_expense_value": 7000.0,
+        "highest_expense_month": "2024-06",
+        "last_net": 3000.0,
+        "top_category": "رواتب",
+        "top_category_pct": 30.0,
+        "spike_months": [],
+        "drop_months": [],
+        "loss_streak": 0,
+        "margin_slope": 0.2,
+        "trend_months": 12,
+        "recent_category": None,
+        "recent_category_pct": None,
+        "anomalies": empty_scan(),
+    }
+    metrics.update(changes)
+    return metrics
+
+OUTLIER = {"date": "2024-05-03", "category": None, "amount": 98000.0, "median": 2000.0, "score": 12.5}
+
+@pytest.mark.parametrize("changes, expected", [
+    ({"profit_margin": 9.9}, Risk("low_margin", {})),
+    ({"exp_delta": 20.5}, Risk("expense_spike", {"pct": 20.5})),
+    ({"rev_delta": -15.5}, Risk("revenue_drop", {"pct": 15.5})),
+    ({"last_net": -1.0}, Risk("last_month_loss", {})),
+    ({"top_category_pct": 41.0}, Risk("expense_concentration", {"category": "رواتب", "pct": 41.0})),
+    ({"spike_months": ["2024-03", "2024-09"]}, Risk("expense_anomaly", {"count": 2, "month": "2024-09"})),
+    ({"drop_months": ["2024-02", "2024-05", "2024-08"]}, Risk("repeated_revenue_drops", {"count": 3, "recent": 12})),
+    ({"loss_streak": 3}, Risk("loss_streak", {"months": 3})),
+    ({"margin_slope": -1.5}, Risk("margin_decline", {"slope": 1.5, "months": 12})),
+    ({"recent_category": "إيجار", "recent_category_pct": 55.0}, Risk("recent_concentration", {"category": "إيجار", "pct": 55.0, "months": 3})),
+    ({"anomalies": {**empty_scan(), "outliers": [OUTLIER], "outlier_count": 4}},
+        Risk("transaction_outliers", {"count": 4, "amount": 98000.0, "category": UNCATEGORIZED})),
+    ({"anomalies": {**empty_scan(), "duplicate_count": 2, "duplicate_amount": 1500.0}},
+        Risk("duplicate_payments", {"count": 2, "amount": 1500.0})),
+])
+def test_each_rule(changes, expected):
+    assert detect_risks(healthy(**changes)) == [expected]
+
+@pytest.mark.parametrize("changes", [
+    {"profit_margin": 10.0},
+    {"exp_delta": 20.0},
+    {"rev_delta": -15.0},
+    {"last_net": 0.0},
+    {"top_category_pct": 40.0},
+    {"drop_months": ["2024-02", "2024-05"]},
+    {"loss_streak": 2},
+    {"margin_slope": -1.0},
+    # Single-month ledgers: no deltas, no trend
+    {"rev_delta": None, "exp_delta": None, "last_net": None, "margin_slope": None, "top_category_pct": None},
+])
+def test_thresholds_are_exclusive(changes):
+    assert detect_risks(healthy(**changes)) == []
+
+def test_recent_concentration_defers_to_the_whole_period_rule():
+    same = healthy(top_category_pct=60.0, recent_category="رواتب", recent_category_pct=70.0)
+    assert [r.code for r in detect_risks(same)] == ["expense_concentration"]
+    # Below the whole-period threshold, the recent rule names it
+    recent = healthy(recent_category="رواتب", recent_category_pct=70.0)
+    assert [r.code for r in detect_risks(recent)] == ["recent_concentration"]
+
+def test_risks_follow_the_table_order():
+    metrics = healthy(profit_margin=5.0, last_net=-10.0, loss_streak=4, exp_delta=35.0)
+    codes = [code for code, _ in RISK_RULES]
+    found = [r.code for r in detect_risks(metrics)]
+    assert found == sorted(found, key=codes.index) == ["low_margin", "expense_spike", "last_month_loss", "loss_streak"]
+
+def test_every_rule_has_text():
+    codes = {code for code, _ in RISK_RULES}
+    assert codes == set(RISK_TEXT) == set(RECOMMENDATION_TEXT)
+
+def test_render_results():
+    metrics = healthy(exp_delta=25.0, anomalies={**empty_scan(), "outliers": [OUTLIER], "outlier_count": 1})
+    results = render_results(metrics, detect_risks(metrics))
+    assert results["risks"] == [
+        "ارتفاع حاد في المصروفات الشهرية بنسبة 25.0%",
+        f"رصد معاملات مصروفات غير اعتيادية مقارنة بمعدل بنودها (العدد: 1، أعلاها 98,000 في '{UNCATEGORIZED}')",
+    ]
+    assert len(results["recommendations"]) == 2
+
+    quiet = render_results(healthy(), [])
+    assert quiet["risks"] == ["لم يتم رصد مخاطر حرجة بناءً على البيانات الحالية."]
+    assert quiet["recommendations"] == ["الاستمرار في مراقبة الأداء المالي للحفاظ على الاستقرار."]
+
+def scan_by_loops(revenue, expenses, net, months, shares=None, categories=None):
+    """scan_history written month by month, as the reference for the vectorized passes."""
+    n = len(expenses)
+    recent_start = max(0, n - RECENT_MONTHS)
+    spikes, drops = [], []
+    for i in range(ZSCORE_WINDOW, n):
+        window = expenses[i - ZSCORE_WINDOW:i]
+        mean, std = window.mean(), window.std()
+        z = (expenses[i] - mean) / std if std > 0 else (np.inf if expenses[i] > mean else 0)
+        if z > ZSCORE_THRESHOLD and expenses[i] > mean * (1 + EXPENSE_SPIKE_PCT / 100) and i >= recent_start:
+            spikes.append(months[i].strftime("%Y-%m"))
+    for i in range(1, n):
+        change = (revenue[i] - revenue[i - 1]) / revenue[i - 1] * 100 if revenue[i - 1] > 0 else 0
+        if change < REVENUE_DROP_PCT and i >= recent_start:
+            drops.append(months[i].strftime("%Y-%m"))
+    streak = 0
+    for value in net[::-1]:
+        if value >= 0:
+            break
+        streak += 1
+
+    points = [(i, max(-100, min(100, net[i] / revenue[i] * 100))) for i in range(recent_start, n) if revenue[i] > 0]
+    slope = None
+    if len(points) >= MIN_TREND_MONTHS:
+        slope = float(np.polyfit([x for x, _ in points], [y for _, y in points], 1)[0])
+
+    recent_category, recent_pct = None, None
+    if shares is not None and n >= CONCENTRATION_MONTHS:
+        for j, category in enumerate(categories):
+            column = shares[-CONCENTRATION_MONTHS:, j]
+            if (column > CONCENTRATION_PCT).all() and (recent_pct is None or column.mean() > recent_pct):
+                recent_category, recent_pct = category, float(column.mean())
+    return spikes, drops, streak, slope, recent_category, recent_pct
+
+def scanned(history):
+    return (history["spike_months"], history["drop_months"], history["loss_streak"],
+            history["margin_slope"], history["recent_category"], history["recent_category_pct"])
+
+def test_scan_history_flags():
+    months = pd.date_range("2023-01-01", periods=14, freq="MS")
+    revenue = np.full(14, 10000.0)
+    revenue[[5, 9]] = 7000.0 # drops of 30%; the months after are rises
+    expenses = np.full(14, 6000.0)
+    expenses[10] = 9000.0 # over a flat window: off the scale
+    expenses[11:] = [11000.0, 12000.0, 13000.0]
+    net = revenue - expenses
+    shares = np.tile([60.0, 40.0], (14, 1))
+
+    history = scan_history(revenue, expenses, net, months, shares, pd.Index(["رواتب", "إيجار"]))
+    assert history["spike_months"] == ["2023-11", "2023-12"]
+    assert history["drop_months"] == ["2023-06", "2023-10"]
+    assert history["loss_streak"] == 3
+    assert history["margin_slope"] < MARGIN_SLOPE_PP and history["trend_months"] == RECENT_MONTHS
+    assert (history["recent_category"], history["recent_category_pct"]) == ("رواتب", 60.0)
+
+def test_scan_history_short_series():
+    months = pd.date_range("2024-01-01", periods=2, freq="MS")
+    history = scan_history(np.array([0.0, 100.0]), np.array([50.0, 40.0]), np.array([-50.0, 60.0]), months)
+    assert scanned(history) == ([], [], 0, None, None, None)
+    assert scan_history(np.array([]), np.array([]), np.array([]), months[:0])["loss_streak"] == 0
+
+def test_scan_history_matches_loops():
+    rng = np.random.default_rng(22)
+    categories = pd.Index(["رواتب", "إيجار", "تسويق"])
+    for _ in range(300):
+        n = int(rng.integers(1, 30))
+        months = pd.date_range("2020-01-01", periods=n, freq="MS")
+        revenue = rng.choice([0.0, 5000.0, 8000.0, 12000.0], size=n) * rng.uniform(0.8, 1.2, size=n)
+        expenses = rng.choice([4000.0, 6000.0, 6000.0, 15000.0], size=n)
+        net = revenue - expenses
+        shares = rng.dirichlet([1, 1, 1], size=n) * 100
+        expected = scan_by_loops(revenue, expenses, net, months, shares, categories)
+        actual = scanned(scan_history(revenue, expenses, net, months, shares, categories))
+        assert actual[:3] == expected[:3] and actual[4] == expected[4]
+        for got, want in ((actual[3], expected[3]), (actual[5], expected[5])):
+            assert (got is None and want is None) or got == pytest.approx(want)
@@ -0,0 +1,119 @@
+import io
+import zipfile
+
+import pytest
+from fastapi import HTTPException
+from fastapi.testclient import TestClient
+
+import main
+from utils import llm_writer
+from utils.rate_limit import MemoryRateLimiter
+from utils.workers import AnalysisPool
+
+def ledger(months: int = 3, revenue: float = 5000) -> bytes:
+    lines = ["Date,Amount,Type,Category"]
+    for month in range(1, months + 1):
+        lines.append(f"2024-{month:02d}-05,{revenue},income,Sales")
+        lines.append(f"2024-{month:02d}-20,{revenue / 2},expense,Rent")
+    return "\n".join(lines).encode()
+
+def write_zip(tmp_path, members) -> str:
+    path = tmp_path / "batch.zip"
+    with zipfile.ZipFile(path, "w") as archive:
+        for name, data in members:
+            archive.writestr(name, data)
+    return str(path)
+
+def test_extract_zip(tmp_path):
+    path = write_zip(tmp_path, [
+        ("north.csv", ledger()),
+        ("docs/", b""),
+        ("__MACOSX/._north.csv", b"x"),
+        (".hidden.csv", b"x"),
+        ("notes.txt", b"x"),
+        ("south/الجنوب.csv", ledger()),
+    ])
+    entities, extracted = main.extract_zip(path, budget=10**6)
+    try:
+        assert [(e["name"], e["file"]) for e in entities] == [("north", "north.csv"), ("notes", "notes.txt"), ("الجنوب", "south/الجنوب.csv")]
+        assert "error" in entities[1] and "path" not in entities[1]
+        assert extracted == 2 * len(ledger())
+    finally:
+        main.remove_entity_files(entities)
+
+def test_extract_zip_stops_at_the_budget(tmp_path):
+    data = ledger()
+    path = write_zip(tmp_path, [("a.csv", data), ("b.csv", data), ("c.csv", data)])
+    entities, extracted = main.extract_zip(path, budget=2 * len(data) + 10)
+    try:
+        assert ["path" in e for e in entities] == [True, True, False]
+        assert entities[2]["error"]["status"] == 400
+        assert extracted == 2 * len(data)
+    finally:
+        main.remove_entity_files(entities)
+
+def test_extract_zip_stops_counting_past_the_limit(tmp_path, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 2)
+    path = write_zip(tmp_path, [(f"{i}.csv", ledger()) for i in range(5)])
+    entities, _ = main.extract_zip(path, budget=10**6)
+    try:
+        # One past the limit, so the caller can tell the batch is too large
+        assert len(entities) == 3 and "path" not in entities[2]
+    finally:
+        main.remove_entity_files(entities)
+
+def test_extract_zip_rejects_other_files(tmp_path):
+    path = tmp_path / "batch.zip"
+    path.write_bytes(b"not a zip")
+    with pytest.raises(HTTPException) as error:
+        main.extract_zip(str(path), budget=10**6)
+    assert error.value.status_code == 400
+
+@pytest.fixture
+def client(monkeypatch):
+    """The batch endpoint with analysis in threads, no LLM and a fake PDF renderer."""
+    pool = AnalysisPool(kind="thread", workers=2)
+    monkeypatch.setattr(main, "analysis_pool", pool)
+    monkeypatch.setattr(main, "rate_limiter", MemoryRateLimiter())
+
+    async def write_executive_texts(payloads):
+        return [None] * len(payloads)
+
+    async def generate_pdfs(contexts):
+        return [f"report_{i}.pdf" for i in range(len(contexts))]
+
+    monkeypatch.setattr(llm_writer, "write_executive_texts", write_executive_texts)
+    monkeypatch.setattr(main, "generate_pdfs", generate_pdfs)
+    yield TestClient(main.app)
+    pool.shutdown()
+
+def test_batch(client, tmp_path):
+    archive = open(write_zip(tmp_path, [("south.csv", ledger(revenue=3000)), ("readme.txt", b"x")]), "rb")
+    files = [
+        ("files", ("north.csv", io.BytesIO(ledger()), "text/csv")),
+        ("files", ("branches.zip", archive, "application/zip")),
+    ]
+    with archive:
+        response = client.post("/api/batch", files=files)
+    assert response.status_code == 200
+    body = response.json()
+    assert body["counts"] == {"total": 3, "ok": 2, "failed": 1}
+    assert [(e["name"], e["status"]) for e in body["entities"]] == [("north", "ok"), ("south", "ok"), ("readme", "failed")]
+    assert body["entities"][0]["report_pdf_url"] == "/reports/report_0.pdf"
+    # Two successful entities: a consolidated report is added
+    assert body["consolidated"]["report_pdf_url"] == "/reports/report_2.pdf"
+    assert body["consolidated"]["summary"].startswith("تم توحيد بيانات 2 جهات.")
+
+def test_batch_over_the_file_limit(client, monkeypatch):
+    monkeypatch.setattr(main, "BATCH_MAX_FILES", 2)
+    files = [("files", (f"{i}.csv", io.BytesIO(ledger()), "text/csv")) for i in range(3)]
+    response = client.post("/api/batch", files=files)
+    assert response.status_code == 400
+    # The rate-limit slot is given back
+    assert main.rate_limiter.try_acquire("testclient")
+
+def test_batch_without_data_files(client):
+    response = client.post("/api/batch", files=[("files", ("notes.txt", io.BytesIO(b"x"), "text/plain"))])
+    assert response.status_code == 200
+    assert response.json()["counts"] == {"total": 1, "ok": 0, "failed": 1}
+    assert main.rate_limiter.try_acquire("testclient")
@@ -0,0 +1,70 @@
+import os
+import time
+import types
+
+import pytest
+
+from utils import cache as cache_module
+from utils.cache import TTLCache, content_hash
+
+@pytest.fixture
+def clock(monkeypatch):
+    """A controllable time.time() for utils.cache."""
+    now = types.SimpleNamespace(value=time.time())
+    monkeypatch.setattr(cache_module, "time", types.SimpleNamespace(time=lambda: now.value))
+    return now
+
+def test_content_hash():
+    assert content_hash("a", b"b") == content_hash(b"a", "b")
+    # Parts are delimited, so moving a boundary changes the hash
+    assert content_hash("ab", "c") != content_hash("a", "bc")
+
+def test_entries_expire(clock):
+    cache = TTLCache(max_entries=4, ttl=10)
+    cache.set("k", {"v": 1})
+    clock.value += 9
+    assert cache.get("k") == {"v": 1}
+    clock.value += 2
+    assert cache.get("k") is None
+    assert (cache.hits, cache.misses, cache.stats()["entries"]) == (1, 1, 0)
+
+def test_least_recently_used_is_evicted(clock):
+    cache = TTLCache(max_entries=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1 # a is now the most recently used
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert (cache.get("a"), cache.get("c")) == (1, 3)
+
+def test_delete(tmp_path):
+    cache = TTLCache(disk_dir=str(tmp_path))
+    cache.set("k", [1, 2])
+    cache.delete("k")
+    cache.delete("missing")
+    assert cache.get("k") is None and os.listdir(tmp_path) == []
+
+def test_disk_tier_survives_a_restart(tmp_path, clock):
+    first = TTLCache(max_entries=1, ttl=60, disk_dir=str(tmp_path))
+    first.set("a", {"الإيرادات": 1.5})
+    first.set("b", [1])
+    # Evicted from memory, still on disk
+    assert first.get("a") == {"الإيرادات": 1.5}
+
+    restarted = TTLCache(max_entries=4, ttl=60, disk_dir=str(tmp_path))
+    assert restarted.get("b") == [1]
+    assert restarted.stats()["entries"] == 1 # a disk hit is promoted to memory
+
+def test_disk_entries_expire(tmp_path, clock):
+    cache = TTLCache(ttl=60, disk_dir=str(tmp_path))
+    cache.set("k", 1)
+    stale = time.time() - 120
+    os.utime(tmp_path / "k.json", (stale, stale))
+    assert TTLCache(ttl=60, disk_dir=str(tmp_path)).get("k") is None
+    assert not (tmp_path / "k.json").exists()
+
+def test_unserializable_values_stay_in_memory(tmp_path):
+    cache = TTLCache(disk_dir=str(tmp_path))
+    cache.set("k", {1, 2}) # a set is not JSON
+    assert cache.get("k") == {1, 2}
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,62 @@
+"""Parity of the vectorized clean_currency / categorize_types with the per-cell versions they replaced."""
+import numpy as np
+import pandas as pd
+
+import main
+
+def clean_currency_per_cell(x):
+    if isinstance(x, (int, float)):
+        return x
+    if isinstance(x, str):
+        # Remove currency symbols, commas, spaces, LTR/RTL marks
+        clean_str = x.replace('$', '').replace('€', '').replace('£', '').replace('SAT', '').replace('ر.س', '').replace(',', '').strip()
+        try:
+            return float(clean_str)
+        except ValueError:
+            return np.nan
+    return np.nan
+
+def categorize_type_per_cell(t):
+    t = str(t).lower().strip()
+    if t in ['income', 'revenue', 'credit', 'cr', 'دخل', 'ايرادات', 'إيرادات', 'ايداع']:
+        return 'income'
+    if t in ['expense', 'cost', 'debit', 'dr', 'مصروف', 'مصروفات', 'سحب']:
+        return 'expense'
+    return 'unknown'
+
+AMOUNT_CELLS = [
+    "1,234.50", "$99", "€ 12.5", "£7", "SAT 300", "2,648 ر.س", "ر.س 15", "-50", "  42  ", "1_000", "1e3",
+    "١٢٣", "٤٥٦٫٥", "(1,234)", "(99.5)", "-(5)", "", " ", "n/a", "abc", "1.234,50", "12-", "+8",
+    None, np.nan, 17, 3.25, -4.0, "1,234.50", "$99", "",
+]
+TYPE_CELLS = [
+    "Income", " EXPENSE ", "credit", "Dr", "دخل", "إيرادات", "ايداع", "مصروف", "سحب", "transfer", "", None,
+    np.nan, 1, "Revenue", "cost ", "سحب",
+]
+
+def assert_same(actual: pd.Series, expected: list):
+    np.testing.assert_array_equal(actual.to_numpy(dtype=float), np.array(expected, dtype=float))
+
+def test_clean_currency_matches_per_cell():
+    values = pd.Series(AMOUNT_CELLS, dtype=object)
+    assert_same(main.clean_currency(values), [clean_currency_per_cell(v) for v in values])
+
+def test_clean_currency_categorical_matches_per_cell():
+    # The Arrow reader hands over text categories
+    text = [v if isinstance(v, str) else None for v in AMOUNT_CELLS]
+    assert_same(main.clean_currency(pd.Series(pd.Categorical(text))), [clean_currency_per_cell(v) for v in text])
+
+def test_clean_currency_numeric_column_passes_through():
+    values = pd.Series([1.5, -2.0, np.nan, 1e6])
+    assert_same(main.clean_currency(values), [clean_currency_per_cell(v) for v in values])
+
+def test_negatives_in_parentheses_stay_missing_as_before():
+    assert main.clean_currency(pd.Series(["(1,234)", "(99.5)"])).isna().all()
+
+def test_categorize_types_matches_per_cell():
+    values = pd.Series(TYPE_CELLS, dtype=object)
+    assert main.categorize_types(values).tolist() == [categorize_type_per_cell(v) for v in values]
+
+def test_categorize_types_categorical():
+    values = pd.Series(pd.Categorical(["Income", "سحب", None, "other", "Income"]))
+    assert main.categorize_types(values).tolist() == ["income", "expense", "unknown", "unknown", "income"]
@@ -0,0 +1,40 @@
+import warnings
+
+import pandas as pd
+
+from utils import dates
+from utils.dates import parse_dates
+
+SIGNATURE = ("date", "التاريخ", "المبلغ")
+
+def iso(parsed: pd.Series):
+    return [str(d.date()) if not pd.isna(d) else None for d in parsed]
+
+def test_cached_day_first_format_does_not_leak_into_ambiguous_upload():
+    dates._format_cache.clear()
+    cold = iso(parse_dates(pd.Series(["01/02/2024", "03/04/2024"])))
+    # An earlier upload with the same headers is unambiguously day-first
+    assert iso(parse_dates(pd.Series(["25/01/2024", "13/02/2024"]), SIGNATURE)) == ["2024-01-25", "2024-02-13"]
+    assert iso(parse_dates(pd.Series(["01/02/2024", "03/04/2024"]), SIGNATURE)) == cold == ["2024-01-02", "2024-03-04"]
+
+def test_cached_format_is_rechecked_against_the_sample():
+    dates._format_cache.clear()
+    parse_dates(pd.Series(["25/01/2024", "13/02/2024"]), SIGNATURE)
+    assert iso(parse_dates(pd.Series(["01/25/2024", "02/13/2024"]), SIGNATURE)) == ["2024-01-25", "2024-02-13"]
+
+def test_cached_format_is_reused_for_the_same_layout():
+    dates._format_cache.clear()
+    parse_dates(pd.Series(["25/01/2024", "13/02/2024"]), SIGNATURE)
+    assert iso(parse_dates(pd.Series(["14/03/2024", "05/04/2024"]), SIGNATURE)) == ["2024-03-14", "2024-04-05"]
+    assert dates._format_cache[SIGNATURE] == ("%d/%m/%Y",)
+
+def test_month_labels():
+    parsed = parse_dates(pd.Series(["Jan-24", "فبراير 2024", "2024-03", "رمضان 1445هـ", None]))
+    assert iso(parsed) == ["2024-01-01", "2024-02-01", "2024-03-01", "1445-09-01", None]
+
+def test_day_first_inference_emits_no_warning():
+    # Recorded rather than raised: pandas emits this one from Cython, which swallows exceptions
+    with warnings.catch_warnings(record=True) as caught:
+        warnings.simplefilter("always")
+        parse_dates(pd.Series(["13/02/2024", "25/01/2024", "bad value"]))
+    assert not [w for w in caught if issubclass(w.category, UserWarning)]
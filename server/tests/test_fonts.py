@@ -0,0 +1,32 @@
+import base64
+import json
+
+import pytest
+
+from utils import fonts
+
+@pytest.fixture
+def font_dir(tmp_path, monkeypatch):
+    monkeypatch.setattr(fonts, "FONT_DIR", str(tmp_path))
+    monkeypatch.setattr(fonts, "FONT_CSS_PATH", str(tmp_path / "fonts.css"))
+    return tmp_path
+
+def test_inlines_local_files(font_dir):
+    (font_dir / "a.woff2").write_bytes(b"font")
+    (font_dir / "fonts.css").write_text("@font-face { src: url(a.woff2) format('woff2'); }")
+    css = fonts.load_font_css()
+    assert f"url(data:font/woff2;base64,{base64.b64encode(b'font').decode()})" in css
+
+@pytest.mark.parametrize("css", [None, "@font-face { src: url(gone.woff2); }"])
+def test_missing_fonts_are_logged(font_dir, capsys, monkeypatch, css):
+    monkeypatch.setattr(fonts, "REPORT_FONTS_REQUIRED", False)
+    if css is not None:
+        (font_dir / "fonts.css").write_text(css)
+    assert fonts.load_font_css() == ""
+    event = json.loads(capsys.readouterr().out.strip().splitlines()[-1])
+    assert event["event"] == "report_fonts_missing"
+
+def test_missing_fonts_fail_when_required(font_dir, monkeypatch):
+    monkeypatch.setattr(fonts, "REPORT_FONTS_REQUIRED", True)
+    with pytest.raises(fonts.FontsMissing):
+        fonts.load_font_css()
@@ -0,0 +1,59 @@
+import asyncio
+
+import pytest
+
+import main
+from utils.jobs import JobStore
+from utils.rate_limit import MemoryRateLimiter
+
+def test_job_visible_from_another_connection(tmp_path):
+    path = str(tmp_path / "jobs.db")
+    accepting, polling = JobStore(path), JobStore(path)
+    job = accepting.create()
+    assert polling.get(job.id).status == "queued"
+
+    job.update(status="running", stage="llm", result={"kpis": {"الإيرادات": 1.5}})
+    seen = polling.get(job.id)
+    assert (seen.status, seen.stage, seen.result) == ("running", "llm", {"kpis": {"الإيرادات": 1.5}})
+
+    job.update(status="failed", error={"status": 503, "detail": "busy"})
+    assert polling.get(job.id).to_dict() == job.to_dict()
+    assert polling.stats() == {"failed": 1}
+
+def test_jobs_expire(tmp_path):
+    store = JobStore(str(tmp_path / "jobs.db"), ttl=0.05)
+    job = store.create()
+    job.update(status="done")
+    assert store.get(job.id) is not None
+    job.updated -= 1
+    store.save(job)
+    assert store.get(job.id) is None
+    store.create()
+    assert store.stats() == {"queued": 1}
+
+def test_unknown_job(tmp_path):
+    assert JobStore(str(tmp_path / "jobs.db")).get("missing") is None
+
+def test_cancelled_job_fails_and_frees_the_slot(tmp_path, monkeypatch):
+    limiter = MemoryRateLimiter()
+    monkeypatch.setattr(main, "rate_limiter", limiter)
+
+    async def run_pipeline(*args, **kwargs):
+        await asyncio.sleep(60)
+
+    monkeypatch.setattr(main, "run_pipeline", run_pipeline)
+    store = JobStore(str(tmp_path / "jobs.db"))
+    job = store.create()
+    assert limiter.try_acquire("1.2.3.4")
+
+    async def scenario():
+        task = asyncio.ensure_future(main.run_job(job, "upload.csv", "upload.csv", "key", {}, "1.2.3.4", False))
+        await asyncio.sleep(0.01)
+        task.cancel() # as on server shutdown
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    asyncio.run(scenario())
+    stored = store.get(job.id)
+    assert (stored.status, stored.error["status"]) == ("failed", 503)
+    assert limiter.usage("1.2.3.4") == 0
@@ -0,0 +1,65 @@
+import asyncio
+import json
+import types
+
+import pytest
+
+from utils import llm_writer
+from utils.cache import TTLCache
+
+class FakeCompletions:
+    """chat.completions.create returning a fixed rewrite after a short delay, counting the calls."""
+
+    def __init__(self, delay: float = 0.05):
+        self.delay = delay
+        self.calls = []
+
+    async def create(self, **kwargs):
+        self.calls.append(kwargs)
+        await asyncio.sleep(self.delay)
+        content = json.dumps({"executive_summary": "ملخص تنفيذي", "executive_recommendations": ["توصية"]})
+        return types.SimpleNamespace(choices=[types.SimpleNamespace(message=types.SimpleNamespace(content=content))])
+
+@pytest.fixture
+def completions(monkeypatch):
+    fake = FakeCompletions()
+    monkeypatch.setattr(llm_writer, "client", types.SimpleNamespace(chat=types.SimpleNamespace(completions=fake)))
+    monkeypatch.setattr(llm_writer, "llm_cache", TTLCache(max_entries=16, ttl=60))
+    monkeypatch.setattr(llm_writer, "_inflight", {})
+    return fake
+
+PAYLOAD = {"summary": "مسودة", "kpis": [], "risks": [], "recommendations": ["راقب المصروفات"]}
+
+def test_concurrent_identical_requests_share_one_call(completions):
+    async def scenario():
+        results = await asyncio.gather(*(llm_writer.write_executive_text(dict(PAYLOAD)) for _ in range(5)))
+        # Later identical requests are answered from the cache
+        return results, await llm_writer.write_executive_text(dict(reversed(list(PAYLOAD.items()))))
+
+    results, cached = asyncio.run(scenario())
+    assert len(completions.calls) == 1
+    assert all(r == results[0] for r in results) and cached == results[0]
+    assert results[0]["executive_summary"] == "ملخص تنفيذي"
+    assert llm_writer._inflight == {}
+
+def test_different_payloads_are_not_coalesced(completions):
+    async def scenario():
+        return await asyncio.gather(
+            llm_writer.write_executive_text(PAYLOAD),
+            llm_writer.write_executive_text({**PAYLOAD, "summary": "مسودة أخرى"}),
+        )
+
+    asyncio.run(scenario())
+    assert len(completions.calls) == 2
+
+def test_abandoned_caller_does_not_cancel_the_shared_call(completions):
+    async def scenario():
+        impatient = asyncio.ensure_future(llm_writer.write_executive_text(PAYLOAD))
+        patient = asyncio.ensure_future(llm_writer.write_executive_text(PAYLOAD))
+        await asyncio.sleep(0.01)
+        impatient.cancel()
+        return await patient
+
+    result = asyncio.run(scenario())
+    assert result["executive_recommendations"] == ["توصية"]
+    assert len(completions.calls) == 1
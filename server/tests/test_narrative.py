@@ -0,0 +1,67 @@
+import asyncio
+
+import pytest
+
+import main
+from utils import llm_writer
+
+REWRITE = {"executive_summary": "ملخص الإدارة", "executive_recommendations": ["خفض التكاليف"]}
+
+def draft_response():
+    return {
+        "summary": "ملخص آلي",
+        "kpis": [],
+        "risks": [],
+        "recommendations": ["راقب المصروفات"],
+        "anomalies": [],
+        "narrative_source": "deterministic",
+    }
+
+@pytest.fixture
+def renders(monkeypatch):
+    """Replaces PDF rendering; returns the summaries that were rendered."""
+    rendered = []
+
+    async def render_report(context):
+        rendered.append(context["summary"])
+        await asyncio.sleep(0.01)
+        return f"report_{len(rendered)}.pdf"
+
+    monkeypatch.setattr(main, "render_report", render_report)
+    monkeypatch.setattr(main, "LLM_DEADLINE", 0.1)
+    return rendered
+
+def llm_answering_after(monkeypatch, delay: float):
+    async def write_executive_text(payload):
+        await asyncio.sleep(delay)
+        return REWRITE
+
+    monkeypatch.setattr(llm_writer, "write_executive_text", write_executive_text)
+
+def test_draft_is_used_when_the_deadline_passes(monkeypatch, renders):
+    llm_answering_after(monkeypatch, 5)
+    response, timings, progress = draft_response(), {}, []
+
+    async def scenario():
+        started = asyncio.get_running_loop().time()
+        in_time = await main.write_report_budgeted(response, timings, lambda stage, partial: progress.append(stage))
+        return in_time, asyncio.get_running_loop().time() - started
+
+    in_time, elapsed = asyncio.run(scenario())
+    assert not in_time and elapsed < 1
+    assert response["narrative_source"] == "deterministic" and response["summary"] == "ملخص آلي"
+    assert renders == ["ملخص آلي"] # only the draft PDF
+    assert response["report_pdf_url"] == "/reports/report_1.pdf"
+    assert progress == ["pdf"] and timings["llm"] >= 100
+
+def test_rewrite_within_the_deadline_replaces_the_draft(monkeypatch, renders):
+    llm_answering_after(monkeypatch, 0.01)
+    response = draft_response()
+
+    in_time = asyncio.run(main.write_report_budgeted(response, {}))
+    assert in_time
+    assert response["narrative_source"] == "llm" and response["summary"] == "ملخص الإدارة"
+    assert response["recommendations"] == ["خفض التكاليف"]
+    # The draft render started alongside the LLM; the final report is the rewritten one
+    assert renders == ["ملخص آلي", "ملخص الإدارة"]
+    assert response["report_pdf_url"] == "/reports/report_2.pdf"
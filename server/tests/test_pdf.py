@@ -0,0 +1,189 @@
+import asyncio
+import os
+import time
+
+import pytest
+
+from utils import pdf
+from utils.pdf import RendererBusy, RendererPool, ReportCache, report_key
+from utils.storage import LocalReportStore
+
+class FakeContext:
+    def __init__(self, browser):
+        self.browser = browser
+        self.closed = False
+
+    async def route(self, pattern, handler):
+        self.routed = pattern
+
+    async def new_page(self):
+        self.browser.opened += 1
+        return FakePage(self, self.browser.opened)
+
+    async def close(self):
+        self.closed = True
+
+class FakePage:
+    def __init__(self, context, number):
+        self.context = context
+        self.number = number
+        self.crashed = False
+
+class FakeBrowser:
+    def __init__(self):
+        self.opened = 0
+
+    def is_connected(self):
+        return True
+
+    async def new_context(self):
+        return FakeContext(self)
+
+@pytest.fixture
+def printed(monkeypatch):
+    """Replaces Chromium's print with a fake; returns the (page number, output path) of every print."""
+    calls = []
+
+    async def print_page(page, html, output_path):
+        await asyncio.sleep(0.01)
+        if page.crashed:
+            raise RuntimeError("Target crashed")
+        calls.append((page.number, output_path))
+
+    monkeypatch.setattr(pdf, "print_page", print_page)
+    return calls
+
+async def started(size=2, queue_limit=16) -> RendererPool:
+    pool = RendererPool(size=size, queue_limit=queue_limit)
+    pool._browser = FakeBrowser()
+    pool._pages = asyncio.Queue()
+    for _ in range(pool.size):
+        pool._pages.put_nowait(await pool._new_page())
+    return pool
+
+def test_pages_are_reused(printed):
+    async def scenario():
+        pool = await started(size=2)
+        for i in range(3):
+            await pool.render("<html></html>", f"out{i}.pdf")
+        await asyncio.gather(*(pool.render("<html></html>", f"batch{i}.pdf") for i in range(6)))
+        return pool
+
+    pool = asyncio.run(scenario())
+    assert len(printed) == 9
+    assert {number for number, _ in printed} == {1, 2} # never more pages than the pool size
+    assert pool._browser.opened == 2
+    assert pool.health()["rendered"] == 9 and pool.health()["idle"] == 2
+
+def test_crashed_page_is_replaced(printed):
+    async def scenario():
+        pool = await started(size=2)
+        crashed = pool._pages._queue[0]
+        crashed.crashed = True
+        with pytest.raises(RuntimeError):
+            await pool.render("<html></html>", "broken.pdf")
+        for i in range(4):
+            await pool.render("<html></html>", f"out{i}.pdf")
+        return pool, crashed
+
+    pool, crashed = asyncio.run(scenario())
+    assert crashed.context.closed
+    assert pool._browser.opened == 3
+    assert 1 not in {number for number, _ in printed} # the crashed page is never used again
+    health = pool.health()
+    assert (health["failed"], health["rendered"], health["idle"]) == (1, 4, 2)
+
+def test_full_queue_is_rejected(printed):
+    async def scenario():
+        pool = await started(size=1, queue_limit=1)
+        first = asyncio.ensure_future(pool.render("<html></html>", "a.pdf"))
+        waiting = asyncio.ensure_future(pool.render("<html></html>", "b.pdf"))
+        await asyncio.sleep(0) # both are now inside render(): one printing, one waiting for the page
+        with pytest.raises(RendererBusy):
+            await pool.render("<html></html>", "c.pdf")
+        await asyncio.gather(first, waiting)
+
+    asyncio.run(scenario())
+    assert [path for _, path in printed] == ["a.pdf", "b.pdf"]
+
+REPORT = {
+    "summary": "ملخص",
+    "kpis": [{"label": "الإيرادات", "value": 1500.0}],
+    "risks": [],
+    "recommendations": ["راقب المصروفات"],
+    "anomalies": [],
+    "timestamp": "2026-01-01 10:00",
+}
+
+def test_report_key_is_stable():
+    key = report_key(REPORT)
+    assert report_key(dict(reversed(list(REPORT.items())))) == key # key order does not matter
+    assert report_key({**REPORT, "timestamp": "2026-02-02 12:00"}) == key # the render time is not content
+    assert report_key({k: v for k, v in REPORT.items() if k != "timestamp"}) == key
+    assert report_key({**REPORT, "summary": "ملخص آخر"}) != key
+    assert ReportCache.filename_for(key) == f"report_{key[:32]}.pdf"
+
+def test_report_key_follows_the_template(monkeypatch):
+    key = report_key(REPORT)
+    monkeypatch.setattr(pdf, "TEMPLATE_VERSION", "another-layout")
+    assert report_key(REPORT) != key
+
+def store_report(store: LocalReportStore, tmp_path, name: str, size: int, age: float):
+    source = tmp_path / f"{name}.tmp"
+    source.write_bytes(b"x" * size)
+    store.put(name, str(source))
+    used = time.time() - age
+    os.utime(os.path.join(store.directory, name), (used, used))
+
+def test_lookup_counts_hits_and_misses(tmp_path):
+    cache = ReportCache(LocalReportStore(str(tmp_path / "reports")), max_bytes=10**6, max_age=3600)
+    key = report_key(REPORT)
+    assert cache.lookup(key) is None
+    store_report(cache.store, tmp_path, cache.filename_for(key), 10, age=600)
+    assert cache.lookup(key) == cache.filename_for(key)
+    assert time.time() - cache.store.stat(cache.filename_for(key)).last_used < 60 # a hit marks it recently used
+    assert cache.stats() == {"hits": 1, "misses": 1, "evicted": 0}
+
+def test_eviction_by_age_then_size(tmp_path):
+    cache = ReportCache(LocalReportStore(str(tmp_path / "reports")), max_bytes=250, max_age=3600)
+    store_report(cache.store, tmp_path, "report_expired.pdf", 10, age=7200)
+    store_report(cache.store, tmp_path, "report_old.pdf", 100, age=300)
+    store_report(cache.store, tmp_path, "report_mid.pdf", 100, age=200)
+    store_report(cache.store, tmp_path, "report_new.pdf", 100, age=100)
+
+    cache.evict()
+    # The expired report goes, then the least recently used until the total fits in max_bytes
+    assert sorted(o.name for o in cache.store.list()) == ["report_mid.pdf", "report_new.pdf"]
+    assert cache.evicted == 2
+
+def test_maybe_evict_is_rate_limited(tmp_path):
+    cache = ReportCache(LocalReportStore(str(tmp_path / "reports")), max_bytes=0, max_age=3600)
+    cache.maybe_evict()
+    store_report(cache.store, tmp_path, "report_a.pdf", 10, age=0)
+    cache.maybe_evict() # within EVICT_INTERVAL of the last scan
+    assert [o.name for o in cache.store.list()] == ["report_a.pdf"]
+    cache._last_evict -= ReportCache.EVICT_INTERVAL
+    cache.maybe_evict()
+    assert cache.store.list() == []
+
+def test_identical_reports_render_once(tmp_path, monkeypatch):
+    cache = ReportCache(LocalReportStore(str(tmp_path / "reports")), max_bytes=10**6, max_age=3600)
+    monkeypatch.setattr(pdf, "report_cache", cache)
+    renders = []
+
+    async def render_pdf(context_data, filename):
+        renders.append(filename)
+        await asyncio.sleep(0.05)
+        source = tmp_path / "render.tmp"
+        source.write_bytes(b"%PDF")
+        cache.store.put(filename, str(source))
+
+    monkeypatch.setattr(pdf, "_render_pdf", render_pdf)
+
+    async def scenario():
+        concurrent = await asyncio.gather(*(pdf.generate_pdf({**REPORT, "timestamp": str(i)}) for i in range(4)))
+        return concurrent, await pdf.generate_pdf(REPORT)
+
+    concurrent, later = asyncio.run(scenario())
+    assert renders == [cache.filename_for(report_key(REPORT))]
+    assert set(concurrent) == {later} == {renders[0]}
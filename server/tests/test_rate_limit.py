@@ -0,0 +1,95 @@
+"""The SQLite limiter under contention: many connections, threads and processes racing for one IP's quota."""
+import multiprocessing
+import threading
+
+import pytest
+
+from utils import rate_limit
+from utils.rate_limit import MemoryRateLimiter, RateLimiter, SQLiteRateLimiter
+
+LIMIT = 25
+ATTEMPTS = 40
+
+def hammer(path, limit, attempts, barrier, results):
+    """One process: its own connection, `attempts` acquisitions for the same IP once everyone is ready."""
+    rate_limit.UPLOAD_DAILY_LIMIT = limit
+    limiter = SQLiteRateLimiter(path)
+    barrier.wait()
+    results.put(sum(limiter.try_acquire("10.0.0.1") for _ in range(attempts)))
+
+@pytest.fixture
+def limit(monkeypatch):
+    monkeypatch.setattr(rate_limit, "UPLOAD_DAILY_LIMIT", LIMIT)
+    return LIMIT
+
+def test_processes_never_exceed_the_limit(tmp_path, limit):
+    ctx = multiprocessing.get_context("spawn")
+    path = str(tmp_path / "usage.db")
+    SQLiteRateLimiter(path) # create the schema before the race
+    barrier, results = ctx.Barrier(6), ctx.Queue()
+    processes = [ctx.Process(target=hammer, args=(path, limit, ATTEMPTS, barrier, results)) for _ in range(6)]
+    for p in processes:
+        p.start()
+    granted = sum(results.get(timeout=60) for _ in processes)
+    for p in processes:
+        p.join(timeout=30)
+        assert p.exitcode == 0
+    assert granted == limit
+    assert SQLiteRateLimiter(path).usage("10.0.0.1") == limit
+
+@pytest.mark.parametrize("shared", [True, False])
+def test_threads_never_exceed_the_limit(tmp_path, limit, shared):
+    path = str(tmp_path / "usage.db")
+    common = SQLiteRateLimiter(path)
+    barrier, granted, lock = threading.Barrier(8), [], threading.Lock()
+
+    def worker():
+        limiter = common if shared else SQLiteRateLimiter(path)
+        barrier.wait()
+        count = sum(limiter.try_acquire("10.0.0.2") for _ in range(ATTEMPTS))
+        with lock:
+            granted.append(count)
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(granted) == limit
+    assert common.usage("10.0.0.2") == limit
+
+def test_released_slots_are_reusable_under_contention(tmp_path, limit):
+    limiter = SQLiteRateLimiter(str(tmp_path / "usage.db"))
+    barrier, lock, held = threading.Barrier(8), threading.Lock(), [0]
+
+    def worker():
+        barrier.wait()
+        for i in range(ATTEMPTS):
+            if limiter.try_acquire("10.0.0.3"):
+                if i % 2:
+                    limiter.release("10.0.0.3") # failed analysis: slot given back
+                else:
+                    with lock:
+                        held[0] += 1
+
+    threads = [threading.Thread(target=worker) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert held[0] <= limit
+    assert limiter.usage("10.0.0.3") == held[0]
+
+def test_memory_limiter_threads(limit):
+    limiter = MemoryRateLimiter()
+    granted = []
+    threads = [threading.Thread(target=lambda: granted.append(sum(limiter.try_acquire("ip") for _ in range(ATTEMPTS)))) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(granted) == limit
+
+def test_rate_limiter_is_abstract():
+    with pytest.raises(TypeError):
+        RateLimiter()
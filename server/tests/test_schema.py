@@ -0,0 +1,85 @@
+import random
+
+import pytest
+
+from utils.schema import match_columns
+
+# The detection and mapping functions the registry replaced, kept as the reference it must agree with
+LEGACY_TRANSACTIONS = {
+    'date': ['date', 'datetime', 'timestamp', 'التاريخ', 'الوقت', 'day'],
+    'amount': ['amount', 'value', 'cost', 'price', 'المبلغ', 'القيمة', 'السعر', 'total'],
+    'type': ['type', 'kind', 'direction', 'النوع', 'الحالة', 'category_type'],
+    'category': ['category', 'cat', 'description', 'desc', 'الفئة', 'التصنيف', 'البند'],
+}
+LEGACY_MONTH = ['month', 'period', 'الشهر', 'شهر', 'الفترة']
+LEGACY_REVENUE = ['revenue', 'sales', 'income', 'الإيرادات', 'المبيعات', 'الدخل', 'rev']
+LEGACY_EXPENSES = ['expenses', 'opex', 'costs', 'cost', 'المصروفات', 'التكاليف', 'المصاريف', 'exp']
+
+def legacy_detect_schema(columns) -> str:
+    cols = [c.lower().strip() for c in columns]
+    has_month = any(k in c for c in cols for k in LEGACY_MONTH)
+    has_rev = any(k in c for c in cols for k in LEGACY_REVENUE)
+    has_exp = any(k in c for c in cols for k in LEGACY_EXPENSES)
+    return 'pnl' if has_month and has_rev and has_exp else 'transactions'
+
+def legacy_transaction_column_map(columns):
+    rename_dict = {}
+    for std_col, synonyms in LEGACY_TRANSACTIONS.items():
+        for col in columns:
+            if col.lower().strip() in synonyms:
+                rename_dict[col] = std_col
+                break
+    return rename_dict
+
+def legacy_pnl_column_map(columns):
+    rename_map = {}
+    for col in columns:
+        c_lower = col.lower().strip()
+        if any(k in c_lower for k in LEGACY_MONTH) and 'month' not in rename_map.values():
+            rename_map[col] = 'month'
+        elif any(k in c_lower for k in LEGACY_REVENUE) and 'revenue' not in rename_map.values():
+            rename_map[col] = 'revenue'
+        elif any(k in c_lower for k in LEGACY_EXPENSES) and 'expenses' not in rename_map.values():
+            rename_map[col] = 'expenses'
+    return rename_map
+
+def legacy(columns):
+    schema = legacy_detect_schema(columns)
+    mapping = legacy_pnl_column_map(columns) if schema == 'pnl' else legacy_transaction_column_map(columns)
+    return schema, mapping
+
+@pytest.mark.parametrize("columns", [
+    ["Date", "Amount", "Type", "Category"],
+    [" DATE ", "Value", "Kind", "Description"],
+    ["التاريخ", "المبلغ", "النوع", "الفئة"],
+    ["الوقت", "القيمة", "الحالة", "البند", "ملاحظات"],
+    ["Timestamp", "Price", "Total", "Cat", "Desc"], # repeated keys: the first header wins
+    ["Month", "Revenue", "Expenses"],
+    ["Period", "Total Sales", "OPEX (SAR)"],
+    ["الشهر", "الإيرادات", "المصروفات"],
+    ["الفترة", "المبيعات الشهرية", "التكاليف التشغيلية", "صافي"],
+    ["Month", "Revenue"], # no expenses: not a P&L
+    ["date", "cost", "income"], # 'cost' is an amount, and there is no month: transactions
+    ["Monthly Revenue", "Monthly Expenses", "Period"], # one header holds two P&L keys
+    ["Notes", "Reference"],
+    [],
+])
+def test_registry_matches_legacy_detection(columns):
+    match = match_columns(columns)
+    assert (match.analysis, match.columns) == legacy(columns)
+
+def test_registry_matches_legacy_on_random_headers():
+    synonyms = sorted({s for values in LEGACY_TRANSACTIONS.values() for s in values}
+                      | set(LEGACY_MONTH) | set(LEGACY_REVENUE) | set(LEGACY_EXPENSES))
+    decorations = ["{}", "{} ", " {}", "{}:", "Total {}", "{} (SAR)", "{}_2024", "ال{}"]
+    rng = random.Random(18)
+    for _ in range(2000):
+        columns = []
+        for _ in range(rng.randint(1, 6)):
+            header = rng.choice(decorations).format(rng.choice(synonyms + ["notes", "id", "ملاحظات"]))
+            if rng.random() < 0.3:
+                header = header.upper()
+            if header not in columns:
+                columns.append(header)
+        match = match_columns(columns)
+        assert (match.analysis, match.columns) == legacy(columns), columns
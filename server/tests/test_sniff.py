@@ -0,0 +1,40 @@
+import main
+from utils.sniff import sniff_csv
+
+def write(tmp_path, name, text, encoding="utf-8"):
+    path = tmp_path / name
+    path.write_bytes(text.encode(encoding))
+    return str(path)
+
+def test_semicolon_comma_decimal_keeps_dotted_dates(tmp_path):
+    path = write(tmp_path, "erp.csv", (
+        "كشف حساب\n"
+        "التاريخ;المبلغ;النوع;التصنيف\n"
+        "12.03.2024;1.234,50;ايداع;مبيعات\n"
+        "15.03.2024;250,75;سحب;تسويق\n"
+        "02.04.2024;\"12.000,00 ر.س\";ايداع;مبيعات\n"
+    ), encoding="cp1256")
+    dialect = main.sniff_upload(path)
+    assert (dialect.encoding, dialect.sep, dialect.decimal, dialect.skiprows) == ("cp1256", ";", ",", 1)
+
+    df, schema = main.parse_data(path, "erp.csv")
+    assert schema == "transactions"
+    assert df["amount"].tolist() == [1234.5, 250.75, 12000.0]
+    assert [str(d.date()) for d in df["date"]] == ["2024-03-12", "2024-03-15", "2024-04-02"]
+
+def test_pnl_month_cells_do_not_vote_on_decimal(tmp_path):
+    # Every month cell looks like a dot-decimal number; only revenue/expenses may decide
+    path = write(tmp_path, "pnl.csv", (
+        "Month;Revenue;Expenses\n"
+        "01.2024;1.000,5;800\n"
+        "02.2024;1.200,25;900\n"
+        "03.2024;1.100;850\n"
+    ))
+    assert main.sniff_upload(path).decimal == ","
+    df, schema = main.parse_data(path, "pnl.csv")
+    assert schema == "pnl"
+    assert df["revenue"].tolist() == [1000.5, 1200.25, 1100.0]
+
+def test_without_header_decimal_defaults_to_dot(tmp_path):
+    path = write(tmp_path, "x.csv", "a;b\n1,5;2,5\n")
+    assert sniff_csv(path, amount_columns=lambda cells: None).decimal == "."
@@ -0,0 +1,196 @@
+import io
+import os
+from datetime import datetime, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+import main
+from utils.storage import LocalReportStore, ReportStore, S3ReportStore, etag_matches, parse_range
+
+PDF = bytes(range(256)) * 40 # 10240 bytes
+
+@pytest.mark.parametrize("header, expected", [
+    (None, None),
+    ("bytes=0-99", (0, 99)),
+    ("bytes=100-", (100, 10239)),
+    ("bytes=-100", (10140, 10239)),
+    ("bytes=-20000", (0, 10239)),
+    ("bytes=10000-99999", (10000, 10239)),
+    ("bytes=5-3", None), # last before first: invalid, ignored
+    ("bytes=0-1,5-9", None), # multi-range: whole file
+    ("items=0-9", None),
+    ("bytes=-", None),
+])
+def test_parse_range(header, expected):
+    assert parse_range(header, len(PDF)) == expected
+
+@pytest.mark.parametrize("header", ["bytes=10240-", "bytes=-0"])
+def test_parse_range_unsatisfiable(header):
+    with pytest.raises(ValueError):
+        parse_range(header, len(PDF))
+
+def test_etag_matches():
+    etag = '"abc"'
+    assert etag_matches('"abc"', etag)
+    assert etag_matches('"x", W/"abc"', etag)
+    assert etag_matches("*", etag)
+    assert not etag_matches('"abd"', etag)
+    assert not etag_matches(None, etag)
+    # If-Range: strong comparison only
+    assert etag_matches('"abc"', etag, weak=False)
+    assert not etag_matches('W/"abc"', etag, weak=False)
+    assert not etag_matches("*", etag, weak=False)
+
+def test_report_store_is_abstract():
+    with pytest.raises(TypeError):
+        ReportStore()
+
+def write_source(tmp_path, data=PDF) -> str:
+    path = tmp_path / "source.tmp"
+    path.write_bytes(data)
+    return str(path)
+
+def test_local_store(tmp_path):
+    store = LocalReportStore(str(tmp_path / "reports"))
+    assert store.stat("report_a.pdf") is None and not store.touch("report_a.pdf")
+
+    source = write_source(tmp_path)
+    store.put("report_a.pdf", source)
+    assert not os.path.exists(source)
+    info = store.stat("report_a.pdf")
+    assert info.size == len(PDF)
+    assert b"".join(store.read("report_a.pdf")) == PDF
+    assert b"".join(store.read("report_a.pdf", 10, 19)) == PDF[10:20]
+
+    # touch() keeps the etag; replacing the bytes changes it
+    assert store.touch("report_a.pdf") and store.stat("report_a.pdf").etag == info.etag
+    store.put("report_a.pdf", write_source(tmp_path, PDF[:100]))
+    assert store.stat("report_a.pdf").etag != info.etag
+
+    (tmp_path / "reports" / "notes.txt").write_text("not a report")
+    assert [o.name for o in store.list()] == ["report_a.pdf"]
+    store.delete("report_a.pdf")
+    store.delete("report_a.pdf") # already gone
+    assert store.list() == []
+
+class MissingKey(Exception):
+    response = {"Error": {"Code": "404"}}
+
+class FakeBody:
+    def __init__(self, data: bytes):
+        self._data = io.BytesIO(data)
+        self.closed = False
+
+    def iter_chunks(self, size: int):
+        while chunk := self._data.read(size):
+            yield chunk
+
+    def close(self):
+        self.closed = True
+
+class FakeS3:
+    """The boto3 client calls S3ReportStore makes, over a dict."""
+
+    def __init__(self):
+        self.objects = {}
+        self.versions = 0
+
+    def head_object(self, Bucket, Key):
+        if (Bucket, Key) not in self.objects:
+            raise MissingKey()
+        data, etag, modified = self.objects[(Bucket, Key)]
+        return {"ContentLength": len(data), "ETag": f'"{etag}"', "LastModified": modified}
+
+    def upload_file(self, path, bucket, key, ExtraArgs=None):
+        assert ExtraArgs == {"ContentType": "application/pdf"}
+        with open(path, "rb") as f:
+            self.versions += 1
+            self.objects[(bucket, key)] = (f.read(), f"v{self.versions}", datetime.now(timezone.utc))
+
+    def get_object(self, Bucket, Key, Range):
+        data = self.objects[(Bucket, Key)][0]
+        first, last = Range.removeprefix("bytes=").split("-")
+        return {"Body": FakeBody(data[int(first):int(last) + 1 if last else None])}
+
+    def delete_object(self, Bucket, Key):
+        self.objects.pop((Bucket, Key), None)
+
+    def get_paginator(self, operation):
+        assert operation == "list_objects_v2"
+        client = self
+
+        class Paginator:
+            def paginate(self, Bucket, Prefix):
+                contents = [
+                    {"Key": key, "Size": len(data), "ETag": f'"{etag}"', "LastModified": modified}
+                    for (bucket, key), (data, etag, modified) in client.objects.items()
+                    if bucket == Bucket and key.startswith(Prefix)
+                ]
+                return [{"Contents": contents[:1]}, {"Contents": contents[1:]}]
+
+        return Paginator()
+
+def test_s3_store(tmp_path):
+    client = FakeS3()
+    store = S3ReportStore(bucket="bucket", prefix="reports/", client=client)
+    assert store.stat("report_a.pdf") is None and not store.touch("report_a.pdf")
+
+    source = write_source(tmp_path)
+    store.put("report_a.pdf", source)
+    assert not os.path.exists(source)
+    assert ("bucket", "reports/report_a.pdf") in client.objects
+    info = store.stat("report_a.pdf")
+    assert (info.size, info.etag) == (len(PDF), "v1")
+    assert store.touch("report_a.pdf")
+    assert b"".join(store.read("report_a.pdf")) == PDF
+    assert b"".join(store.read("report_a.pdf", 100, 199)) == PDF[100:200]
+
+    store.put("report_b.pdf", write_source(tmp_path, b"%PDF"))
+    client.objects[("bucket", "reports/other.txt")] = (b"x", "v9", datetime.now(timezone.utc))
+    client.objects[("bucket", "elsewhere/report_c.pdf")] = (b"x", "v9", datetime.now(timezone.utc))
+    assert sorted(o.name for o in store.list()) == ["report_a.pdf", "report_b.pdf"]
+    store.delete("report_a.pdf")
+    assert store.stat("report_a.pdf") is None
+
+def test_s3_store_requires_bucket():
+    with pytest.raises(ValueError):
+        S3ReportStore(bucket="", client=FakeS3())
+
+@pytest.fixture
+def served(tmp_path, monkeypatch):
+    store = LocalReportStore(str(tmp_path / "reports"))
+    store.put("report_test.pdf", write_source(tmp_path))
+    monkeypatch.setattr(main.report_cache, "store", store)
+    return TestClient(main.app), f'"{store.stat("report_test.pdf").etag}"'
+
+def test_report_download(served):
+    client, etag = served
+    response = client.get("/reports/report_test.pdf")
+    assert response.status_code == 200 and response.content == PDF
+    assert response.headers["etag"] == etag and response.headers["accept-ranges"] == "bytes"
+
+    assert client.get("/reports/report_test.pdf", headers={"If-None-Match": etag}).status_code == 304
+    assert client.get("/reports/report_test.pdf", headers={"If-None-Match": f"W/{etag}"}).status_code == 304
+    assert client.get("/reports/report_missing.pdf").status_code == 404
+    assert client.get("/reports/..%2Fmain.py").status_code == 404
+
+def test_report_ranges(served):
+    client, etag = served
+    partial = client.get("/reports/report_test.pdf", headers={"Range": "bytes=100-199"})
+    assert partial.status_code == 206 and partial.content == PDF[100:200]
+    assert partial.headers["content-range"] == f"bytes 100-199/{len(PDF)}"
+
+    unsatisfiable = client.get("/reports/report_test.pdf", headers={"Range": f"bytes={len(PDF)}-"})
+    assert unsatisfiable.status_code == 416
+    assert unsatisfiable.headers["content-range"] == f"bytes */{len(PDF)}"
+
+    # Invalid range syntax is ignored
+    assert client.get("/reports/report_test.pdf", headers={"Range": "bytes=5-3"}).status_code == 200
+
+    # If-Range: the range applies only while the strong etag still matches
+    resumed = client.get("/reports/report_test.pdf", headers={"Range": "bytes=10-", "If-Range": etag})
+    assert resumed.status_code == 206 and resumed.content == PDF[10:]
+    for stale in ('"changed"', f"W/{etag}", "Wed, 21 Oct 2015 07:28:00 GMT"):
+        whole = client.get("/reports/report_test.pdf", headers={"Range": "bytes=10-", "If-Range": stale})
+        assert whole.status_code == 200 and whole.content == PDF
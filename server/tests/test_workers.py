@@ -0,0 +1,72 @@
+import asyncio
+import os
+import signal
+import time
+
+import pytest
+
+from utils.timing import log_event, request_id_var
+from utils.workers import AnalysisPool, PoolBroken, PoolSaturated
+
+def square(x):
+    return x * x
+
+def logged_request_id():
+    log_event("worker_event")
+    return request_id_var.get()
+
+def die():
+    os.kill(os.getpid(), signal.SIGKILL)
+
+def die_once(marker):
+    """Kills its worker the first time (as an OOM kill would), succeeds on the retry."""
+    if not os.path.exists(marker):
+        open(marker, "w").close()
+        die()
+    return "ok"
+
+@pytest.fixture
+def pool():
+    pool = AnalysisPool(kind="process", workers=1, queue_limit=2)
+    yield pool
+    pool.shutdown()
+
+def test_worker_killed_while_idle_is_replaced(pool):
+    pool.start()
+    executor = pool._executor
+    for process in list(executor._processes.values()):
+        process.kill()
+    deadline = time.monotonic() + 10
+    while not executor._broken and time.monotonic() < deadline:
+        time.sleep(0.05)
+    assert executor._broken
+
+    assert asyncio.run(pool.run(square, 7)) == 49
+    assert pool.restarts == 1
+
+def test_job_is_retried_once_after_worker_death(pool, tmp_path):
+    assert asyncio.run(pool.run(die_once, str(tmp_path / "marker"))) == "ok"
+    assert pool.restarts == 1
+
+def test_job_breaking_the_new_pool_too_gives_503(pool):
+    with pytest.raises(PoolBroken):
+        asyncio.run(pool.run(die))
+    assert issubclass(PoolBroken, PoolSaturated) # answered 503 by main
+    assert pool.restarts == 2
+    # The pool still serves the next upload
+    assert asyncio.run(pool.run(square, 3)) == 9
+    assert pool.health()["restarts"] == 2
+
+@pytest.mark.parametrize("kind", ["process", "thread"])
+def test_request_id_reaches_the_worker(kind, capfd):
+    pool = AnalysisPool(kind=kind, workers=1)
+
+    async def scenario():
+        request_id_var.set("req-123")
+        return await pool.run(logged_request_id)
+
+    try:
+        assert asyncio.run(scenario()) == "req-123"
+    finally:
+        pool.shutdown()
+    assert '"request_id": "req-123"' in capfd.readouterr().out
@@ -0,0 +1,145 @@
+import os
+import sqlite3
+import threading
+import uuid
+from datetime import datetime, timezone
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+AGGREGATE_DB = os.getenv("AGGREGATE_DB", "data/aggregates.db")
+
+class SchemaMismatch(Exception):
+    """Raised when an upload's schema differs from the one its dataset was created with."""
+
+class AggregateStore:
+    """
+    Monthly aggregates of append-mode datasets in a SQLite database (WAL mode), shared by every worker process.
+    Per dataset it keeps revenue / expenses / net per month and expense sums per (month, category).
+    Merging an upload replaces the months it contains and keeps all others, so re-sending a month corrects it
+    instead of counting it twice. Row counts are kept per month too, so they are replaced along with the month.
+    """
+
+    def __init__(self, path: str = AGGREGATE_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.executescript(
+            "CREATE TABLE IF NOT EXISTS datasets ("
+            " id TEXT PRIMARY KEY, schema TEXT NOT NULL, rows INTEGER NOT NULL, updated_at TEXT NOT NULL);"
+            "CREATE TABLE IF NOT EXISTS monthly ("
+            " dataset TEXT NOT NULL, month TEXT NOT NULL, revenue REAL NOT NULL, expenses REAL NOT NULL, net REAL NOT NULL,"
+            " rows INTEGER NOT NULL DEFAULT 0, PRIMARY KEY (dataset, month));"
+            "CREATE TABLE IF NOT EXISTS category_expenses ("
+            " dataset TEXT NOT NULL, month TEXT NOT NULL, category TEXT NOT NULL, expenses REAL NOT NULL,"
+            " PRIMARY KEY (dataset, month, category));"
+        )
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(monthly)")]
+        if "rows" not in columns:
+            # Databases created before per-month row counts; their datasets restart the count at 0
+            self._conn.execute("ALTER TABLE monthly ADD COLUMN rows INTEGER NOT NULL DEFAULT 0")
+
+    @staticmethod
+    def new_id() -> str:
+        return uuid.uuid4().hex
+
+    def exists(self, dataset_id: str) -> bool:
+        with self._lock:
+            row = self._conn.execute("SELECT 1 FROM datasets WHERE id = ?", (dataset_id,)).fetchone()
+        return row is not None
+
+    def merge(
+        self,
+        dataset_id: str,
+        schema: str,
+        monthly: pd.DataFrame,
+        month_categories: Optional[pd.Series],
+    ) -> Tuple[pd.DataFrame, Optional[pd.Series], Dict[str, Any]]:
+        """
+        Replaces the upload's months in the dataset (creating it if needed) in one transaction.
+        monthly is indexed by month start, with the rows behind each month in a 'rows' column; month_categories by (month, category).
+        Returns the dataset's full (monthly, category_expenses by (month, category)) and a summary of the merge.
+        """
+        months = [m.strftime("%Y-%m-%d") for m in pd.DatetimeIndex(monthly.index)]
+        counts = monthly['rows'] if 'rows' in monthly.columns else pd.Series(0, index=monthly.index)
+        monthly_rows = [
+            (dataset_id, month, float(r), float(e), float(n), int(c))
+            for month, r, e, n, c in zip(months, monthly['revenue'], monthly['expenses'], monthly['net'], counts)
+        ]
+        category_rows = []
+        if month_categories is not None:
+            category_rows = [
+                (dataset_id, pd.Timestamp(month).strftime("%Y-%m-%d"), str(category), float(value))
+                for (month, category), value in month_categories.items()
+            ]
+        now = datetime.now(timezone.utc).isoformat(timespec="seconds")
+
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            try:
+                row = self._conn.execute("SELECT schema FROM datasets WHERE id = ?", (dataset_id,)).fetchone()
+                if row is not None and row[0] != schema:
+                    raise SchemaMismatch(row[0])
+                replaced = self._conn.execute(
+                    f"SELECT COUNT(*) FROM monthly WHERE dataset = ? AND month IN ({','.join('?' * len(months))})",
+                    (dataset_id, *months),
+                ).fetchone()[0] if months else 0
+                self._conn.executemany("DELETE FROM monthly WHERE dataset = ? AND month = ?", [(dataset_id, m) for m in months])
+                self._conn.executemany("DELETE FROM category_expenses WHERE dataset = ? AND month = ?", [(dataset_id, m) for m in months])
+                self._conn.executemany("INSERT INTO monthly (dataset, month, revenue, expenses, net, rows) VALUES (?, ?, ?, ?, ?, ?)", monthly_rows)
+                self._conn.executemany("INSERT INTO category_expenses VALUES (?, ?, ?, ?)", category_rows)
+                # A replaced month's rows went with it, so the total follows corrected resends
+                total_rows = self._conn.execute("SELECT COALESCE(SUM(rows), 0) FROM monthly WHERE dataset = ?", (dataset_id,)).fetchone()[0]
+                self._conn.execute(
+                    "INSERT INTO datasets (id, schema, rows, updated_at) VALUES (?, ?, ?, ?)"
+                    " ON CONFLICT (id) DO UPDATE SET rows = excluded.rows, updated_at = excluded.updated_at",
+                    (dataset_id, schema, total_rows, now),
+                )
+                self._conn.execute("COMMIT")
+            except BaseException:
+                self._conn.execute("ROLLBACK")
+                raise
+            stored_monthly, category_expenses = self._load(dataset_id)
+
+        summary = {
+            "id": dataset_id,
+            "months": len(stored_monthly),
+            "rows": total_rows,
+            "months_added": len(months) - replaced,
+            "months_replaced": replaced,
+        }
+        return stored_monthly, category_expenses, summary
+
+    def _load(self, dataset_id: str) -> Tuple[pd.DataFrame, Optional[pd.Series]]:
+        monthly = pd.read_sql_query(
+            "SELECT month, revenue, expenses, net, rows FROM monthly WHERE dataset = ? ORDER BY month",
+            self._conn, params=(dataset_id,), parse_dates=["month"], index_col="month",
+        )
+        categories = pd.read_sql_query(
+            "SELECT month, category, expenses FROM category_expenses WHERE dataset = ? ORDER BY month, category",
+            self._conn, params=(dataset_id,), parse_dates=["month"], index_col=["month", "category"],
+        )
+        category_expenses = categories['expenses'] if len(categories) else None
+        return monthly, category_expenses
+
+    def delete(self, dataset_id: str) -> bool:
+        with self._lock:
+            self._conn.execute("BEGIN IMMEDIATE")
+            cursor = self._conn.execute("DELETE FROM datasets WHERE id = ?", (dataset_id,))
+            self._conn.execute("DELETE FROM monthly WHERE dataset = ?", (dataset_id,))
+            self._conn.execute("DELETE FROM category_expenses WHERE dataset = ?", (dataset_id,))
+            self._conn.execute("COMMIT")
+        return cursor.rowcount > 0
+
+_store: Optional[AggregateStore] = None
+
+def aggregate_store() -> AggregateStore:
+    """The process-wide store, opened on first use (analysis workers open their own connection)."""
+    global _store
+    if _store is None:
+        _store = AggregateStore()
+    return _store
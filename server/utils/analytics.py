@@ -0,0 +1,323 @@
+"""
+Analytics core shared by every schema.
+
+Each schema reduces its rows to a monthly table (indexed by month start; revenue, expenses, net) plus optional
+expense sums per (month, category), so the cost here grows with months x categories, not rows.
+The work runs in three steps: compute_metrics() reduces the table to numbers (scan_history() covers the whole
+series in vectorized passes), detect_risks() applies the RISK_RULES table and returns structured Risk codes,
+and render_results() turns both into the Arabic KPI cards, risk lines and recommendations, as the final step.
+"""
+from typing import Any, Callable, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from utils.anomalies import empty_scan
+
+# Risk thresholds (percent)
+LOW_MARGIN_PCT = 10
+HEALTHY_MARGIN_PCT = 40
+EXPENSE_SPIKE_PCT = 20
+EXPENSE_SAVING_PCT = -10
+REVENUE_DROP_PCT = -15
+CONCENTRATION_PCT = 40
+
+# History scan: months before each month that its expenses are compared with, and the z-score that counts as a spike
+ZSCORE_WINDOW = 6
+ZSCORE_THRESHOLD = 2.5
+# Trailing months in which spikes and revenue drops are counted and the margin trend is fitted
+RECENT_MONTHS = 12
+REPEATED_DROP_MONTHS = 3
+LOSS_STREAK_MONTHS = 3
+MARGIN_SLOPE_PP = -1 # percentage points per month
+MIN_TREND_MONTHS = 6
+# A category above CONCENTRATION_PCT in each of the last CONCENTRATION_MONTHS months
+CONCENTRATION_MONTHS = 3
+
+class Risk(NamedTuple):
+    code: str
+    params: Dict[str, Any]
+
+def _pct_change(last: float, prev: float) -> float:
+    return (last - prev) / prev * 100 if prev > 0 else 0
+
+def _month_label(month) -> str:
+    month = pd.Timestamp(month)
+    return f"{month.year:04d}-{month.month:02d}" # strftime drops the padding of years < 1000
+
+def scan_history(revenue: np.ndarray, expenses: np.ndarray, net: np.ndarray, months: pd.Index, shares: Optional[np.ndarray] = None, categories: Optional[pd.Index] = None) -> Dict[str, Any]:
+    """
+    Risk signals over the whole monthly series, each computed in one vectorized pass:
+    rolling z-score expense spikes, month-over-month revenue drops, the current loss streak,
+    the margin trend slope and per-month category concentration (shares: months x categories).
+    """
+    n = len(expenses)
+    recent_start = max(0, n - RECENT_MONTHS)
+    history: Dict[str, Any] = {
+        "spike_months": [],
+        "drop_months": [],
+        "loss_streak": 0,
+        "margin_slope": None,
+        "trend_months": 0,
+        "recent_category": None,
+        "recent_category_pct": None,
+    }
+
+    # Expense spikes: each month against the ZSCORE_WINDOW months before it
+    if n > ZSCORE_WINDOW:
+        windows = np.lib.stride_tricks.sliding_window_view(expenses[:-1], ZSCORE_WINDOW)
+        mean = windows.mean(axis=1)
+        std = windows.std(axis=1)
+        current = expenses[ZSCORE_WINDOW:]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            # Any rise over a perfectly flat window is off the scale
+            z = np.where(std > 0, (current - mean) / std, np.where(current > mean, np.inf, 0))
+        # A spike must also be a material rise, not noise around a flat series
+        spikes = (z > ZSCORE_THRESHOLD) & (current > mean * (1 + EXPENSE_SPIKE_PCT / 100))
+        positions = np.flatnonzero(spikes) + ZSCORE_WINDOW
+        history["spike_months"] = [_month_label(months[i]) for i in positions[positions >= recent_start]]
+
+    # Month-over-month revenue drops
+    if n >= 2:
+        previous = revenue[:-1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            change = np.where(previous > 0, (revenue[1:] - previous) / previous * 100, 0)
+        positions = np.flatnonzero(change < REVENUE_DROP_PCT) + 1
+        history["drop_months"] = [_month_label(months[i]) for i in positions[positions >= recent_start]]
+
+    # Consecutive losses up to the last month
+    if n:
+        profitable = np.flatnonzero(net >= 0)
+        history["loss_streak"] = n - 1 - profitable[-1] if len(profitable) else n
+
+    # Least-squares slope of the monthly margin over the recent months that had revenue
+    recent_revenue = revenue[recent_start:]
+    has_revenue = recent_revenue > 0
+    if has_revenue.sum() >= MIN_TREND_MONTHS:
+        x = np.flatnonzero(has_revenue).astype(float)
+        # Clipped so one near-zero-revenue month cannot dominate the fit
+        y = np.clip(net[recent_start:][has_revenue] / recent_revenue[has_revenue] * 100, -100, 100)
+        x -= x.mean()
+        history["margin_slope"] = float((x * (y - y.mean())).sum() / (x * x).sum())
+        history["trend_months"] = len(recent_revenue)
+
+    # Category above the threshold in every one of the last CONCENTRATION_MONTHS months
+    if shares is not None and n >= CONCENTRATION_MONTHS and shares.shape[1]:
+        recent = shares[-CONCENTRATION_MONTHS:]
+        concentrated = (recent > CONCENTRATION_PCT).all(axis=0)
+        if concentrated.any():
+            mean_share = np.where(concentrated, recent.mean(axis=0), -1)
+            top = int(np.argmax(mean_share))
+            history["recent_category"] = categories[top]
+            history["recent_category_pct"] = float(mean_share[top])
+
+    return history
+
+def compute_metrics(monthly: pd.DataFrame, category_expenses: Optional[pd.Series] = None, anomalies: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Totals, last-month-vs-previous deltas, expense extremes and the history scan of a monthly table.
+    category_expenses is indexed by (month, category), or by category alone (no concentration over time).
+    anomalies is the transaction-level scan (utils.anomalies.scan_transactions) when the rows were available.
+    """
+    revenue = monthly['revenue'].to_numpy(dtype=float)
+    expenses = monthly['expenses'].to_numpy(dtype=float)
+    net = monthly['net'].to_numpy(dtype=float)
+    months = len(monthly)
+
+    total_revenue = revenue.sum()
+    total_expenses = expenses.sum()
+    net_profit = total_revenue - total_expenses
+    metrics = {
+        "months": months,
+        "total_revenue": total_revenue,
+        "total_expenses": total_expenses,
+        "net_profit": net_profit,
+        "profit_margin": (net_profit / total_revenue * 100) if total_revenue > 0 else 0,
+        "rev_delta": None,
+        "exp_delta": None,
+        "net_delta": None,
+        "margin_delta": None,
+        "avg_monthly_expenses": expenses.mean() if months else 0,
+        "highest_expense_value": expenses.max() if months else 0,
+        "highest_expense_month": "N/A",
+        "last_net": net[-1] if months else None,
+        "top_category": None,
+        "top_category_pct": None,
+    }
+
+    # Delta Logic (Last Month vs Previous)
+    if months >= 2:
+        metrics["rev_delta"] = _pct_change(revenue[-1], revenue[-2])
+        metrics["exp_delta"] = _pct_change(expenses[-1], expenses[-2])
+        metrics["net_delta"] = ((net[-1] - net[-2]) / abs(net[-2]) * 100) if net[-2] != 0 else 0
+        margin_last = (net[-1] / revenue[-1] * 100) if revenue[-1] > 0 else 0
+        margin_prev = (net[-2] / revenue[-2] * 100) if revenue[-2] > 0 else 0
+        metrics["margin_delta"] = margin_last - margin_prev # Absolute percentage point difference
+
+    if months:
+        metrics["highest_expense_month"] = _month_label(monthly.index[int(np.argmax(expenses))])
+
+    shares, categories = None, None
+    if category_expenses is not None and not category_expenses.empty:
+        totals = category_expenses
+        if category_expenses.index.nlevels == 2:
+            # months x categories expense matrix, aligned with the monthly table, filled from the index codes
+            month_codes, category_codes = category_expenses.index.codes
+            rows = monthly.index.get_indexer(category_expenses.index.levels[0])[month_codes]
+            categories = category_expenses.index.levels[1]
+            matrix = np.zeros((months, len(categories)))
+            np.add.at(matrix, (rows[rows >= 0], category_codes[rows >= 0]), category_expenses.to_numpy(dtype=float)[rows >= 0])
+            # Column sums (in month order, as a per-category groupby would add them) over the categories that occur
+            used = np.bincount(category_codes, minlength=len(categories)) > 0
+            totals = pd.Series(matrix.sum(axis=0)[used], index=categories[used])
+            with np.errstate(divide='ignore', invalid='ignore'):
+                shares = matrix / matrix.sum(axis=1, keepdims=True) * 100
+        ranked = totals.sort_values(ascending=False)
+        metrics["top_category"] = ranked.index[0]
+        metrics["top_category_pct"] = (ranked.iloc[0] / total_expenses) * 100
+
+    metrics.update(scan_history(revenue, expenses, net, monthly.index, shares, categories))
+    metrics["anomalies"] = anomalies or empty_scan()
+    return metrics
+
+# (code, predicate over the metrics returning the risk's parameters, or None when it does not apply)
+RISK_RULES: Tuple[Tuple[str, Callable[[Dict[str, Any]], Optional[Dict[str, Any]]]], ...] = (
+    ("low_margin", lambda m: {} if m["profit_margin"] < LOW_MARGIN_PCT else None),
+    ("expense_spike", lambda m: {"pct": m["exp_delta"]} if m["exp_delta"] is not None and m["exp_delta"] > EXPENSE_SPIKE_PCT else None),
+    ("revenue_drop", lambda m: {"pct": abs(m["rev_delta"])} if m["rev_delta"] is not None and m["rev_delta"] < REVENUE_DROP_PCT else None),
+    ("last_month_loss", lambda m: {} if m["last_net"] is not None and m["last_net"] < 0 else None),
+    ("expense_concentration", lambda m: {"category": m["top_category"], "pct": m["top_category_pct"]}
+        if m["top_category_pct"] is not None and m["top_category_pct"] > CONCENTRATION_PCT else None),
+    ("expense_anomaly", lambda m: {"count": len(m["spike_months"]), "month": m["spike_months"][-1]} if m["spike_months"] else None),
+    ("repeated_revenue_drops", lambda m: {"count": len(m["drop_months"]), "recent": RECENT_MONTHS}
+        if len(m["drop_months"]) >= REPEATED_DROP_MONTHS else None),
+    ("loss_streak", lambda m: {"months": m["loss_streak"]} if m["loss_streak"] >= LOSS_STREAK_MONTHS else None),
+    ("margin_decline", lambda m: {"slope": abs(m["margin_slope"]), "months": m["trend_months"]}
+        if m["margin_slope"] is not None and m["margin_slope"] < MARGIN_SLOPE_PP else None),
+    # Only when the whole-period rule did not already name the same category
+    ("recent_concentration", lambda m: {"category": m["recent_category"], "pct": m["recent_category_pct"], "months": CONCENTRATION_MONTHS}
+        if m["recent_category"] is not None and not (m["recent_category"] == m["top_category"] and m["top_category_pct"] > CONCENTRATION_PCT) else None),
+    ("transaction_outliers", lambda m: {"count": m["anomalies"]["outlier_count"], "amount": m["anomalies"]["outliers"][0]["amount"],
+        "category": m["anomalies"]["outliers"][0]["category"] or UNCATEGORIZED} if m["anomalies"]["outliers"] else None),
+    ("duplicate_payments", lambda m: {"count": m["anomalies"]["duplicate_count"], "amount": m["anomalies"]["duplicate_amount"]}
+        if m["anomalies"]["duplicate_count"] else None),
+)
+
+def detect_risks(metrics: Dict[str, Any]) -> List[Risk]:
+    risks = []
+    for code, predicate in RISK_RULES:
+        params = predicate(metrics)
+        if params is not None:
+            risks.append(Risk(code, params))
+    return risks
+
+RISK_TEXT = {
+    "low_margin": "هامش الربح الإجمالي منخفض جداً (أقل من 10%)",
+    "expense_spike": "ارتفاع حاد في المصروفات الشهرية بنسبة {pct:.1f}%",
+    "revenue_drop": "انخفاض ملحوظ في الإيرادات الشهرية بنسبة {pct:.1f}%",
+    "last_month_loss": "صافي ربح الشهر الأخير سلبي (خسارة)",
+    "expense_concentration": "تركيز عالي للمصروفات في بند '{category}' ({pct:.1f}%)",
+    "expense_anomaly": "ارتفاع غير معتاد في المصروفات مقارنة بالأشهر الستة السابقة (عدد الأشهر: {count}، آخرها {month})",
+    "repeated_revenue_drops": "تكرر انخفاض الإيرادات الشهرية بأكثر من 15% ({count} أشهر خلال آخر {recent} شهراً)",
+    "loss_streak": "خسائر متتالية منذ {months} أشهر حتى الشهر الأخير",
+    "margin_decline": "تراجع مستمر في هامش الربح بمعدل {slope:.1f} نقطة شهرياً خلال آخر {months} شهراً",
+    "recent_concentration": "تزايد تركيز المصروفات في بند '{category}' خلال آخر {months} أشهر ({pct:.1f}%)",
+    "transaction_outliers": "رصد معاملات مصروفات غير اعتيادية مقارنة بمعدل بنودها (العدد: {count}، أعلاها {amount:,.0f} في '{category}')",
+    "duplicate_payments": "اشتباه في دفعات مكررة بنفس التاريخ والمبلغ والبند (العدد: {count}، بإجمالي {amount:,.0f})",
+}
+NO_RISK_TEXT = "لم يتم رصد مخاطر حرجة بناءً على البيانات الحالية."
+
+RECOMMENDATION_TEXT = {
+    "low_margin": "مراجعة تسعير المنتجات أو خفض التكاليف المباشرة فوراً.",
+    "expense_spike": "تحليل بنود المصروفات المتضخمة لهذا الشهر ووضع سقف للإنفاق.",
+    "revenue_drop": "تفعيل حملات تسويقية عاجلة أو مراجعة أداء فريق المبيعات.",
+    "last_month_loss": "إجراء مراجعة شاملة للتدفقات النقدية لتجنب أزمة سيولة.",
+    "expense_concentration": "البحث عن موردين بدائل أو تقليل الاعتماد على '{category}' إن أمكن.",
+    "expense_anomaly": "مراجعة المصروفات الاستثنائية في الأشهر المرصودة والتحقق من تكرارها.",
+    "repeated_revenue_drops": "دراسة أسباب تذبذب الإيرادات وتنويع مصادر الدخل.",
+    "loss_streak": "وضع خطة عاجلة لخفض التكاليف أو زيادة الإيرادات لوقف الخسائر المتتالية.",
+    "margin_decline": "مراجعة هيكل التكاليف والأسعار لوقف تآكل هامش الربح.",
+    "recent_concentration": "مراجعة أسباب تزايد الإنفاق على '{category}' مؤخراً.",
+    "transaction_outliers": "التحقق من المعاملات غير الاعتيادية المدرجة في التقرير ومطابقتها مع المستندات.",
+    "duplicate_payments": "مراجعة الدفعات المكررة مع الموردين واسترداد ما دُفع مرتين.",
+}
+NO_RECOMMENDATION_TEXT = "الاستمرار في مراقبة الأداء المالي للحفاظ على الاستقرار."
+
+NO_COMPARISON_TEXT = "لا تتوفر بيانات كافية للمقارنة."
+UNCATEGORIZED = "غير مصنف"
+
+def fmt_money(val) -> str:
+    return f"{val:,.0f}"
+
+def fmt_delta(val, is_pct=True, suffix_override=None) -> str:
+    if val is None: return "غير متاح"
+    sign = "+" if val >= 0 else ""
+
+    if suffix_override:
+        return f"{sign}{val:.1f} {suffix_override}"
+
+    suffix = "%" if is_pct else ""
+    return f"{sign}{val:.1f}{suffix}"
+
+# Insight Helpers
+def rev_insight(delta) -> str:
+    if delta is None: return NO_COMPARISON_TEXT
+    if delta > 0: return "نمو إيجابي في الإيرادات مقارنة بالشهر السابق."
+    if delta < 0: return "تراجع في الإيرادات يتطلب مراجعة أسباب الانخفاض."
+    return "استقرار في الإيرادات مقارنة بالشهر السابق."
+
+def exp_insight(delta) -> str:
+    if delta is None: return NO_COMPARISON_TEXT
+    if delta > EXPENSE_SPIKE_PCT: return "ارتفاع ملحوظ في المصروفات التشغيلية."
+    if delta < EXPENSE_SAVING_PCT: return "تحسن في ضبط المصروفات وترشيد الإنفاق."
+    return "المصروفات ضمن النطاق المعتاد."
+
+def net_insight(val, delta) -> str:
+    if val < 0: return "تسجيل خسارة صافية خلال الفترة."
+    if delta is not None and delta > 0: return "نمو في صافي الأرباح مقارنة بالفترة السابقة."
+    return "تحقيق صافي ربح إيجابي."
+
+def margin_insight(val) -> str:
+    if val < LOW_MARGIN_PCT: return "هامش الربح منخفض وقد يؤثر على الاستدامة."
+    if val > HEALTHY_MARGIN_PCT: return "هامش ربح صحي وممتاز."
+    return "هامش ربح جيد ومستقر."
+
+def render_kpis(m: Dict[str, Any]) -> List[Dict[str, str]]:
+    return [
+        {"name": "إجمالي الإيرادات", "value": fmt_money(m["total_revenue"]), "delta": fmt_delta(m["rev_delta"]), "insight": rev_insight(m["rev_delta"])},
+        {"name": "إجمالي المصروفات", "value": fmt_money(m["total_expenses"]), "delta": fmt_delta(m["exp_delta"]), "insight": exp_insight(m["exp_delta"])},
+        {"name": "صافي الربح", "value": fmt_money(m["net_profit"]), "delta": fmt_delta(m["net_delta"]), "insight": net_insight(m["net_profit"], m["net_delta"])},
+        {"name": "هامش الربح", "value": f"{m['profit_margin']:.1f}%", "delta": fmt_delta(m["margin_delta"], is_pct=False, suffix_override="نقطة"), "insight": margin_insight(m["profit_margin"])},
+        {"name": "متوسط المصروفات", "value": fmt_money(m["avg_monthly_expenses"]), "delta": "شهرياً", "insight": "متوسط الإنفاق الشهري التشغيلي."},
+        {"name": "أعلى مصروفات", "value": fmt_money(m["highest_expense_value"]), "delta": m["highest_expense_month"], "insight": "الشهر الأعلى إنفاقاً خلال الفترة."},
+    ]
+
+def render_anomalies(scan: Dict[str, Any]) -> List[Dict[str, str]]:
+    """Flagged transactions as report rows: outliers first (highest score first), then duplicate payments."""
+    rows = [
+        {"date": r["date"], "category": r["category"] or UNCATEGORIZED, "amount": fmt_money(r["amount"]),
+         "reason": f"أعلى من وسيط البند ({fmt_money(r['median'])}) بدرجة {r['score']:.1f}"}
+        for r in scan["outliers"]
+    ]
+    rows += [
+        {"date": r["date"], "category": r["category"] or UNCATEGORIZED, "amount": fmt_money(r["amount"]),
+         "reason": f"تكررت في نفس اليوم (عدد المرات: {r['count']})"}
+        for r in scan["duplicates"]
+    ]
+    return rows
+
+def render_results(metrics: Dict[str, Any], risks: List[Risk]) -> Dict[str, Any]:
+    """The API's kpis / risks / recommendations / anomalies text for computed metrics and risks."""
+    recommendations = list(dict.fromkeys(RECOMMENDATION_TEXT[r.code].format(**r.params) for r in risks))
+    return {
+        "kpis": render_kpis(metrics),
+        "risks": [RISK_TEXT[r.code].format(**r.params) for r in risks] or [NO_RISK_TEXT],
+        "recommendations": recommendations or [NO_RECOMMENDATION_TEXT],
+        "anomalies": render_anomalies(metrics["anomalies"]),
+        "monthly_count": metrics["months"],
+    }
+
+def analyze_monthly(monthly: pd.DataFrame, category_expenses: Optional[pd.Series] = None, anomalies: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """KPIs, risks and recommendations of a monthly table sorted by month."""
+    metrics = compute_metrics(monthly, category_expenses, anomalies)
+    return render_results(metrics, detect_risks(metrics))
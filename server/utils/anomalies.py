@@ -0,0 +1,156 @@
+import os
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+
+import numpy as np
+import pandas as pd
+
+# Flagged rows kept per kind (outliers, duplicates) for the API response and the report
+ANOMALY_TOP_N = int(os.getenv("ANOMALY_TOP_N", "10"))
+# Modified z-score (Iglewicz & Hoaglin) of log1p(amount) above which an expense is an outlier within its category.
+# Expense amounts are right-skewed: on raw amounts about 5% of a typical ledger scored above the threshold.
+OUTLIER_SCORE = 3.5
+# Categories with fewer expense rows have no stable median
+MIN_CATEGORY_ROWS = 8
+# MAD -> standard deviation of a normal distribution, and the mean-absolute-deviation fallback when MAD is 0
+MAD_SCALE = 1 / 0.6745
+MEAN_AD_SCALE = 1.253314
+
+def empty_scan() -> Dict[str, Any]:
+    return {"outliers": [], "outlier_count": 0, "duplicates": [], "duplicate_count": 0, "duplicate_amount": 0.0}
+
+def _top(scores: np.ndarray, n: int, ties: Callable[[np.ndarray], Sequence[np.ndarray]]) -> np.ndarray:
+    """
+    Positions of the n largest scores, largest first; partitioning leaves the rest unsorted.
+    Equal scores are ordered by the keys ties(candidates) returns (e.g. day, category), not by row or hash order,
+    so the pandas and Arrow readers pick and order the same rows.
+    """
+    if n <= 0:
+        return np.empty(0, dtype=np.int64)
+    if len(scores) > n:
+        # Every row tied with the n-th score stays a candidate, so the tie-break decides which make the cut
+        candidates = np.flatnonzero(scores >= -np.partition(-scores, n - 1)[n - 1])
+    else:
+        candidates = np.arange(len(scores))
+    order = np.lexsort((*reversed(ties(candidates)), -scores[candidates]))
+    return candidates[order[:n]]
+
+def _tie_key(row: Dict[str, Any]) -> Tuple[str, str, float]:
+    return row["date"], row["category"] or "", row["amount"]
+
+def scan_transactions(df: pd.DataFrame, top_n: int = ANOMALY_TOP_N) -> Dict[str, Any]:
+    """
+    Transaction-level checks on the expense rows of a ledger that aggregate_transactions has signed
+    (needs date and signed_amount; category is optional, without it all expenses form one group):
+    - outliers: expenses far above their category's median, scored on log1p(amount) against its median absolute deviation
+    - duplicates: expenses sharing (day, amount, category), found through one hash of those three columns
+    Returns the counts and the top_n rows of each kind as plain values (picklable, JSON-ready).
+    """
+    signed = df['signed_amount'].to_numpy(dtype=float)
+    is_expense = signed < 0
+    if not is_expense.any():
+        return empty_scan()
+
+    amounts = -signed[is_expense]
+    dates = df['date']
+    if dates.dt.tz is not None:
+        dates = dates.dt.tz_localize(None)
+    days = dates.to_numpy()[is_expense].astype('datetime64[D]')
+
+    if 'category' in df.columns:
+        categories = df['category'][is_expense]
+        if isinstance(categories.dtype, pd.CategoricalDtype):
+            codes, labels = categories.cat.codes.to_numpy().astype(np.int64), categories.cat.categories
+        else:
+            codes, labels = pd.factorize(categories)
+    else:
+        codes, labels = np.zeros(len(amounts), dtype=np.int64), pd.Index([None])
+
+    def label(code: int) -> Optional[str]:
+        # str(): numeric category cells (e.g. Excel cost-centre codes) would leave numpy scalars in the JSON response;
+        # no category column (the None label) stays None, so callers fall back to UNCATEGORIZED
+        value = labels[code] if code >= 0 else None
+        return None if pd.isna(value) else str(value)
+
+    # Alphabetical rank of each category label (missing categories first), as the tie-break after the day
+    label_rank = np.argsort(np.argsort(np.array([str(l) for l in labels], dtype=str), kind='stable'))
+
+    def tie_keys(positions: np.ndarray) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        row_codes = codes[positions]
+        return days[positions], np.where(row_codes < 0, -1, label_rank[row_codes]), amounts[positions]
+
+    # Robust statistics per category (missing categories form their own group, code -1), on the log scale
+    values = np.log1p(amounts)
+    median = pd.Series(values).groupby(codes).transform('median').to_numpy()
+    rows = np.bincount(codes + 1)[codes + 1]
+    deviation = np.abs(values - median)
+    grouped_deviation = pd.Series(deviation).groupby(codes)
+    scale = grouped_deviation.transform('median').to_numpy() * MAD_SCALE
+    flat = scale == 0
+    if flat.any():
+        # More than half the category shares one amount: fall back to the mean absolute deviation
+        scale[flat] = grouped_deviation.transform('mean').to_numpy()[flat] * MEAN_AD_SCALE
+    del deviation, grouped_deviation
+    with np.errstate(divide='ignore', invalid='ignore'):
+        scores = np.where((scale > 0) & (rows >= MIN_CATEGORY_ROWS), (values - median) / scale, 0)
+    del values, median, scale
+
+    flagged = np.flatnonzero(scores > OUTLIER_SCORE)
+    # The report shows the category median in money: one median per category, taken only when something is flagged
+    category_median = pd.Series(amounts).groupby(codes).median() if len(flagged) else None
+    outliers = [
+        {
+            "date": str(days[i]),
+            "category": label(codes[i]),
+            "amount": float(amounts[i]),
+            "median": float(category_median[codes[i]]),
+            "score": float(scores[i]),
+        }
+        for i in flagged[_top(scores[flagged], top_n, lambda c: tie_keys(flagged[c]))]
+    ]
+
+    # Duplicate payments: one hash per row over (day, amount in cents, category)
+    keys = pd.util.hash_pandas_object(pd.DataFrame({
+        'day': days.view('int64'),
+        'cents': np.round(amounts * 100).astype(np.int64),
+        'category': codes,
+    }), index=False).to_numpy()
+    repeated = pd.Series(keys).duplicated(keep=False).to_numpy()
+    duplicates: List[Dict[str, Any]] = []
+    duplicate_count, duplicate_amount = 0, 0.0
+    if repeated.any():
+        _, first, counts = np.unique(keys[repeated], return_index=True, return_counts=True)
+        positions = np.flatnonzero(repeated)[first]
+        extra = amounts[positions] * (counts - 1)
+        duplicate_count = int((counts - 1).sum())
+        duplicate_amount = float(extra.sum())
+        duplicates = [
+            {
+                "date": str(days[positions[j]]),
+                "category": label(codes[positions[j]]),
+                "amount": float(amounts[positions[j]]),
+                "count": int(counts[j]),
+            }
+            for j in _top(extra, top_n, lambda c: tie_keys(positions[c]))
+        ]
+
+    return {
+        "outliers": outliers,
+        "outlier_count": len(flagged),
+        "duplicates": duplicates,
+        "duplicate_count": duplicate_count,
+        "duplicate_amount": duplicate_amount,
+    }
+
+def merge_scans(scan: Optional[Dict[str, Any]], part: Dict[str, Any], top_n: int = ANOMALY_TOP_N) -> Dict[str, Any]:
+    """Combines the scans of two chunks of one file, keeping the top_n rows of each kind."""
+    if scan is None:
+        return part
+    return {
+        "outliers": sorted(scan["outliers"] + part["outliers"], key=lambda r: (-r["score"], *_tie_key(r)))[:top_n],
+        "outlier_count": scan["outlier_count"] + part["outlier_count"],
+        "duplicates": sorted(
+            scan["duplicates"] + part["duplicates"], key=lambda r: (-r["amount"] * (r["count"] - 1), *_tie_key(r))
+        )[:top_n],
+        "duplicate_count": scan["duplicate_count"] + part["duplicate_count"],
+        "duplicate_amount": scan["duplicate_amount"] + part["duplicate_amount"],
+    }
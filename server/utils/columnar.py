@@ -0,0 +1,57 @@
+import importlib.util
+from typing import Iterator, List
+
+import pandas as pd
+
+from utils.sniff import CsvDialect, DEFAULT_DIALECT
+
+HAS_PYARROW = importlib.util.find_spec("pyarrow") is not None
+
+# Bytes of CSV parsed per batch when streaming
+ARROW_BLOCK_SIZE = 16 * 1024 * 1024
+
+# pandas' default NA markers, so both readers turn the same cells into missing values
+NA_VALUES = [
+    "", "#N/A", "#N/A N/A", "#NA", "-1.#IND", "-1.#QNAN", "-NaN", "-nan", "1.#IND", "1.#QNAN",
+    "<NA>", "N/A", "NA", "NULL", "NaN", "None", "n/a", "nan", "null",
+]
+
+def _csv_options(columns: List[str], dialect: CsvDialect):
+    import pyarrow as pa
+    import pyarrow.csv as pacsv
+
+    # Every column stays text (as the pandas path reads it) but dictionary-encoded:
+    # one copy of each distinct value plus an integer code per row
+    text = pa.dictionary(pa.int32(), pa.string())
+    # Arrow skips a UTF-8 BOM itself; other encodings are transcoded to UTF-8 as blocks are read
+    encoding = "utf8" if dialect.encoding == "utf-8-sig" else dialect.encoding
+    return dict(
+        read_options=pacsv.ReadOptions(block_size=ARROW_BLOCK_SIZE, encoding=encoding, skip_rows=dialect.skiprows),
+        parse_options=pacsv.ParseOptions(delimiter=dialect.sep, newlines_in_values=True),
+        convert_options=pacsv.ConvertOptions(
+            include_columns=columns,
+            column_types={c: text for c in columns},
+            strings_can_be_null=True,
+            null_values=NA_VALUES,
+        ),
+    )
+
+def read_csv_columns(path: str, columns: List[str], dialect: CsvDialect = DEFAULT_DIALECT) -> pd.DataFrame:
+    """
+    Reads the given columns with the Arrow CSV reader. Each column comes back as a pandas Categorical
+    whose categories are in order of first appearance. Raises pyarrow.ArrowInvalid on rows pandas would accept
+    differently (e.g. short rows), so callers can fall back to pd.read_csv.
+    """
+    import pyarrow.csv as pacsv
+
+    table = pacsv.read_csv(path, **_csv_options(columns, dialect))
+    return table.unify_dictionaries().to_pandas()
+
+def iter_csv_columns(path: str, columns: List[str], dialect: CsvDialect = DEFAULT_DIALECT) -> Iterator[pd.DataFrame]:
+    """Streaming version of read_csv_columns: one DataFrame of Categoricals per ARROW_BLOCK_SIZE of input."""
+    import pyarrow.csv as pacsv
+
+    reader = pacsv.open_csv(path, **_csv_options(columns, dialect))
+    for batch in reader:
+        if batch.num_rows:
+            yield batch.to_pandas()
@@ -0,0 +1,200 @@
+"""
+Date and month parsing for uploads.
+
+parse_dates() parses each distinct cell once and maps the results back to the rows. Before parsing:
+- Arabic-Indic digits, Arabic month names (Egyptian/Gulf and Levantine forms) and Hijri month names
+  are translated to ASCII digits and English month abbreviations through lookup tables.
+- The format is inferred once from a sample of the distinct values, preferring the format that parses most of them
+  (so 25/01/2024 selects day-first). Cells it misses get further passes, for files mixing two layouts.
+- The formats found are cached per header signature. A cached format is only reused when it parses the whole sample
+  of the current upload and its day/month swap does not, so the result never depends on an earlier upload.
+
+Hijri months keep their Hijri year (رمضان 1445 -> 1445-09-01): the report then reads in the upload's own calendar,
+and each Hijri month stays a month of its own rather than sharing a Gregorian one with its neighbour.
+"""
+import re
+import warnings
+from collections import OrderedDict
+from typing import Hashable, List, Optional, Tuple
+
+import pandas as pd
+from pandas.tseries.api import guess_datetime_format
+
+# Distinct values the format is inferred from
+SAMPLE_SIZE = 50
+# Format passes over the cells earlier formats left unparsed
+MAX_FORMAT_PASSES = 4
+# Left-over distinct values parsed one by one (dateutil) at the end
+MAX_FALLBACK_VALUES = 1000
+FORMAT_CACHE_SIZE = 256
+
+CANDIDATE_FORMATS = (
+    "%Y-%m-%d", "%Y-%m-%d %H:%M:%S", "%Y-%m-%d %H:%M", "%Y-%m-%dT%H:%M:%S", "%Y/%m/%d", "%Y.%m.%d",
+    "%Y-%m", "%Y/%m", "%Y%m%d",
+    "%m/%d/%Y", "%d/%m/%Y", "%m-%d-%Y", "%d-%m-%Y", "%d.%m.%Y", "%m/%d/%y", "%d/%m/%y",
+    "%m/%Y", "%m-%Y",
+    "%b %Y", "%B %Y", "%b-%Y", "%B-%Y", "%b-%y", "%B-%y", "%b %y", "%Y %b", "%Y %B", "%Y-%b",
+    "%d %b %Y", "%d %B %Y", "%d-%b-%Y", "%d-%b-%y", "%b %d, %Y", "%B %d, %Y",
+)
+
+ENGLISH_MONTHS = ("Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec")
+
+# Month tokens -> month number
+ARABIC_MONTHS = {
+    # Egyptian / Gulf transliterations
+    "يناير": 1, "فبراير": 2, "مارس": 3, "أبريل": 4, "ابريل": 4, "إبريل": 4, "مايو": 5, "يونيو": 6, "يونيه": 6,
+    "يوليو": 7, "يوليه": 7, "أغسطس": 8, "اغسطس": 8, "سبتمبر": 9, "أكتوبر": 10, "اكتوبر": 10, "نوفمبر": 11, "ديسمبر": 12,
+    # Levantine / Iraqi (Syriac) names
+    "كانون الثاني": 1, "شباط": 2, "آذار": 3, "اذار": 3, "نيسان": 4, "أيار": 5, "ايار": 5, "حزيران": 6,
+    "تموز": 7, "آب": 8, "اب": 8, "أيلول": 9, "ايلول": 9, "تشرين الأول": 10, "تشرين الاول": 10, "تشرين أول": 10,
+    "تشرين اول": 10, "تشرين الثاني": 11, "تشرين ثاني": 11, "كانون الأول": 12, "كانون الاول": 12, "كانون أول": 12, "كانون اول": 12,
+}
+HIJRI_MONTHS = {
+    "محرم": 1, "صفر": 2, "ربيع الأول": 3, "ربيع الاول": 3, "ربيع أول": 3, "ربيع اول": 3,
+    "ربيع الثاني": 4, "ربيع الآخر": 4, "ربيع الاخر": 4, "ربيع ثاني": 4,
+    "جمادى الأولى": 5, "جمادى الاولى": 5, "جمادى الأول": 5, "جمادى الاول": 5,
+    "جمادى الثانية": 6, "جمادى الآخرة": 6, "جمادى الاخرة": 6, "جمادى الثاني": 6,
+    "رجب": 7, "شعبان": 8, "رمضان": 9, "شوال": 10,
+    "ذو القعدة": 11, "ذي القعدة": 11, "ذو الحجة": 12, "ذي الحجة": 12,
+}
+MONTH_TOKENS = {token: ENGLISH_MONTHS[number - 1] for token, number in {**ARABIC_MONTHS, **HIJRI_MONTHS}.items()}
+# Longest first, so "ابريل" wins over "اب"; tokens must stand alone (not inside another word)
+MONTH_PATTERN = re.compile(
+    r"(?<!\w)(" + "|".join(re.escape(t) for t in sorted(MONTH_TOKENS, key=len, reverse=True)) + r")(?!\w)"
+)
+# Era markers after a year: 1445هـ, 2024 م
+ERA_PATTERN = re.compile(r"(?<=\d)\s*(?:هـ|ه|م)(?!\w)")
+DIGITS = str.maketrans("٠١٢٣٤٥٦٧٨٩۰۱۲۳۴۵۶۷۸۹", "0123456789" * 2)
+NON_ASCII = re.compile(r"[^\x00-\x7f]")
+
+_format_cache: "OrderedDict[Hashable, Tuple[str, ...]]" = OrderedDict()
+
+def normalize(values: pd.Series) -> pd.Series:
+    """Trims cells and rewrites Arabic digits, month names and era markers in ASCII."""
+    values = values.str.strip()
+    arabic = values.str.contains(NON_ASCII)
+    if arabic.any():
+        translated = (
+            values[arabic]
+            .str.translate(DIGITS)
+            .str.replace(MONTH_PATTERN, lambda m: MONTH_TOKENS[m.group(1)], regex=True)
+            .str.replace(ERA_PATTERN, "", regex=True)
+            .str.replace(r"\s+", " ", regex=True)
+            .str.strip()
+        )
+        values = values.copy()
+        values[arabic] = translated
+    return values
+
+def _parsed_count(sample: pd.Series, fmt: str) -> int:
+    return int(pd.to_datetime(sample, format=fmt, errors='coerce').notna().sum())
+
+def _swap_day_month(fmt: str) -> str:
+    return fmt.replace("%d", "\0").replace("%m", "%d").replace("\0", "%m")
+
+def reuse_format(sample: pd.Series, fmt: str) -> bool:
+    """
+    Whether a cached format may parse this upload: it must parse every sample value, and the sample must not be
+    ambiguous between day-first and month-first (then infer_format decides, as it would without the cache).
+    """
+    if _parsed_count(sample, fmt) < len(sample):
+        return False
+    swapped = _swap_day_month(fmt)
+    return swapped == fmt or _parsed_count(sample, swapped) < len(sample)
+
+def infer_format(sample: pd.Series) -> Optional[str]:
+    """The format that parses the most sample values (pandas' own guess from the first value wins ties), or None."""
+    with warnings.catch_warnings():
+        # "Parsing dates in %d/%m/%Y format when dayfirst=False": the day-first choice is made here on purpose
+        warnings.simplefilter("ignore", UserWarning)
+        guess = guess_datetime_format(sample.iloc[0])
+    candidates = list(dict.fromkeys([guess, *CANDIDATE_FORMATS]))
+    best, best_count = None, 0
+    for fmt in candidates:
+        if fmt is None:
+            continue
+        count = _parsed_count(sample, fmt)
+        if count > best_count:
+            best, best_count = fmt, count
+            if count == len(sample):
+                break
+    return best
+
+def _parse_strings(values: pd.Series, signature: Optional[Hashable]) -> pd.Series:
+    """Parses distinct normalized strings: cached formats first, then inferred ones, then one by one."""
+    parsed = pd.Series(pd.NaT, index=values.index, dtype='datetime64[us]')
+    pending = values.notna() & (values != "")
+    used: List[str] = []
+    cached = list(_format_cache.get(signature, ())) if signature is not None else []
+
+    for _ in range(MAX_FORMAT_PASSES + len(cached)):
+        if not pending.any():
+            break
+        sample = values[pending].iloc[:SAMPLE_SIZE]
+        fmt = cached.pop(0) if cached else None
+        if fmt is None or not reuse_format(sample, fmt):
+            cached = []
+            fmt = infer_format(sample)
+        if fmt is None:
+            break
+        attempt = pd.to_datetime(values[pending], format=fmt, errors='coerce')
+        hits = attempt.notna()
+        if not hits.any():
+            continue
+        if attempt.dt.tz is not None:
+            # Offsets in the text: keep the first layout as pandas would and leave the rest unparsed
+            return attempt.reindex(values.index)
+        parsed[attempt.index[hits]] = attempt[hits].astype('datetime64[us]')
+        pending[attempt.index[hits]] = False
+        used.append(fmt)
+
+    leftovers = values[pending]
+    if 0 < len(leftovers) <= MAX_FALLBACK_VALUES:
+        for i, value in leftovers.items():
+            with warnings.catch_warnings():
+                warnings.simplefilter("ignore", UserWarning)
+                single = pd.to_datetime(value, errors='coerce')
+            if not pd.isna(single) and getattr(single, 'tzinfo', None) is None:
+                parsed[i] = single
+
+    if signature is not None and used:
+        _format_cache[signature] = tuple(used)
+        _format_cache.move_to_end(signature)
+        while len(_format_cache) > FORMAT_CACHE_SIZE:
+            _format_cache.popitem(last=False)
+    return parsed
+
+def parse_dates(values: pd.Series, signature: Optional[Hashable] = None) -> pd.Series:
+    """
+    Parses a date or month column; cells that cannot be parsed become NaT.
+    signature identifies the file layout (e.g. the mapped headers plus the column) for the format cache.
+    """
+    if pd.api.types.is_datetime64_any_dtype(values):
+        return values
+    if pd.api.types.is_numeric_dtype(values) and not isinstance(values.dtype, pd.CategoricalDtype):
+        return pd.to_datetime(values, errors='coerce')
+
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        codes, uniques = values.cat.codes.to_numpy(), pd.Series(values.cat.categories)
+    else:
+        codes, labels = pd.factorize(values)
+        uniques = pd.Series(labels)
+    if len(uniques) == 0:
+        return pd.Series(pd.NaT, index=values.index, dtype='datetime64[us]')
+
+    is_text = uniques.map(lambda v: isinstance(v, str)).to_numpy(dtype=bool)
+    parsed = pd.Series(pd.NaT, index=uniques.index, dtype='datetime64[us]')
+    if is_text.any():
+        text = normalize(uniques[is_text].astype(str))
+        parsed_text = _parse_strings(text, signature)
+        if parsed_text.dt.tz is not None:
+            parsed = parsed_text.reindex(uniques.index)
+        else:
+            parsed[text.index] = parsed_text
+    if not is_text.all():
+        # datetime / Timestamp cells from Excel, mixed in with text
+        others = pd.to_datetime(uniques[~is_text], errors='coerce')
+        if others.dt.tz is None and parsed.dt.tz is None:
+            parsed[others.index] = others.astype('datetime64[us]')
+
+    return pd.Series(pd.DatetimeIndex(parsed).take(codes, allow_fill=True, fill_value=pd.NaT), index=values.index)
@@ -0,0 +1,28 @@
+import importlib.util
+from typing import Callable, List, Optional
+
+import pandas as pd
+
+def _pandas_version() -> tuple:
+    return tuple(int(p) for p in pd.__version__.split(".")[:2])
+
+# calamine (Rust) reads .xlsx and .xls several times faster than openpyxl; pandas supports it from 2.2
+HAS_CALAMINE = importlib.util.find_spec("python_calamine") is not None and _pandas_version() >= (2, 2)
+
+def excel_engine(filename: str) -> Optional[str]:
+    """Fastest available engine for the file; None lets pandas pick its default (xlrd for .xls)."""
+    if HAS_CALAMINE:
+        return "calamine"
+    if filename.lower().endswith(".xlsx"):
+        return "openpyxl" # pandas opens it in read_only mode and streams rows
+    return None
+
+def read_excel(path: str, filename: str, select_columns: Callable[[pd.Index], List[str]]) -> pd.DataFrame:
+    """
+    Reads the first sheet, keeping only the columns select_columns picks from a header-only pre-read.
+    Falls back to every column when nothing is selected, so the caller can report what is missing.
+    """
+    engine = excel_engine(filename)
+    header = pd.read_excel(path, engine=engine, nrows=0)
+    usecols = select_columns(header.columns) or None
+    return pd.read_excel(path, engine=engine, usecols=usecols)
@@ -0,0 +1,116 @@
+"""
+Report fonts, served from disk instead of Google Fonts.
+
+    python -m utils.fonts        # download IBM Plex Sans Arabic into templates/fonts/ (once, at build time)
+
+templates/fonts/fonts.css holds @font-face rules whose url()s are file names in the same directory.
+At render time the files are inlined as data: URIs, so Chromium never touches the network.
+Any @font-face CSS written that way works, e.g. hand-written rules for the TTFs from IBM's releases.
+"""
+import os
+import re
+import sys
+import base64
+import urllib.request
+from typing import Dict
+
+from utils.timing import log_event
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # server/
+FONT_DIR = os.path.join(BASE_DIR, 'templates', 'fonts')
+FONT_CSS_PATH = os.path.join(FONT_DIR, 'fonts.css')
+# Without the fonts, startup fails instead of rendering reports in a fallback font; 0 allows the fallback (development)
+REPORT_FONTS_REQUIRED = os.getenv("REPORT_FONTS_REQUIRED", "1") == "1"
+
+GOOGLE_FONTS_CSS = "https://fonts.googleapis.com/css2?family=IBM+Plex+Sans+Arabic:wght@400;500;600;700&display=swap"
+# Google serves one @font-face per weight and script subset; the report only needs these
+SUBSETS = ("arabic", "latin", "latin-ext")
+# Google Fonts picks the font format from the User-Agent; this one gets woff2
+USER_AGENT = "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/124.0 Safari/537.36"
+
+FONT_TYPES = {".woff2": "font/woff2", ".woff": "font/woff", ".ttf": "font/ttf", ".otf": "font/otf"}
+URL_PATTERN = re.compile(r"url\(\s*['\"]?([^'\")]+?)['\"]?\s*\)")
+
+def _data_uri(filename: str) -> str:
+    path = os.path.join(FONT_DIR, os.path.basename(filename))
+    mime = FONT_TYPES.get(os.path.splitext(filename)[1].lower(), "application/octet-stream")
+    with open(path, 'rb') as f:
+        return f"data:{mime};base64,{base64.b64encode(f.read()).decode('ascii')}"
+
+class FontsMissing(RuntimeError):
+    pass
+
+def _missing(error: OSError) -> str:
+    """Logs missing fonts (or raises FontsMissing when REPORT_FONTS_REQUIRED) and falls back to system fonts."""
+    if REPORT_FONTS_REQUIRED:
+        raise FontsMissing(
+            f"report fonts missing ({error}); run `python -m utils.fonts` in server/, "
+            "or set REPORT_FONTS_REQUIRED=0 to render with system fonts"
+        ) from error
+    log_event("report_fonts_missing", path=FONT_CSS_PATH, error=str(error), fallback="system fonts")
+    return ""
+
+def load_font_css() -> str:
+    """fonts.css with every local url() inlined, or '' when no fonts are installed (the template falls back to system fonts)."""
+    try:
+        with open(FONT_CSS_PATH, encoding='utf-8') as f:
+            css = f.read()
+    except OSError as e:
+        return _missing(e)
+
+    def inline(match: re.Match) -> str:
+        target = match.group(1)
+        if target.startswith("data:"):
+            return match.group(0)
+        return f"url({_data_uri(target)})"
+
+    try:
+        return URL_PATTERN.sub(inline, css)
+    except OSError as e:
+        return _missing(e)
+
+def _fetch(url: str) -> bytes:
+    request = urllib.request.Request(url, headers={"User-Agent": USER_AGENT})
+    with urllib.request.urlopen(request, timeout=30) as response:
+        return response.read()
+
+def download(css_url: str = GOOGLE_FONTS_CSS) -> Dict[str, int]:
+    """Fetches the stylesheet and its font files into FONT_DIR and writes fonts.css pointing at them. Returns {file: bytes}."""
+    css = _fetch(css_url).decode('utf-8')
+    os.makedirs(FONT_DIR, exist_ok=True)
+
+    # The stylesheet is a sequence of "/* subset */ @font-face { ... }" blocks
+    blocks = re.findall(r"/\*\s*([\w-]+)\s*\*/\s*(@font-face\s*\{[^}]*\})", css)
+    rules, files = [], {}
+    for subset, rule in blocks:
+        if subset not in SUBSETS:
+            continue
+        weight = re.search(r"font-weight:\s*(\d+)", rule).group(1)
+
+        def localize(match: re.Match) -> str:
+            extension = os.path.splitext(match.group(1).split("?")[0])[1] or ".woff2"
+            filename = f"IBMPlexSansArabic-{weight}-{subset}{extension}"
+            if filename not in files:
+                data = _fetch(match.group(1))
+                with open(os.path.join(FONT_DIR, filename), 'wb') as f:
+                    f.write(data)
+                files[filename] = len(data)
+            return f"url({filename})"
+
+        rules.append(f"/* {subset} */\n" + URL_PATTERN.sub(localize, rule))
+
+    if not rules:
+        raise RuntimeError("no @font-face rules found in the stylesheet")
+    with open(FONT_CSS_PATH, 'w', encoding='utf-8') as f:
+        f.write("\n".join(rules) + "\n")
+    return files
+
+if __name__ == "__main__":
+    try:
+        downloaded = download()
+    except Exception as e:
+        print(f"Font download failed: {e}", file=sys.stderr)
+        sys.exit(1)
+    for name, size in sorted(downloaded.items()):
+        print(f"{name}  {size // 1024} KB")
+    print(f"Wrote {FONT_CSS_PATH}")
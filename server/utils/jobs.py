@@ -0,0 +1,120 @@
+import os
+import json
+import time
+import uuid
+import sqlite3
+import asyncio
+import threading
+from typing import Any, Coroutine, Dict, Optional, Set
+
+JOB_TTL = float(os.getenv("JOB_TTL", "3600"))
+JOB_DB = os.getenv("JOB_DB", "data/jobs.db")
+
+class Job:
+    """
+    One background analysis.
+    status: queued -> running -> done | failed
+    stage:  analyze -> llm -> pdf -> done; 'result' fills in as stages finish.
+    Every update is written to the job store, so a poll answered by any worker process sees it.
+    """
+
+    def __init__(self, store: Optional["JobStore"] = None, job_id: Optional[str] = None):
+        self.id = job_id or uuid.uuid4().hex
+        self.status = "queued"
+        self.stage = "analyze"
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[Dict[str, Any]] = None
+        self.created = time.time()
+        self.updated = self.created
+        self._store = store
+
+    def update(self, **fields):
+        for name, value in fields.items():
+            setattr(self, name, value)
+        self.updated = time.time()
+        if self._store is not None:
+            self._store.save(self)
+
+    def to_dict(self) -> Dict[str, Any]:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "stage": self.stage,
+            "result": self.result,
+            "error": self.error,
+        }
+
+class JobStore:
+    """
+    Jobs in a SQLite database (WAL mode), shared by every worker process on the host, so polls may land on any of them.
+    The coroutines themselves run in the process that accepted the upload.
+    Jobs are forgotten JOB_TTL seconds after their last update (a job whose process died stops updating).
+    """
+
+    def __init__(self, path: str = JOB_DB, ttl: float = JOB_TTL):
+        self.ttl = ttl
+        self._tasks: Set[asyncio.Task] = set()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS jobs ("
+            " id TEXT PRIMARY KEY, status TEXT NOT NULL, stage TEXT NOT NULL, result TEXT, error TEXT,"
+            " created REAL NOT NULL, updated REAL NOT NULL)"
+        )
+
+    def create(self) -> Job:
+        self._expire()
+        job = Job(self)
+        self.save(job)
+        return job
+
+    def save(self, job: Job):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO jobs (id, status, stage, result, error, created, updated) VALUES (?, ?, ?, ?, ?, ?, ?)",
+                (
+                    job.id, job.status, job.stage,
+                    json.dumps(job.result, ensure_ascii=False) if job.result is not None else None,
+                    json.dumps(job.error, ensure_ascii=False) if job.error is not None else None,
+                    job.created, job.updated,
+                ),
+            )
+
+    def get(self, job_id: str) -> Optional[Job]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT status, stage, result, error, created, updated FROM jobs WHERE id = ? AND updated >= ?",
+                (job_id, time.time() - self.ttl),
+            ).fetchone()
+        if row is None:
+            return None
+        job = Job(self, job_id)
+        job.status, job.stage = row[0], row[1]
+        job.result = json.loads(row[2]) if row[2] is not None else None
+        job.error = json.loads(row[3]) if row[3] is not None else None
+        job.created, job.updated = row[4], row[5]
+        return job
+
+    def spawn(self, coro: Coroutine):
+        """Runs a job coroutine in the background, keeping a reference so it is not garbage collected."""
+        task = asyncio.ensure_future(coro)
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    def _expire(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM jobs WHERE updated < ?", (time.time() - self.ttl,))
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT status, COUNT(*) FROM jobs WHERE updated >= ? GROUP BY status", (time.time() - self.ttl,)
+            ).fetchall()
+        return dict(rows)
+
+jobs = JobStore()
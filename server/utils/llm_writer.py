@@ -1,15 +1,25 @@
 import os
 import json
 import asyncio
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Callable
 from openai import AsyncOpenAI, APIError, APITimeoutError
+from utils.cache import TTLCache, content_hash
+from utils.metrics import llm_requests, llm_retries
+from utils.timing import log_event
 
 API_KEY = os.getenv("OPENAI_API_KEY")
 client = AsyncOpenAI(api_key=API_KEY) if API_KEY else None
-if client:
-    print("LLM Writer: API Key detected: Yes")
-else:
-    print("LLM Writer: API Key detected: No")
+log_event("llm_writer_config", api_key=bool(client))
+
+MODEL = "gpt-4o" # Using a high-quality model for best Arabic writing
+
+# Identical analyses get identical prompts, so their rewrites are reused instead of paid for again
+llm_cache = TTLCache(
+    max_entries=int(os.getenv("LLM_CACHE_SIZE", "512")),
+    ttl=float(os.getenv("LLM_CACHE_TTL", "86400")),
+    disk_dir=os.getenv("LLM_CACHE_DIR") or None,
+)
+_inflight: Dict[str, asyncio.Future] = {}
 
 SYSTEM_PROMPT = """
 You are a senior CFO writing a financial executive summary in Arabic.
@@ -31,56 +41,95 @@ REQUIREMENTS:
 5. Output MUST be valid JSON with exactly two keys: "executive_summary" (string) and "executive_recommendations" (list of strings).
 """
 
+BATCH_SYSTEM_PROMPT = SYSTEM_PROMPT + """
+BATCH MODE:
+The payload is {"reports": [...]}, one item per company, each shaped as described above. Treat every item independently.
+Output MUST be valid JSON of the form {"reports": [...]}, with one object per input item in the same order,
+each with exactly the two keys "executive_summary" and "executive_recommendations".
+"""
+
+# Uncached batch payloads sent per API call
+LLM_BATCH_SIZE = int(os.getenv("LLM_BATCH_SIZE", "8"))
+
 async def write_executive_text(payload: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     """
     Rewrites the financial analysis using OpenAI to produce executive-level text.
     Returns a dict with 'executive_summary' and 'executive_recommendations' or None on failure.
-    Includes 1 retry mechanism.
+    Successful rewrites are cached, and concurrent identical payloads share one API call.
     """
     if not client:
-        print("LLM Writer: No OPENAI_API_KEY found. Skipping.")
+        log_event("llm_skipped", reason="no OPENAI_API_KEY")
         return None
 
-    model = "gpt-4o" # Using a high-quality model for best Arabic writing
-    
     # Prepare user content
     user_content = json.dumps(payload, ensure_ascii=False)
 
+    key = content_hash(MODEL, SYSTEM_PROMPT, json.dumps(payload, ensure_ascii=False, sort_keys=True))
+    cached = llm_cache.get(key)
+    if cached is not None:
+        log_event("llm_cache_hit")
+        return cached
+
+    # The request runs as its own task: a caller that stops waiting does not cancel it for the others,
+    # and a late answer still lands in the cache
+    task = _inflight.get(key)
+    if task is None:
+        task = asyncio.ensure_future(_request_and_cache(key, user_content))
+        _inflight[key] = task
+        task.add_done_callback(lambda _: _inflight.pop(key, None))
+    return await asyncio.shield(task)
+
+async def _request_and_cache(key: str, user_content: str) -> Optional[Dict[str, Any]]:
+    result = await _request_executive_text(user_content)
+    if result:
+        llm_cache.set(key, result)
+    return result
+
+def _parse_single(data: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    if "executive_summary" not in data or "executive_recommendations" not in data:
+        log_event("llm_invalid_response", reason="missing expected keys")
+        return None
+    return data
+
+async def _request_executive_text(user_content: str) -> Optional[Dict[str, Any]]:
+    return await _request_json(SYSTEM_PROMPT, user_content, _parse_single)
+
+async def _request_json(system_prompt: str, user_content: str, parse: Callable[[Dict[str, Any]], Any], timeout: float = 10.0) -> Any:
+    """Calls the API, with 1 retry on timeouts and malformed JSON. parse() validates the decoded JSON (None = invalid)."""
+    model = MODEL
+
     async def call_api():
         try:
             response = await client.chat.completions.create(
                 model=model,
                 messages=[
-                    {"role": "system", "content": SYSTEM_PROMPT},
+                    {"role": "system", "content": system_prompt},
                     {"role": "user", "content": user_content}
                 ],
                 response_format={"type": "json_object"},
                 temperature=0.3, # Low temperature for consistency
-                timeout=10.0 # 10s strict timeout
+                timeout=timeout # strict timeout (10s for a single report)
             )
             content = response.choices[0].message.content
             if not content:
-                print("LLM Writer: Empty response content.")
+                log_event("llm_invalid_response", model=model, reason="empty content")
                 return None
             
-            data = json.loads(content)
-            
-            # Validate keys
-            if "executive_summary" not in data or "executive_recommendations" not in data:
-                print("LLM Writer: Missing expected keys in JSON response.")
+            data = parse(json.loads(content))
+            if data is None:
                 return None
             
-            print(f"LLM: used {model} - Success")
+            log_event("llm_success", model=model)
             return data
             
         except APITimeoutError:
-            print("LLM Writer: Request timed out.")
+            log_event("llm_timeout", model=model, timeout_s=timeout)
             raise # Trigger retry
         except json.JSONDecodeError:
-            print("LLM Writer: Failed to decode JSON response.")
+            log_event("llm_invalid_response", model=model, reason="invalid JSON")
             raise # Trigger retry
         except Exception as e:
-            print(f"LLM Writer Error: {e}")
+            log_event("llm_error", model=model, error=str(e))
             return None # Do not retry generic API errors immediately unless transient? simpler to just fail safe.
             
     # Retry logic (1 retry)
@@ -88,12 +137,56 @@ async def write_executive_text(payload: Dict[str, Any]) -> Optional[Dict[str, An
         try:
             result = await call_api()
             if result:
+                llm_requests.inc(result="ok")
                 return result
         except Exception:
             if attempt == 0:
-                print("LLM Writer: Retrying...")
+                log_event("llm_retry")
+                llm_retries.inc()
                 await asyncio.sleep(0.5)
             else:
-                print("LLM Writer: Failed after retry.")
+                log_event("llm_failed", attempts=2)
                 
+    llm_requests.inc(result="failed")
     return None
+
+async def write_executive_texts(payloads: List[Dict[str, Any]]) -> List[Optional[Dict[str, Any]]]:
+    """
+    write_executive_text for many payloads (batch uploads), in the same order.
+    Uncached payloads are sent LLM_BATCH_SIZE per API call; a group whose answer does not line up
+    with its input falls back to one call per payload.
+    """
+    if not client:
+        log_event("llm_skipped", reason="no OPENAI_API_KEY", reports=len(payloads))
+        return [None] * len(payloads)
+
+    keys = [content_hash(MODEL, SYSTEM_PROMPT, json.dumps(p, ensure_ascii=False, sort_keys=True)) for p in payloads]
+    results: List[Optional[Dict[str, Any]]] = [llm_cache.get(key) for key in keys]
+    pending = [i for i, result in enumerate(results) if result is None]
+    groups = [pending[start:start + LLM_BATCH_SIZE] for start in range(0, len(pending), LLM_BATCH_SIZE)]
+
+    async def run_group(group: List[int]):
+        texts = None
+        if len(group) > 1:
+            user_content = json.dumps({"reports": [payloads[i] for i in group]}, ensure_ascii=False)
+            texts = await _request_json(
+                BATCH_SYSTEM_PROMPT, user_content, lambda data: _parse_batch(data, len(group)), timeout=10.0 + 5.0 * len(group)
+            )
+            for i, text in zip(group, texts or []):
+                llm_cache.set(keys[i], text)
+        if texts is None:
+            texts = await asyncio.gather(*(write_executive_text(payloads[i]) for i in group))
+        for i, text in zip(group, texts):
+            results[i] = text
+
+    await asyncio.gather(*(run_group(group) for group in groups))
+    return results
+
+def _parse_batch(data: Dict[str, Any], expected: int) -> Optional[List[Dict[str, Any]]]:
+    reports = data.get("reports")
+    if not isinstance(reports, list) or len(reports) != expected:
+        log_event("llm_invalid_response", reason="batch does not match the request", expected=expected)
+        return None
+    if not all(isinstance(r, dict) and _parse_single(r) is not None for r in reports):
+        return None
+    return reports
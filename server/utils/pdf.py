@@ -1,38 +1,315 @@
 import os
 import sys
 import json
+import asyncio
 import subprocess
 import tempfile
-import uuid
+import hashlib
+import time
+from typing import Optional, Dict, Any, List
+
+from utils.pdf_generator import FONT_CSS, REPORT_DIR, TEMPLATE_VERSION, render_html, isolate, print_page
+from utils.storage import ReportStore, create_report_store
+from utils.timing import log_event
+
+PDF_POOL_SIZE = int(os.getenv("PDF_POOL_SIZE", "2"))
+PDF_QUEUE_LIMIT = int(os.getenv("PDF_QUEUE_LIMIT", "16"))
+PDF_RENDER_TIMEOUT = float(os.getenv("PDF_RENDER_TIMEOUT", "30"))
+REPORT_CACHE_MAX_MB = int(os.getenv("REPORT_CACHE_MAX_MB", "500"))
+REPORT_CACHE_MAX_AGE_HOURS = float(os.getenv("REPORT_CACHE_MAX_AGE_HOURS", "72"))
+
+class RendererBusy(Exception):
+    """Raised when the render queue is full."""
+
+class RendererPool:
+    """
+    Long-lived Chromium with a fixed set of warm pages.
+    Started once at app startup; each render borrows a page, prints it and hands it back.
+    Renders beyond the pool size wait in a bounded queue.
+    """
+
+    def __init__(self, size: int = PDF_POOL_SIZE, queue_limit: int = PDF_QUEUE_LIMIT):
+        self.size = max(1, size)
+        self.queue_limit = queue_limit
+        self._playwright = None
+        self._browser = None
+        self._pages: Optional[asyncio.Queue] = None
+        self._waiting = 0
+        self.rendered = 0
+        self.failed = 0
+
+    @property
+    def running(self) -> bool:
+        return self._browser is not None and self._browser.is_connected()
+
+    async def start(self):
+        from playwright.async_api import async_playwright
+
+        self._playwright = await async_playwright().start()
+        self._browser = await self._playwright.chromium.launch()
+        self._pages = asyncio.Queue()
+        for _ in range(self.size):
+            self._pages.put_nowait(await self._new_page())
+        log_event("pdf_renderer_started", pages=self.size)
+
+    async def stop(self):
+        if self._browser is not None:
+            await self._browser.close()
+            self._browser = None
+        if self._playwright is not None:
+            await self._playwright.stop()
+            self._playwright = None
+
+    async def _new_page(self):
+        context = await self._browser.new_context()
+        await isolate(context)
+        return await context.new_page()
+
+    async def render(self, html: str, output_path: str):
+        if self._waiting >= self.queue_limit:
+            raise RendererBusy("PDF render queue is full")
+
+        self._waiting += 1
+        try:
+            page = await self._pages.get()
+        finally:
+            self._waiting -= 1
+
+        try:
+            await asyncio.wait_for(print_page(page, html, output_path), timeout=PDF_RENDER_TIMEOUT)
+            self.rendered += 1
+        except Exception:
+            self.failed += 1
+            # A page that failed mid-render may be in a bad state; replace it
+            try:
+                await page.context.close()
+            except Exception:
+                pass
+            if self.running:
+                page = await self._new_page()
+            raise
+        finally:
+            self._pages.put_nowait(page)
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "running": self.running,
+            "size": self.size,
+            "idle": self._pages.qsize() if self._pages is not None else 0,
+            "waiting": self._waiting,
+            "queue_limit": self.queue_limit,
+            "rendered": self.rendered,
+            "failed": self.failed,
+            "local_fonts": bool(FONT_CSS),
+        }
+
+renderer = RendererPool()
+
+def report_key(context_data: dict) -> str:
+    """Hash of the canonical report payload plus the template version."""
+    payload = {k: v for k, v in context_data.items() if k != 'timestamp'}
+    canonical = json.dumps(payload, ensure_ascii=False, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(f"{TEMPLATE_VERSION}:{canonical}".encode('utf-8')).hexdigest()
+
+class ReportCache:
+    """
+    Content-addressed PDFs in the report store.
+    A report's filename is derived from its payload hash, so an identical payload maps to the report already stored.
+    The store is bounded by total size and by age since last use.
+    Renders are written to reports/ first and handed to the store once complete.
+    """
+
+    EVICT_INTERVAL = 60 # seconds between store scans
+
+    def __init__(self, store: ReportStore, max_bytes: int, max_age: float):
+        self.store = store
+        self.max_bytes = max_bytes
+        self.max_age = max_age
+        self.hits = 0
+        self.misses = 0
+        self.evicted = 0
+        self._last_evict = 0.0
+        self._inflight: Dict[str, asyncio.Future] = {}
+
+    @staticmethod
+    def filename_for(key: str) -> str:
+        return f"report_{key[:32]}.pdf"
+
+    def lookup(self, key: str) -> Optional[str]:
+        filename = self.filename_for(key)
+        if not self.store.touch(filename): # mark as recently used
+            self.misses += 1
+            return None
+        self.hits += 1
+        return filename
+
+    def exists(self, filename: str) -> bool:
+        return self.store.stat(filename) is not None
+
+    def evict(self):
+        now = time.time()
+        entries = sorted(self.store.list(), key=lambda o: o.last_used) # oldest first
+        total = sum(o.size for o in entries)
+        for entry in entries:
+            if now - entry.last_used <= self.max_age and total <= self.max_bytes:
+                break
+            try:
+                self.store.delete(entry.name)
+                self.evicted += 1
+                total -= entry.size
+            except Exception as e:
+                log_event("report_cache_evict_failed", file=entry.name, error=str(e))
+
+    def maybe_evict(self):
+        if time.time() - self._last_evict < self.EVICT_INTERVAL:
+            return
+        self._last_evict = time.time()
+        self.evict()
+
+    def stats(self) -> Dict[str, Any]:
+        return {"hits": self.hits, "misses": self.misses, "evicted": self.evicted}
+
+report_cache = ReportCache(
+    create_report_store(REPORT_DIR),
+    max_bytes=REPORT_CACHE_MAX_MB * 1024 * 1024,
+    max_age=REPORT_CACHE_MAX_AGE_HOURS * 3600,
+)
+
+async def start_renderer():
+    try:
+        await renderer.start()
+    except Exception as e:
+        # e.g. Playwright not installed, or the Windows selector loop cannot spawn Chromium
+        log_event("pdf_renderer_unavailable", error=str(e), fallback="subprocess")
+        await renderer.stop()
+
+async def stop_renderer():
+    await renderer.stop()
 
 async def generate_pdf(context_data: dict) -> str:
     """
-    Generates a PDF report by calling the standalone pdf_generator.py script.
+    Returns the filename of the PDF for this report payload.
+    Identical payloads reuse the cached file; concurrent identical requests share one render.
+    """
+    key = report_key(context_data)
+    cached = await asyncio.to_thread(report_cache.lookup, key)
+    if cached:
+        return cached
+
+    inflight = report_cache._inflight.get(key)
+    if inflight is not None:
+        return await asyncio.shield(inflight)
+
+    future = asyncio.get_running_loop().create_future()
+    report_cache._inflight[key] = future
+    try:
+        filename = report_cache.filename_for(key)
+        await _render_pdf(context_data, filename)
+        future.set_result(filename)
+    except Exception as e:
+        future.set_exception(e)
+        future.exception() # mark retrieved when nobody else is waiting
+        raise
+    except BaseException:
+        future.cancel()
+        raise
+    finally:
+        del report_cache._inflight[key]
+
+    await asyncio.to_thread(report_cache.maybe_evict)
+    return filename
+
+async def _render_pdf(context_data: dict, filename: str):
+    """
+    Renders through the warm renderer pool, or the standalone pdf_generator.py script when the pool is not running.
+    Writes to a temporary file first and hands it to the report store once complete, so readers never see a partial file.
+    """
+    tmp_filename = f"{filename}.{os.getpid()}.tmp"
+    tmp_path = os.path.join(REPORT_DIR, tmp_filename)
+
+    try:
+        if renderer.running:
+            html_content = render_html(context_data)
+            await renderer.render(html_content, tmp_path)
+        else:
+            await asyncio.to_thread(_generate_pdf_subprocess, context_data, tmp_filename)
+        await asyncio.to_thread(report_cache.store.put, filename, tmp_path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+async def generate_pdfs(reports: List[dict]) -> List[Optional[str]]:
+    """
+    generate_pdf for several report payloads (batch uploads), in the same order.
+    Everything not already cached is rendered in one browser session: the warm pool, or a single
+    pdf_generator.py run when the pool is not running. A report that fails to render comes back as None.
+    """
+    if renderer.running:
+        # Feed the pool no faster than it has pages, so a large batch never overflows its queue
+        slots = asyncio.Semaphore(renderer.size)
+
+        async def render(report):
+            try:
+                async with slots:
+                    return await generate_pdf(report)
+            except Exception as e:
+                log_event("pdf_failed", error=str(e))
+                return None
+        return list(await asyncio.gather(*(render(r) for r in reports)))
+
+    keys = [report_key(r) for r in reports]
+    cached = await asyncio.gather(*(asyncio.to_thread(report_cache.lookup, key) for key in keys))
+    missing = {key: report for key, report, filename in zip(keys, reports, cached) if filename is None}
+    if missing:
+        batch = [(report, f"{report_cache.filename_for(key)}.{os.getpid()}.tmp") for key, report in missing.items()]
+        try:
+            await asyncio.to_thread(_generate_pdf_subprocess, [{"data": r, "filename": f} for r, f in batch])
+        except Exception as e:
+            log_event("pdf_batch_failed", reports=len(batch), error=str(e))
+        # Keep whatever the run managed to write before it stopped
+        for key, (_, tmp_filename) in zip(missing, batch):
+            tmp_path = os.path.join(REPORT_DIR, tmp_filename)
+            if os.path.exists(tmp_path):
+                await asyncio.to_thread(report_cache.store.put, report_cache.filename_for(key), tmp_path)
+        await asyncio.to_thread(report_cache.maybe_evict)
+
+    rendered = set()
+    for key in missing:
+        if await asyncio.to_thread(report_cache.exists, report_cache.filename_for(key)):
+            rendered.add(key)
+    return [filename or (report_cache.filename_for(key) if key in rendered else None) for key, filename in zip(keys, cached)]
+
+def _generate_pdf_subprocess(context_data, filename: Optional[str] = None) -> str:
+    """
+    Calls the standalone pdf_generator.py script.
     Avoids asyncio event loop conflicts in Uvicorn on Windows.
+    context_data may also be a list of {"data", "filename"} items, rendered in one browser launch.
     """
-    
+
     # Write data to temp file
     # Using delete=False because windows can't open file twice if open
     # We will delete manually
     tf = tempfile.NamedTemporaryFile(mode='w', encoding='utf-8', delete=False, suffix='.json')
     json.dump(context_data, tf)
     tf.close()
-    
+
     generator_script = os.path.join(os.path.dirname(__file__), 'pdf_generator.py')
-    
+
     try:
         # Call the script
         # Using sys.executable to ensure we use the same environment (venv)
+        args = [sys.executable, generator_script, tf.name] + ([filename] if filename else [])
         result = subprocess.run(
-            [sys.executable, generator_script, tf.name],
+            args,
             capture_output=True,
             text=True,
             check=True
         )
-        filename = result.stdout.strip()
-        return filename
+        # The file name is the last line; log events (e.g. report_fonts_missing) may precede it
+        lines = result.stdout.strip().splitlines()
+        return lines[-1] if lines else ""
     except subprocess.CalledProcessError as e:
-        print(f"PDF Generation failed: {e.stderr}")
+        log_event("pdf_failed", error=e.stderr)
         raise e
     finally:
         if os.path.exists(tf.name):
@@ -3,58 +3,96 @@ import sys
 import json
 import datetime
 import asyncio
+import hashlib
 from jinja2 import Environment, FileSystemLoader
-from playwright.async_api import async_playwright
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__)))) # standalone runs import utils.*
+from utils.fonts import load_font_css
 
 # Setup Paths
-BASE_DIR = os.path.dirname(os.path.dirname(__file__)) # server/
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__))) # server/
 TEMPLATE_DIR = os.path.join(BASE_DIR, 'templates')
 REPORT_DIR = os.path.join(BASE_DIR, 'reports')
 
 os.makedirs(REPORT_DIR, exist_ok=True)
 
-# Setup Jinja2
-env = Environment(loader=FileSystemLoader(TEMPLATE_DIR))
+# Setup Jinja2: the template is compiled once per process (TEMPLATE_VERSION below is fixed at import anyway)
+env = Environment(loader=FileSystemLoader(TEMPLATE_DIR), auto_reload=False)
+TEMPLATE = env.get_template('report.html')
+
+# Local @font-face rules with the font files inlined (see utils/fonts.py); '' means system fonts
+FONT_CSS = load_font_css()
+
+# Changes whenever report.html or the fonts change, so cached PDFs from an older layout are not reused
+with open(os.path.join(TEMPLATE_DIR, 'report.html'), 'rb') as f:
+    TEMPLATE_VERSION = hashlib.sha256(f.read() + FONT_CSS.encode('utf-8')).hexdigest()[:12]
+
+# Shared by the standalone script and the in-process renderer pool
+PDF_OPTIONS = {
+    "format": "A4",
+    "print_background": True,
+    "margin": {"top": "40px", "right": "40px", "bottom": "40px", "left": "40px"},
+}
+
+def render_html(context_data: dict) -> str:
+    """Renders the report template with the given analysis data."""
+    context = dict(context_data)
+    if 'timestamp' not in context:
+        context['timestamp'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
+    context['font_css'] = FONT_CSS
+
+    return TEMPLATE.render(**context)
+
+async def isolate(context):
+    """Fails every network request from the browser context: the report is self-contained, so nothing can stall a render."""
+    await context.route("**/*", lambda route: route.abort())
+
+async def print_page(page, html: str, output_path: str):
+    """
+    Loads the report and prints it. Nothing is fetched, so instead of waiting for the network the render waits
+    on the DOM plus document.fonts.ready, which resolves once the inlined fonts are decoded.
+    """
+    await page.set_content(html, wait_until="domcontentloaded")
+    await page.evaluate("document.fonts.ready.then(() => document.fonts.size)")
+    await page.pdf(path=output_path, **PDF_OPTIONS)
+
+def new_report_filename() -> str:
+    timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
+    return f"report_{timestamp_str}.pdf"
 
 async def main():
+    from playwright.async_api import async_playwright
+
     # Read input file path from args
     if len(sys.argv) < 2:
         print("Error: No input file provided", file=sys.stderr)
         sys.exit(1)
-        
+
     input_path = sys.argv[1]
     with open(input_path, 'r', encoding='utf-8') as f:
-        context_data = json.load(f)
-
-    # 1. Render HTML
-    template = env.get_template('report.html')
-    
-    if 'timestamp' not in context_data:
-        context_data['timestamp'] = datetime.datetime.now().strftime("%Y-%m-%d %H:%M")
-        
-    html_content = template.render(**context_data)
-    
-    # 2. Generate PDF
-    timestamp_str = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    filename = f"report_{timestamp_str}.pdf"
-    output_path = os.path.join(REPORT_DIR, filename)
-    
+        payload = json.load(f)
+
+    # A list renders several reports in one browser session: [{"data": {...}, "filename": "..."}, ...]
+    if isinstance(payload, list):
+        reports = [(item["data"], item["filename"]) for item in payload]
+    else:
+        # Caller may pick the output filename
+        reports = [(payload, sys.argv[2] if len(sys.argv) > 2 else new_report_filename())]
+
     async with async_playwright() as p:
-        browser = await p.chromium.launch() 
+        browser = await p.chromium.launch()
         context = await browser.new_context()
+        await isolate(context)
         page = await context.new_page()
-        
-        await page.set_content(html_content)
-        await page.pdf(
-            path=output_path,
-            format="A4",
-            print_background=True,
-            margin={"top": "40px", "right": "40px", "bottom": "40px", "left": "40px"}
-        )
+
+        for context_data, filename in reports:
+            # 1. Render HTML, 2. Generate PDF
+            await print_page(page, render_html(context_data), os.path.join(REPORT_DIR, filename))
         await browser.close()
-    
-    # Print filename to stdout for caller to capture
-    print(filename)
+
+    # Print filenames to stdout for caller to capture
+    for _, filename in reports:
+        print(filename)
 
 if __name__ == "__main__":
     if sys.platform == "win32":
@@ -0,0 +1,139 @@
+import os
+import sqlite3
+import threading
+from abc import ABC, abstractmethod
+from datetime import datetime
+from typing import Dict, Tuple
+
+RATE_LIMIT_BACKEND = os.getenv("RATE_LIMIT_BACKEND", "sqlite") # sqlite | memory
+RATE_LIMIT_DB = os.getenv("RATE_LIMIT_DB", "data/usage.db")
+
+DEMO_LIMIT = 2 # per IP, lifetime
+UPLOAD_DAILY_LIMIT = 1 # per IP, per calendar day
+
+def _today() -> str:
+    return datetime.now().strftime("%Y-%m-%d")
+
+def _window(is_demo: bool) -> Tuple[str, str, int]:
+    """(kind, day, limit) for a request. Demo usage is counted over the IP's lifetime, uploads per day."""
+    if is_demo:
+        return "demo", "", DEMO_LIMIT
+    return "upload", _today(), UPLOAD_DAILY_LIMIT
+
+class RateLimiter(ABC):
+    """
+    Per-IP usage counters.
+    try_acquire atomically checks the limit and counts the request; release gives the slot back
+    when the request fails, so only successful analyses use up the quota.
+    """
+
+    @abstractmethod
+    def try_acquire(self, ip: str, is_demo: bool = False) -> bool:
+        ...
+
+    @abstractmethod
+    def release(self, ip: str, is_demo: bool = False):
+        ...
+
+    @abstractmethod
+    def usage(self, ip: str, is_demo: bool = False) -> int:
+        ...
+
+class MemoryRateLimiter(RateLimiter):
+    """Process-local counters. Daily upload counts are dropped as soon as the day rolls over."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Dict[Tuple[str, str], Dict[str, int]] = {}
+
+    def _bucket(self, kind: str, day: str) -> Dict[str, int]:
+        key = (kind, day)
+        bucket = self._counts.get(key)
+        if bucket is None:
+            # A new day has started: earlier upload windows can no longer be hit
+            if kind == "upload":
+                for old_key in [k for k in self._counts if k[0] == "upload"]:
+                    del self._counts[old_key]
+            bucket = self._counts[key] = {}
+        return bucket
+
+    def try_acquire(self, ip: str, is_demo: bool = False) -> bool:
+        kind, day, limit = _window(is_demo)
+        with self._lock:
+            bucket = self._bucket(kind, day)
+            count = bucket.get(ip, 0)
+            if count >= limit:
+                return False
+            bucket[ip] = count + 1
+            return True
+
+    def release(self, ip: str, is_demo: bool = False):
+        kind, day, _ = _window(is_demo)
+        with self._lock:
+            bucket = self._bucket(kind, day)
+            if bucket.get(ip, 0) > 0:
+                bucket[ip] -= 1
+
+    def usage(self, ip: str, is_demo: bool = False) -> int:
+        kind, day, _ = _window(is_demo)
+        with self._lock:
+            return self._bucket(kind, day).get(ip, 0)
+
+class SQLiteRateLimiter(RateLimiter):
+    """
+    Counters in a SQLite database (WAL mode), shared by every worker process on the host.
+    Each check-and-increment is a single UPSERT statement; past upload days are purged once per day.
+    """
+
+    def __init__(self, path: str = RATE_LIMIT_DB):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=10, isolation_level=None, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("PRAGMA synchronous=NORMAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS usage ("
+            " ip TEXT NOT NULL, kind TEXT NOT NULL, day TEXT NOT NULL, count INTEGER NOT NULL,"
+            " PRIMARY KEY (ip, kind, day))"
+        )
+        self._purged_day = None
+
+    def _purge(self, today: str):
+        if self._purged_day == today:
+            return
+        self._conn.execute("DELETE FROM usage WHERE kind = 'upload' AND day < ?", (today,))
+        self._purged_day = today
+
+    def try_acquire(self, ip: str, is_demo: bool = False) -> bool:
+        kind, day, limit = _window(is_demo)
+        with self._lock:
+            self._purge(_today())
+            cursor = self._conn.execute(
+                "INSERT INTO usage (ip, kind, day, count) VALUES (?, ?, ?, 1)"
+                " ON CONFLICT (ip, kind, day) DO UPDATE SET count = count + 1 WHERE count < ?",
+                (ip, kind, day, limit),
+            )
+            return cursor.rowcount > 0
+
+    def release(self, ip: str, is_demo: bool = False):
+        kind, day, _ = _window(is_demo)
+        with self._lock:
+            self._conn.execute(
+                "UPDATE usage SET count = count - 1 WHERE ip = ? AND kind = ? AND day = ? AND count > 0",
+                (ip, kind, day),
+            )
+
+    def usage(self, ip: str, is_demo: bool = False) -> int:
+        kind, day, _ = _window(is_demo)
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT count FROM usage WHERE ip = ? AND kind = ? AND day = ?", (ip, kind, day)
+            ).fetchone()
+        return row[0] if row else 0
+
+def create_rate_limiter(backend: str = RATE_LIMIT_BACKEND) -> RateLimiter:
+    if backend == "memory":
+        return MemoryRateLimiter()
+    return SQLiteRateLimiter()
@@ -0,0 +1,178 @@
+import os
+import re
+import json
+from functools import lru_cache
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+# Optional JSON file of extra schemas / synonyms, loaded once at import (see register_config)
+SCHEMA_CONFIG = os.getenv("SCHEMA_CONFIG", "")
+
+# Standard keys each analysis understands
+ANALYSIS_FIELDS = {
+    "transactions": ("date", "amount", "type", "category"),
+    "pnl": ("month", "revenue", "expenses"),
+}
+
+class Schema:
+    """
+    A header layout: synonyms per standard key, and how headers are compared with them.
+    match="exact": the trimmed, lower-cased header equals a synonym. match="contains": the header contains one.
+    A schema is detected when every key in `required` is found in some header; `analysis` says which
+    pipeline ('transactions' or 'pnl') reads it.
+    """
+
+    def __init__(self, name: str, analysis: str, fields: Dict[str, List[str]], match: str = "exact", required: Iterable[str] = ()):
+        if analysis not in ANALYSIS_FIELDS:
+            raise ValueError(f"schema {name}: unknown analysis '{analysis}'")
+        unknown = set(fields) - set(ANALYSIS_FIELDS[analysis])
+        if unknown:
+            raise ValueError(f"schema {name}: unknown fields {sorted(unknown)} for {analysis}")
+        if match not in ("exact", "contains"):
+            raise ValueError(f"schema {name}: match must be 'exact' or 'contains'")
+        self.name = name
+        self.analysis = analysis
+        self.match = match
+        self.fields = {field: [s.lower().strip() for s in synonyms] for field, synonyms in fields.items()}
+        self.required = tuple(required)
+        self.compile()
+
+    def compile(self):
+        if self.match == "exact":
+            self._exact: Dict[str, Tuple[str, ...]] = {}
+            for field, synonyms in self.fields.items():
+                for synonym in synonyms:
+                    self._exact[synonym] = self._exact.get(synonym, ()) + (field,)
+        else:
+            self._patterns = {
+                field: re.compile("|".join(re.escape(s) for s in sorted(synonyms, key=len, reverse=True)))
+                for field, synonyms in self.fields.items() if synonyms
+            }
+
+    def extend(self, fields: Dict[str, List[str]]):
+        for field, synonyms in fields.items():
+            if field not in ANALYSIS_FIELDS[self.analysis]:
+                raise ValueError(f"schema {self.name}: unknown field '{field}'")
+            known = self.fields.setdefault(field, [])
+            known.extend(s.lower().strip() for s in synonyms if s.lower().strip() not in known)
+        self.compile()
+
+    def fields_of(self, header: str) -> Tuple[str, ...]:
+        """Standard keys a normalized header stands for, in field order."""
+        if self.match == "exact":
+            return self._exact.get(header, ())
+        return tuple(field for field, pattern in self._patterns.items() if pattern.search(header))
+
+class SchemaMatch(NamedTuple):
+    name: str # registry schema that matched
+    analysis: str # transactions | pnl
+    columns: Dict[str, str] # original header -> standard key
+
+class SchemaRegistry:
+    """
+    Every known schema, compiled once. Detection and column mapping happen in a single pass over the headers,
+    and each distinct header is normalized and classified once per process (headers repeat across uploads).
+    Schemas are tried in priority order; the default schema is used when none is detected.
+    """
+
+    def __init__(self, default: Schema):
+        self.default = default
+        self._schemas: List[Schema] = []
+
+    def register(self, schema: Schema, first: bool = False):
+        """Adds a schema, or extends the synonyms of the registered schema with the same name."""
+        existing = self.get(schema.name)
+        if existing is not None:
+            existing.extend(schema.fields)
+        elif first:
+            self._schemas.insert(0, schema)
+        else:
+            self._schemas.append(schema)
+        self._classify.cache_clear()
+
+    def get(self, name: str) -> Optional[Schema]:
+        for schema in self._schemas + [self.default]:
+            if schema.name == name:
+                return schema
+        return None
+
+    def register_config(self, path: str):
+        """
+        Loads extra schemas from a JSON list of
+        {"name", "analysis", "fields": {key: [synonyms]}, "match", "required"}.
+        An entry named like an existing schema only adds synonyms to it; new schemas take priority over the built-in ones.
+        """
+        with open(path, encoding="utf-8") as f:
+            entries = json.load(f)
+        for entry in reversed(entries):
+            existing = self.get(entry["name"])
+            if existing is not None:
+                existing.extend(entry["fields"])
+                continue
+            self.register(Schema(
+                entry["name"],
+                entry["analysis"],
+                entry["fields"],
+                match=entry.get("match", "exact"),
+                required=entry.get("required", ()),
+            ), first=True)
+        self._classify.cache_clear()
+
+    @lru_cache(maxsize=4096)
+    def _classify(self, header) -> Tuple[Tuple[str, ...], ...]:
+        normalized = str(header).lower().strip()
+        return tuple(schema.fields_of(normalized) for schema in self._schemas + [self.default])
+
+    def match(self, columns) -> SchemaMatch:
+        """Detects the schema of a header row and maps its columns, in one pass over the headers."""
+        schemas = self._schemas + [self.default]
+        found = [set() for _ in schemas]
+        mappings: List[Dict[str, str]] = [{} for _ in schemas]
+        for column in columns:
+            for i, fields in enumerate(self._classify(column)):
+                if not fields:
+                    continue
+                found[i].update(fields)
+                # A header maps to the first of its keys that no earlier header took
+                assigned = mappings[i].values()
+                for field in fields:
+                    if field not in assigned:
+                        mappings[i][column] = field
+                        break
+
+        for i, schema in enumerate(schemas[:-1]):
+            if schema.required and set(schema.required) <= found[i]:
+                return SchemaMatch(schema.name, schema.analysis, mappings[i])
+        return SchemaMatch(self.default.name, self.default.analysis, mappings[-1])
+
+TRANSACTIONS = Schema(
+    "transactions",
+    "transactions",
+    {
+        'date': ['date', 'datetime', 'timestamp', 'التاريخ', 'الوقت', 'day'],
+        'amount': ['amount', 'value', 'cost', 'price', 'المبلغ', 'القيمة', 'السعر', 'total'],
+        'type': ['type', 'kind', 'direction', 'النوع', 'الحالة', 'category_type'],
+        'category': ['category', 'cat', 'description', 'desc', 'الفئة', 'التصنيف', 'البند'],
+    },
+    match="exact",
+    required=('date', 'amount'),
+)
+
+PNL = Schema(
+    "pnl",
+    "pnl",
+    {
+        'month': ['month', 'period', 'الشهر', 'شهر', 'الفترة'],
+        'revenue': ['revenue', 'sales', 'income', 'الإيرادات', 'المبيعات', 'الدخل', 'rev'],
+        'expenses': ['expenses', 'opex', 'costs', 'cost', 'المصروفات', 'التكاليف', 'المصاريف', 'exp'],
+    },
+    match="contains",
+    required=('month', 'revenue', 'expenses'),
+)
+
+registry = SchemaRegistry(default=TRANSACTIONS)
+registry.register(PNL)
+if SCHEMA_CONFIG:
+    registry.register_config(SCHEMA_CONFIG)
+
+def match_columns(columns) -> SchemaMatch:
+    return registry.match(columns)
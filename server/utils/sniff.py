@@ -0,0 +1,142 @@
+"""
+CSV dialect sniffing from the first SNIFF_BYTES of an upload: encoding, delimiter, decimal and thousands separators,
+and the row the header is on (ERP exports often put a title line or two above it).
+The result is handed to the C parser (and the Arrow reader), so clean numeric columns arrive as floats.
+"""
+import codecs
+import csv
+import os
+import re
+from typing import Any, Callable, Dict, List, NamedTuple, Optional
+
+# Bytes read, and rows used from them, to sniff the dialect
+SNIFF_BYTES = 16 * 1024
+SNIFF_ROWS = 100
+# Lines searched for the header row
+MAX_HEADER_ROWS = 20
+DELIMITERS = (",", ";", "\t", "|")
+# Files that are not UTF-8 are read in this code page (Windows Arabic by default)
+CSV_FALLBACK_ENCODING = os.getenv("CSV_FALLBACK_ENCODING", "cp1256")
+
+# A number once currency text is stripped: digits with '.' / ',' separators
+NUMBER = re.compile(r"[-+]?\d[\d.,]*")
+NOT_NUMERIC = re.compile(r"[^\d.,+\-]")
+
+class CsvDialect(NamedTuple):
+    encoding: str = "utf-8-sig"
+    sep: str = ","
+    decimal: str = "."
+    thousands: Optional[str] = ","
+    skiprows: int = 0 # lines above the header row
+
+    def read_options(self) -> Dict[str, Any]:
+        """
+        Keyword arguments for pd.read_csv. decimal/thousands apply to every column the C parser converts,
+        so callers read all but the amount columns as str (12.03.2024 must stay a date).
+        """
+        options: Dict[str, Any] = dict(encoding=self.encoding, sep=self.sep, skiprows=self.skiprows, engine="c")
+        # A comma decimal in a comma-separated file only appears quoted; clean_currency converts those cells
+        if self.decimal != self.sep:
+            options.update(decimal=self.decimal, thousands=self.thousands)
+        return options
+
+DEFAULT_DIALECT = CsvDialect()
+
+def detect_encoding(sample: bytes, complete: bool) -> str:
+    """UTF-8 (with or without BOM), UTF-16 by BOM, else CSV_FALLBACK_ENCODING."""
+    if sample.startswith((codecs.BOM_UTF16_LE, codecs.BOM_UTF16_BE)):
+        return "utf-16"
+    try:
+        sample.decode("utf-8")
+    except UnicodeDecodeError as e:
+        # The sample may end inside a multi-byte character
+        if complete or e.start < len(sample) - 3:
+            return CSV_FALLBACK_ENCODING
+    return "utf-8-sig"
+
+def detect_delimiter(lines: List[str]) -> str:
+    """The delimiter splitting most rows into the same number (at least two) of fields."""
+    best, best_score = DEFAULT_DIALECT.sep, (0.0, 0)
+    for delimiter in DELIMITERS:
+        counts = [len(row) for row in csv.reader(lines, delimiter=delimiter) if row]
+        if not counts:
+            continue
+        modal = max(set(counts), key=counts.count)
+        if modal < 2:
+            continue
+        score = (counts.count(modal) / len(counts), modal)
+        if score > best_score:
+            best, best_score = delimiter, score
+    return best
+
+def detect_decimal(rows: List[List[str]], columns: List[int]) -> str:
+    """
+    Votes over the numeric-looking cells of the given (amount) columns: with both separators the last one is the decimal,
+    a repeated one groups thousands, and a single one followed by other than three digits is the decimal.
+    1,234 and 1.234 alone are ambiguous and skipped.
+    """
+    votes = {".": 0, ",": 0}
+    for row in rows:
+        for i in columns:
+            if i >= len(row):
+                continue
+            cell = NOT_NUMERIC.sub("", row[i])
+            if not NUMBER.fullmatch(cell):
+                continue
+            dot, comma = cell.rfind("."), cell.rfind(",")
+            if dot >= 0 and comma >= 0:
+                votes["." if dot > comma else ","] += 1
+                continue
+            if dot < 0 and comma < 0:
+                continue
+            separator = "." if dot >= 0 else ","
+            parts = cell.split(separator)
+            if len(parts) > 2:
+                # 1.234.567 groups thousands; 12.03.2024 is a date, not a vote
+                if all(len(p) == 3 for p in parts[1:]):
+                    votes["," if separator == "." else "."] += 1
+            elif len(parts[1]) != 3:
+                votes[separator] += 1
+    return "," if votes[","] > votes["."] else "."
+
+def sniff_csv(path: str, amount_columns: Callable[[List[str]], Optional[List[int]]]) -> CsvDialect:
+    """
+    Sniffs the dialect from the start of the file. amount_columns recognizes the header row among the first
+    MAX_HEADER_ROWS rows, returning the positions of its amount columns (None for any other row);
+    only those columns decide the decimal separator. When no row qualifies the header is the first row and
+    the decimal stays '.'.
+    """
+    with open(path, "rb") as f:
+        sample = f.read(SNIFF_BYTES)
+    complete = len(sample) < SNIFF_BYTES
+    encoding = detect_encoding(sample, complete)
+    text = sample.decode(encoding, errors="ignore")
+    lines = text.splitlines()
+    if not complete and len(lines) > 1:
+        lines = lines[:-1] # cut mid-row
+    lines = lines[:SNIFF_ROWS]
+    if not lines:
+        return DEFAULT_DIALECT._replace(encoding=encoding)
+
+    sep = detect_delimiter(lines)
+    reader = csv.reader(lines, delimiter=sep)
+    rows: List[List[str]] = []
+    header_row: Optional[int] = None
+    amounts: List[int] = []
+    skiprows = line = 0
+    for row in reader:
+        if header_row is None and row and len(rows) < MAX_HEADER_ROWS:
+            found = amount_columns(row)
+            if found is not None:
+                header_row, skiprows, amounts = len(rows), line, found
+        rows.append(row)
+        line = reader.line_num # first line of the next row
+
+    decimal = detect_decimal(rows[header_row + 1:], amounts) if header_row is not None else "."
+    return CsvDialect(
+        encoding=encoding,
+        sep=sep,
+        decimal=decimal,
+        thousands="." if decimal == "," else ",",
+        skiprows=skiprows,
+    )
@@ -0,0 +1,222 @@
+import os
+import re
+import shutil
+from abc import ABC, abstractmethod
+from typing import Iterator, List, NamedTuple, Optional, Tuple
+
+REPORT_STORE = os.getenv("REPORT_STORE", "local") # local | s3
+REPORT_S3_BUCKET = os.getenv("REPORT_S3_BUCKET", "")
+REPORT_S3_PREFIX = os.getenv("REPORT_S3_PREFIX", "reports/")
+# MinIO or another S3-compatible service; empty means AWS
+REPORT_S3_ENDPOINT_URL = os.getenv("REPORT_S3_ENDPOINT_URL") or None
+
+# Bytes per read when streaming a report in or out
+STORE_CHUNK_SIZE = 1024 * 1024
+
+class StoredObject(NamedTuple):
+    name: str
+    size: int
+    etag: str # opaque; changes whenever the bytes are replaced
+    last_used: float # epoch seconds, drives retention
+
+class ReportStore(ABC):
+    """
+    Where finished PDFs live. Every replica behind the load balancer must see the same store,
+    so reports are written and read only through this interface (never as paths under reports/).
+    """
+
+    @abstractmethod
+    def stat(self, name: str) -> Optional[StoredObject]:
+        ...
+
+    @abstractmethod
+    def touch(self, name: str) -> bool:
+        """Marks a report as recently used. Returns False when it does not exist."""
+
+    @abstractmethod
+    def put(self, name: str, source_path: str):
+        """Stores a finished local file under `name`; the local file is consumed."""
+
+    @abstractmethod
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        """Streams bytes start..end (inclusive) in STORE_CHUNK_SIZE chunks."""
+
+    @abstractmethod
+    def delete(self, name: str):
+        ...
+
+    @abstractmethod
+    def list(self) -> List[StoredObject]:
+        ...
+
+class LocalReportStore(ReportStore):
+    """Reports as files in one directory. Shared across replicas only if the directory is (e.g. NFS)."""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        try:
+            st = os.stat(self._path(name))
+        except OSError:
+            return None
+        # inode + size: stable while the file stays put (touch() only moves mtime), new when it is replaced
+        return StoredObject(name, st.st_size, f"{st.st_ino:x}-{st.st_size:x}", st.st_mtime)
+
+    def touch(self, name: str) -> bool:
+        try:
+            os.utime(self._path(name))
+            return True
+        except OSError:
+            return False
+
+    def put(self, name: str, source_path: str):
+        try:
+            os.replace(source_path, self._path(name))
+        except OSError:
+            # Different filesystem: copy next to the target, then swap it in atomically
+            tmp_path = f"{self._path(name)}.{os.getpid()}.part"
+            shutil.copyfile(source_path, tmp_path)
+            os.replace(tmp_path, self._path(name))
+            os.remove(source_path)
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        with open(self._path(name), 'rb') as f:
+            f.seek(start)
+            remaining = None if end is None else end - start + 1
+            while remaining is None or remaining > 0:
+                chunk = f.read(STORE_CHUNK_SIZE if remaining is None else min(STORE_CHUNK_SIZE, remaining))
+                if not chunk:
+                    break
+                if remaining is not None:
+                    remaining -= len(chunk)
+                yield chunk
+
+    def delete(self, name: str):
+        try:
+            os.remove(self._path(name))
+        except OSError:
+            pass
+
+    def list(self) -> List[StoredObject]:
+        objects = []
+        for name in os.listdir(self.directory):
+            if name.startswith("report_") and name.endswith(".pdf"):
+                info = self.stat(name)
+                if info is not None:
+                    objects.append(info)
+        return objects
+
+class S3ReportStore(ReportStore):
+    """
+    Reports as objects under a prefix of an S3 (or S3-compatible) bucket, shared by every replica.
+    Needs boto3; credentials come from the usual AWS environment variables / instance role.
+    S3 cannot update an object's timestamp in place, so touch() only checks existence and
+    retention counts from the upload time (a bucket lifecycle rule can do the same job).
+    """
+
+    def __init__(self, bucket: str = REPORT_S3_BUCKET, prefix: str = REPORT_S3_PREFIX, endpoint_url: Optional[str] = REPORT_S3_ENDPOINT_URL, client=None):
+        if not bucket:
+            raise ValueError("REPORT_S3_BUCKET is required for REPORT_STORE=s3")
+        if client is None:
+            import boto3
+
+            client = boto3.client("s3", endpoint_url=endpoint_url)
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix
+
+    def _key(self, name: str) -> str:
+        return f"{self.prefix}{name}"
+
+    def _missing(self, error: Exception) -> bool:
+        code = str(getattr(error, "response", {}).get("Error", {}).get("Code", ""))
+        return code in ("404", "NoSuchKey", "NotFound")
+
+    def stat(self, name: str) -> Optional[StoredObject]:
+        try:
+            head = self.client.head_object(Bucket=self.bucket, Key=self._key(name))
+        except Exception as e:
+            if self._missing(e):
+                return None
+            raise
+        return StoredObject(name, head["ContentLength"], head["ETag"].strip('"'), head["LastModified"].timestamp())
+
+    def touch(self, name: str) -> bool:
+        return self.stat(name) is not None
+
+    def put(self, name: str, source_path: str):
+        # upload_file streams the file, switching to a multipart upload for large ones
+        self.client.upload_file(source_path, self.bucket, self._key(name), ExtraArgs={"ContentType": "application/pdf"})
+        os.remove(source_path)
+
+    def read(self, name: str, start: int = 0, end: Optional[int] = None) -> Iterator[bytes]:
+        byte_range = f"bytes={start}-{'' if end is None else end}"
+        body = self.client.get_object(Bucket=self.bucket, Key=self._key(name), Range=byte_range)["Body"]
+        try:
+            yield from body.iter_chunks(STORE_CHUNK_SIZE)
+        finally:
+            body.close()
+
+    def delete(self, name: str):
+        self.client.delete_object(Bucket=self.bucket, Key=self._key(name))
+
+    def list(self) -> List[StoredObject]:
+        objects = []
+        paginator = self.client.get_paginator("list_objects_v2")
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix):
+            for item in page.get("Contents", []):
+                name = item["Key"][len(self.prefix):]
+                if name.startswith("report_") and name.endswith(".pdf"):
+                    objects.append(StoredObject(name, item["Size"], item["ETag"].strip('"'), item["LastModified"].timestamp()))
+        return objects
+
+def create_report_store(directory: str, backend: str = REPORT_STORE) -> ReportStore:
+    if backend == "s3":
+        return S3ReportStore()
+    return LocalReportStore(directory)
+
+RANGE_PATTERN = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+def parse_range(header: Optional[str], size: int) -> Optional[Tuple[int, int]]:
+    """
+    (start, end) inclusive for a single-range "Range: bytes=..." header, None to send the whole file.
+    Multi-range and malformed headers (including a last byte before the first, e.g. bytes=5-3) are ignored,
+    as RFC 9110 requires. Raises ValueError when unsatisfiable.
+    """
+    if not header:
+        return None
+    match = RANGE_PATTERN.match(header.strip())
+    if not match or match.group(1) == match.group(2) == "":
+        return None
+    first, last = match.groups()
+    if first == "":
+        # Suffix range: the last N bytes
+        length = int(last)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        return max(0, size - length), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise ValueError("range not satisfiable")
+    return start, min(int(last), size - 1) if last else size - 1
+
+def etag_matches(header: Optional[str], etag: str, weak: bool = True) -> bool:
+    """
+    Compares a header's entity tags against a quoted etag: weakly for If-None-Match,
+    strongly (weak=False, as If-Range requires) where a W/ tag never matches.
+    """
+    if not header:
+        return False
+    if header.strip() == "*":
+        return weak
+    candidates = [c.strip() for c in header.split(",")]
+    if weak:
+        candidates = [c.removeprefix("W/") for c in candidates]
+    return etag in candidates
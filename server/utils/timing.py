@@ -0,0 +1,35 @@
+import json
+import time
+import uuid
+import contextvars
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+# Set per HTTP request by the middleware in main.py; copied into tasks spawned while handling it
+request_id_var: contextvars.ContextVar[Optional[str]] = contextvars.ContextVar("request_id", default=None)
+
+def new_request_id(incoming: Optional[str] = None) -> str:
+    """Reuses a sane X-Request-ID from the client or proxy, otherwise makes a new one."""
+    if incoming and len(incoming) <= 64 and incoming.isprintable():
+        return incoming
+    return uuid.uuid4().hex
+
+@contextmanager
+def stage(timings: Dict[str, float], name: str):
+    """Records the wall time of the enclosed block, in milliseconds, under timings[name]."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timings[name] = (time.perf_counter() - start) * 1000
+
+def log_event(event: str, **fields):
+    """Prints one JSON log line tagged with the current request id."""
+    record = {
+        "ts": datetime.now(timezone.utc).isoformat(timespec="milliseconds"),
+        "event": event,
+        "request_id": request_id_var.get(),
+        **fields,
+    }
+    print(json.dumps(record, ensure_ascii=False, default=str), flush=True)
@@ -0,0 +1,102 @@
+import os
+import asyncio
+import multiprocessing
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from utils.timing import log_event, request_id_var
+
+ANALYSIS_EXECUTOR = os.getenv("ANALYSIS_EXECUTOR", "process") # process | thread
+ANALYSIS_WORKERS = int(os.getenv("ANALYSIS_WORKERS", "2"))
+ANALYSIS_QUEUE_LIMIT = int(os.getenv("ANALYSIS_QUEUE_LIMIT", "8"))
+
+class PoolSaturated(Exception):
+    """Raised when every worker is busy and the wait queue is full."""
+
+class PoolBroken(PoolSaturated):
+    """Raised when a job breaks a freshly rebuilt pool too; callers answer 503 as for a full pool."""
+
+def _in_request(request_id: Optional[str], fn: Callable, *args) -> Any:
+    """Worker side of run(): contextvars do not cross into executor threads or processes, so the request id is set here."""
+    token = request_id_var.set(request_id)
+    try:
+        return fn(*args)
+    finally:
+        request_id_var.reset(token)
+
+class AnalysisPool:
+    """
+    Runs CPU-bound parsing and KPI work off the event loop.
+    At most `workers` jobs run at once and `queue_limit` more may wait; beyond that, run() raises PoolSaturated.
+    A worker process that dies (e.g. OOM-killed) breaks the whole ProcessPoolExecutor: run() then replaces it
+    and retries the job once, raising PoolBroken if the new pool breaks as well.
+    """
+
+    def __init__(self, kind: str = ANALYSIS_EXECUTOR, workers: int = ANALYSIS_WORKERS, queue_limit: int = ANALYSIS_QUEUE_LIMIT):
+        self.kind = kind
+        self.workers = max(1, workers)
+        self.queue_limit = queue_limit
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self.rejected = 0
+        self.restarts = 0
+
+    def start(self):
+        if self._executor is not None:
+            return
+        if self.kind == "thread":
+            self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="analysis")
+        else:
+            # spawn: forking a process that already runs the event loop and Chromium threads is unsafe
+            self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=multiprocessing.get_context("spawn"))
+            # Spawn the workers now so the first upload does not pay for interpreter + pandas start-up
+            for _ in range(self.workers):
+                self._executor.submit(int)
+        log_event("analysis_pool_started", workers=self.workers, kind=self.kind, queue_limit=self.queue_limit)
+
+    def shutdown(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    async def run(self, fn: Callable, *args) -> Any:
+        if self._pending >= self.workers + self.queue_limit:
+            self.rejected += 1
+            raise PoolSaturated("Analysis pool is saturated")
+
+        self.start()
+        self._pending += 1
+        try:
+            for attempt in range(2):
+                executor = self._executor
+                try:
+                    return await asyncio.get_running_loop().run_in_executor(executor, _in_request, request_id_var.get(), fn, *args)
+                except BrokenProcessPool as e:
+                    self.restart(executor, reason=str(e))
+                    if attempt:
+                        raise PoolBroken("Analysis pool workers keep exiting") from e
+        finally:
+            self._pending -= 1
+
+    def restart(self, broken: Optional[Executor], reason: str = ""):
+        """Replaces a broken executor; jobs that saw the same breakage find it already replaced."""
+        if broken is not self._executor:
+            return
+        self.shutdown()
+        self.restarts += 1
+        log_event("analysis_pool_restart", reason=reason, restarts=self.restarts)
+        self.start()
+
+    def health(self) -> Dict[str, Any]:
+        return {
+            "kind": self.kind,
+            "workers": self.workers,
+            "running": min(self._pending, self.workers),
+            "queued": max(0, self._pending - self.workers),
+            "queue_limit": self.queue_limit,
+            "rejected": self.rejected,
+            "restarts": self.restarts,
+        }
+
+analysis_pool = AnalysisPool()